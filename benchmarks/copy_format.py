@@ -0,0 +1,89 @@
+"""
+Compares the tab-delimited text COPY path with the binary COPY encoder.
+Always times the encoding alone, and if a dsn is given also times COPYing into a temp table.
+
+    python -m benchmarks.copy_format [n_points] [dsn]
+"""
+import sys
+import time
+import random
+from io import StringIO, BytesIO
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+from dbinterfacer.helpers.pointmodel import Point_Model
+from dbinterfacer.helpers.pointbuffer import PointBuffer
+from dbinterfacer.helpers.copystream import render_text
+from dbinterfacer.helpers.pgbinary import BinaryEncoder
+
+# the fields of a cidco processed batch
+FIELDS = [
+    ('time', 'datetime'),
+    ('latitude', 'decimal'),
+    ('longitude', 'decimal'),
+    ('depth', 'decimal'),
+    ('northing', 'decimal'),
+    ('easting', 'decimal'),
+]
+BATCH_ID = 1
+
+
+def make_points(model, n):
+    random.seed(0)
+    start = datetime(2017, 12, 11, 18, 37, 12, 68000)
+    points = PointBuffer(model)
+    for i in range(n):
+        p = model.generate_point()
+        p['time'] = start + timedelta(seconds=i)
+        p['latitude'] = Decimal('047.%09d' % random.randrange(10 ** 9))
+        p['longitude'] = Decimal('-053.%09d' % random.randrange(10 ** 9))
+        p['depth'] = Decimal('-%03d.%03d' % (random.randrange(100), random.randrange(1000)))
+        p['northing'] = Decimal('6072%03d.%03d' % (random.randrange(1000), random.randrange(1000)))
+        p['easting'] = Decimal('3468%03d.%03d' % (random.randrange(1000), random.randrange(1000)))
+        points.append(p)
+    return points
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def main(n, dsn=None):
+    model = Point_Model(FIELDS)
+    fields = list(model.model)
+    points = make_points(model, n)
+    encoder = BinaryEncoder(fields, model.types)
+
+    text_s, text = timed(lambda: render_text(points, BATCH_ID))
+    binary_s, binary = timed(lambda: encoder.encode(points, BATCH_ID, header=True, trailer=True))
+    print('%d points' % n)
+    print('encode text:   %.3fs  %6.1f MB' % (text_s, len(text) / 1e6))
+    print('encode binary: %.3fs  %6.1f MB' % (binary_s, len(binary) / 1e6))
+
+    if dsn is None:
+        return
+
+    import psycopg2
+    conn = psycopg2.connect(dsn=dsn)
+    cur = conn.cursor()
+    cur.execute('CREATE TEMP TABLE copy_bench (time timestamp, latitude numeric, longitude numeric, '
+                'depth numeric, northing numeric, easting numeric, batch_id integer)')
+    header = fields + ['batch_id']
+
+    copy_text_s, _ = timed(lambda: cur.copy_from(StringIO(text), 'copy_bench', columns=header))
+    copy_binary_s, _ = timed(lambda: cur.copy_expert('COPY copy_bench FROM STDIN WITH (FORMAT binary)', BytesIO(binary)))
+    print('copy text:     %.3fs' % copy_text_s)
+    print('copy binary:   %.3fs' % copy_binary_s)
+    print('total text:    %.3fs' % (text_s + copy_text_s))
+    print('total binary:  %.3fs' % (binary_s + copy_binary_s))
+
+    conn.rollback()
+    conn.close()
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    dsn = sys.argv[2] if len(sys.argv) > 2 else None
+    main(n, dsn)
@@ -0,0 +1,142 @@
+"""
+Synthetic surveys for the benchmarks: a vessel running survey lines off Newfoundland, written as
+the NMEA logs, CIDCO exports and GeoJSON feature collections the uploaders read.
+The same number of points and seed always give the same file.
+
+    python -m benchmarks.generators nmea|cidco|geojson n_points path [seed]
+"""
+import sys
+import math
+import json
+import random
+from datetime import datetime, timedelta
+
+START_TIME = datetime(2017, 12, 11, 18, 0, 0)
+START = (-53.133, 47.388)
+METRES_PER_DEGREE = 111320.0
+
+# the vessel turns around after this many seconds on a line
+LINE_SECONDS = 600
+
+# NMEA logs have a fix a second and the echosounder pings DEPTHS_PER_FIX times a second
+DEPTHS_PER_FIX = 5
+
+LINES_PER_WRITE = 10000
+
+
+def track(n_points, interval, seed=0):
+    """
+    A generator of (time, latitude, longitude, depth) of the vessel every interval seconds
+    :input: how many points, seconds between them, the seed of the random walk
+    """
+    rng = random.Random(seed)
+    lon, lat = START
+    heading = rng.uniform(0, 360)
+    speed = 3.0
+    depth = 20.0
+    line_points = max(1, int(LINE_SECONDS / interval))
+    for i in range(n_points):
+        yield START_TIME + timedelta(seconds=i * interval), lat, lon, depth
+        if i % line_points == line_points - 1:
+            heading += 180
+        heading = (heading + rng.gauss(0, 1)) % 360
+        distance = speed * interval
+        lat += distance * math.cos(math.radians(heading)) / METRES_PER_DEGREE
+        lon += distance * math.sin(math.radians(heading)) / (METRES_PER_DEGREE * math.cos(math.radians(lat)))
+        depth = min(200.0, max(2.0, depth + rng.gauss(0, 0.05)))
+
+
+def write_lines(path, lines):
+    """
+    Writes an iterable of lines (without newlines) LINES_PER_WRITE at a time
+    """
+    with open(path, 'w') as f:
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= LINES_PER_WRITE:
+                f.write('\n'.join(batch) + '\n')
+                batch = []
+        if batch:
+            f.write('\n'.join(batch) + '\n')
+    return path
+
+
+def checksummed(sentence):
+    """
+    '$' + sentence + '*' + its NMEA checksum
+    """
+    checksum = 0
+    for c in sentence.encode('ascii'):
+        checksum ^= c
+    return '$%s*%02X' % (sentence, checksum)
+
+
+def nmea_angle(value, degree_digits):
+    degrees = int(abs(value))
+    return '%0*d%010.7f' % (degree_digits, degrees, (abs(value) - degrees) * 60)
+
+
+def nmea_lines(n_points, seed):
+    """
+    The lines of an NMEA log with n_points depths: an RMC fix and a heading sentence every second,
+    and DEPTHS_PER_FIX depths a second alternating between DBT and the proprietary PADBT
+    """
+    for i, (time, lat, lon, depth) in enumerate(track(n_points, 1 / DEPTHS_PER_FIX, seed)):
+        logged = '%02d:%02d:%02d.%03d ' % (time.hour, time.minute, time.second, time.microsecond // 1000)
+        if i % DEPTHS_PER_FIX == 0:
+            yield logged + checksummed('GPRMC,%s.00,A,%s,%s,%s,%s,5.83,%.2f,%s,,,A,C' % (
+                time.strftime('%H%M%S'), nmea_angle(lat, 2), 'N' if lat >= 0 else 'S',
+                nmea_angle(lon, 3), 'E' if lon >= 0 else 'W', i % 360, time.strftime('%d%m%y')))
+            yield logged + checksummed('PTNTHPR,%.1f,N,-0.3,N,1.8,N' % (i % 3600 / 10))
+        if i % 2:
+            yield logged + checksummed('PADBT,000.000,f,%06.2f,M,000.000,F' % depth)
+        else:
+            yield logged + checksummed('SDDBT,%.2f,f,%.2f,M,%.2f,F' % (depth * 3.28084, depth, depth * 0.546807))
+
+
+def cidco_lines(n_points, seed):
+    """
+    The lines of a CIDCO processed export with n_points soundings, ten a second
+    """
+    yield '# CIDCO Single-beam processing'
+    yield '# UTC ; latitude(DD) ; longitude(DD) ; depth(m) ; Northing(EPSG:32615) ; Easting(EPSG:32615)'
+    for time, lat, lon, depth in track(n_points, 0.1, seed):
+        yield '%s.%03d;%013.9f;%014.9f;%08.3f;%.3f;%.3f' % (
+            time.strftime('%Y/%m/%d %H:%M:%S'), time.microsecond // 1000, lat, lon, -depth,
+            lat * METRES_PER_DEGREE, (lon - START[0]) * METRES_PER_DEGREE)
+
+
+def geojson_lines(n_points, seed):
+    """
+    The lines of a GeoJSON feature collection of n_points soundings, one a second, a feature per line
+    """
+    header = json.dumps({'type': 'FeatureCollection',
+                         'crs': {'type': 'name', 'properties': {'name': 'EPSG:4326'}},
+                         'properties': {'platform': {'name': 'Synthetic', 'type': 'Ship'}}})
+    yield header[:-1] + ', "features": ['
+    last = n_points - 1
+    for i, (time, lat, lon, depth) in enumerate(track(n_points, 1, seed)):
+        yield ('{"type":"Feature","geometry":{"type":"Point","coordinates":[%.6f,%.6f]},'
+               '"properties":{"depth":%.1f,"time":"%s.000Z"}}%s') % (
+            lon, lat, depth, time.strftime('%Y-%m-%dT%H:%M:%S'), '' if i == last else ',')
+    yield ']}'
+
+
+GENERATORS = {
+    'nmea': nmea_lines,
+    'cidco': cidco_lines,
+    'geojson': geojson_lines,
+}
+
+
+def generate(kind, n_points, path, seed=0):
+    """
+    Writes a file of a kind in GENERATORS with n_points soundings
+    :output: the path
+    """
+    return write_lines(path, GENERATORS[kind](n_points, seed))
+
+
+if __name__ == '__main__':
+    generate(sys.argv[1], int(sys.argv[2]), sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 0)
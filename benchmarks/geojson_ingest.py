@@ -0,0 +1,66 @@
+"""
+Features per second parsing the bundled geojson_small.json repeated `scale` times,
+for each importable ijson backend, with the old strptime points and GeoJsonUploader's.
+
+    python -m benchmarks.geojson_ingest [scale]
+"""
+import sys
+import json
+import time
+import tempfile
+import importlib
+from datetime import datetime
+
+from dbinterfacer.uploaders.geojson import GeoJsonUploader, IJSON_BACKENDS
+from dbinterfacer.helpers.timestamps import ISO_8601_FORMAT
+from .input_path import offline
+
+FIELDS = ['time', 'latitude', 'longitude', 'depth']
+
+
+def scaled_file(scale):
+    with open('test/data/geojson_small.json') as f:
+        data = json.load(f)
+    data['features'] = data['features'] * scale
+    out = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(data, out)
+    out.close()
+    return out.name, len(data['features'])
+
+
+def strptime_points(uploader, file):
+    # GeoJsonUploader.iter_points before the fast timestamp parser
+    for jp in uploader.ijson.items(file, 'features.item'):
+        p = uploader.point_model.generate_point()
+        p['time'] = datetime.strptime(jp['properties']['time'], ISO_8601_FORMAT)
+        p['depth'] = jp['properties']['depth']
+        p['longitude'] = jp['geometry']['coordinates'][0]
+        p['latitude'] = jp['geometry']['coordinates'][1]
+        yield p
+
+
+def timed(name, path, n, f):
+    with open(path, 'rb') as file:
+        start = time.perf_counter()
+        count = sum(1 for _ in f(file))
+        seconds = time.perf_counter() - start
+    assert count == n
+    print('%-26s %7.2fs  %8.0f features/s' % (name, seconds, n / seconds))
+
+
+def main(scale):
+    path, n = scaled_file(scale)
+    print('%d features' % n)
+    for name in IJSON_BACKENDS:
+        try:
+            backend = importlib.import_module('ijson.backends.' + name)
+        except ImportError:
+            continue
+        uploader = offline(GeoJsonUploader, FIELDS)
+        uploader.ijson = backend
+        timed(name + ' strptime', path, n, lambda file: strptime_points(uploader, file))
+        timed(name + ' iter_points', path, n, uploader.iter_points)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
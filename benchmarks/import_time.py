@@ -0,0 +1,70 @@
+"""
+How long importing dbinterfacer's entry points takes, from `python -X importtime` in fresh interpreters,
+against a budget for each so a heavy import creeping back in is caught.
+A module's time is the median over the runs of its cumulative import time less psycopg2's,
+which anything talking to the database needs anyway. The budgets leave room for a loaded machine,
+the modules an entry point must not import (the optional and slow to import dependencies) are the exact check.
+
+    python -m benchmarks.import_time [runs]
+
+Exits with 1 if an entry point is over its budget or imports what it shouldn't.
+"""
+import sys
+import statistics
+import subprocess
+
+# entry point -> (budget in milliseconds, modules it must not import)
+BUDGETS = {
+    'dbinterfacer.query': (50, ('pynmea2', 'ijson', 'numpy', 'pyarrow', 'psycopg2.extras', 'multiprocessing',
+                                'concurrent.futures', 'cProfile', 'pstats', 'tracemalloc')),
+    'dbinterfacer.uploaders': (90, ('pynmea2', 'ijson', 'numpy', 'pyarrow', 'psycopg2.extras', 'multiprocessing',
+                                    'concurrent.futures', 'cProfile', 'pstats', 'tracemalloc')),
+}
+
+# subtracted from the entry points' times
+BASELINE = 'psycopg2'
+
+DEFAULT_RUNS = 7
+
+
+def import_times(module):
+    """
+    Imports module in a new interpreter with -X importtime
+    :output: dict of every module imported -> cumulative microseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(module, runs):
+    """
+    :output: the median milliseconds of importing module less BASELINE's, the modules it imported
+    """
+    totals = []
+    for _ in range(runs):
+        times = import_times(module)
+        totals.append((times[module] - times.get(BASELINE, 0)) / 1000)
+    return statistics.median(totals), set(times)
+
+
+def main(runs):
+    failed = False
+    for module, (budget, forbidden) in BUDGETS.items():
+        ms, imported = measure(module, runs)
+        unwanted = sorted(m for m in forbidden if m in imported)
+        ok = ms <= budget and not unwanted
+        failed = failed or not ok
+        print('%-30s %7.1fms  budget %4dms  %s%s' % (module, ms, budget, 'ok' if ok else 'FAIL',
+                                                     '  imports ' + ', '.join(unwanted) if unwanted else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS))
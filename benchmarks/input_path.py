@@ -0,0 +1,107 @@
+"""
+Compares reading the bundled test data line by line from a file object (the old input path)
+with parse_file's mapped block input, on the data repeated `scale` times.
+Each run is in its own process so the peak RSS of each can be reported.
+
+    python -m benchmarks.input_path [scale]
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from decimal import Decimal
+from datetime import datetime
+
+from dbinterfacer.helpers import instrument
+from dbinterfacer.helpers.pointmodel import Point_Model
+from dbinterfacer.helpers.interpolation import PositionInterpolator
+from dbinterfacer.uploaders import CidcoUploader, NmeaUploader
+import pynmea2
+
+DATA = {
+    'cidco': ('test/data/soundingExport.txt', CidcoUploader,
+              ['time', 'latitude', 'longitude', 'depth', 'northing', 'easting']),
+    'nmea': ('test/data/NMEA.txt', NmeaUploader, ['time', 'latitude', 'longitude', 'depth']),
+}
+
+
+def offline(uploader_class, fields):
+    """
+    An uploader with a fixed point model, so nothing needs a database
+    """
+    class OfflineUploader(uploader_class):
+        def set_ref_table_and_fields(self):
+            self.batch_type_id, self.ref_table = None, None
+            self.point_model = Point_Model([(f, 'datetime' if f == 'time' else 'decimal') for f in fields])
+    return OfflineUploader(None, None)
+
+
+def lines_cidco(uploader, file):
+    # the old CidcoUploader: decode and split every line, a point dict per line
+    next(file, None)
+    next(file, None)
+    for row in file:
+        entries = row.decode('utf-8').split(';')
+        p = uploader.point_model.generate_point()
+        p['time'] = datetime.strptime(entries[0], '%Y/%m/%d %H:%M:%S.%f')
+        p['latitude'] = Decimal(entries[1])
+        p['longitude'] = Decimal(entries[2])
+        p['depth'] = Decimal(entries[3])
+        p['northing'] = Decimal(entries[4])
+        p['easting'] = Decimal(entries[5])
+        uploader.add_point(p)
+
+
+def lines_nmea(uploader, file):
+    # the same parser fed by iterating the file object
+    streamreader = pynmea2.NMEAStreamReader()
+    positions = PositionInterpolator()
+    for l in file:
+        uploader.read_line(l, positions, streamreader)
+        if positions.new_depths >= uploader.chunk_size:
+            for p in uploader.make_depth_points(positions.resolve()):
+                uploader.add_point(p)
+    for p in uploader.make_depth_points(positions.resolve(final=True)):
+        uploader.add_point(p)
+
+
+def run(kind, method, path):
+    uploader = offline(DATA[kind][1], DATA[kind][2])
+    start = time.perf_counter()
+    if method == 'lines':
+        with open(path, 'rb') as file:
+            (lines_cidco if kind == 'cidco' else lines_nmea)(uploader, file)
+    else:
+        uploader.parse_file(path)
+    seconds = time.perf_counter() - start
+    peak = instrument.max_rss() or 0
+    print('%-6s %-7s %8d points  %7.2fs  %8d points/s  peak RSS %6.1f MB' % (
+        kind, method, len(uploader.points), seconds, len(uploader.points) / seconds, peak / 2 ** 20))
+
+
+def main(scale):
+    with tempfile.TemporaryDirectory() as directory:
+        for kind, (source, _, _) in DATA.items():
+            with open(source, 'rb') as f:
+                data = f.read()
+            path = os.path.join(directory, kind)
+            with open(path, 'wb') as f:
+                if kind == 'cidco':
+                    header, body = data.split(b'\n', 2)[:2], data.split(b'\n', 2)[2]
+                    f.write(b'\n'.join(header) + b'\n')
+                    data = body
+                for _ in range(scale):
+                    f.write(data)
+            print('%s x%d: %.1f MB' % (source, scale, os.path.getsize(path) / 1e6))
+
+            for method in ('lines', 'mapped'):
+                subprocess.check_call([sys.executable, '-m', 'benchmarks.input_path', '--run', kind, method, path])
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run(*sys.argv[2:5])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,60 @@
+"""
+Lines/sec of the bytes tokenizer against the pynmea2 path NmeaUploader used before,
+on test/data/NMEA.txt repeated.
+
+    python -m benchmarks.nmea_tokenizer [repeats]
+"""
+import sys
+import time
+
+import pynmea2
+from dbinterfacer.helpers import nmeatokenizer, timestamps
+
+ACCEPTED = ("$GPRMC", "$PADBT", '$SDDBT')
+
+
+def pynmea2_path(lines):
+    streamreader = pynmea2.NMEAStreamReader()
+    found = 0
+    for l in lines:
+        l = l.decode('utf-8')
+        if l == '\n':
+            continue
+        try:
+            t, data = l.split(" ")
+        except Exception as e:
+            continue
+        if data.startswith(ACCEPTED):
+            for msg in streamreader.next(data):
+                found += 1
+    return found
+
+
+def tokenizer_path(lines):
+    found = 0
+    for l in lines:
+        try:
+            t, data = l.split(b" ")
+        except Exception as e:
+            continue
+        if data.startswith(b'$GPRMC'):
+            found += nmeatokenizer.parse_rmc(data) is not None
+        elif data.startswith((b'$PADBT', b'$SDDBT')):
+            timestamps.time_of_day(t)
+            found += nmeatokenizer.parse_dbt(data) is not None
+    return found
+
+
+def main(repeats):
+    with open('test/data/NMEA.txt', 'rb') as f:
+        lines = f.readlines() * repeats
+
+    for name, path in (('pynmea2', pynmea2_path), ('tokenizer', tokenizer_path)):
+        start = time.perf_counter()
+        found = path(lines)
+        seconds = time.perf_counter() - start
+        print('%-10s %9.0f lines/s  (%d sentences used)' % (name, len(lines) / seconds, found))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,73 @@
+"""
+Times repeated queries of one shape at different values, with the values inlined into the sql
+(how the where_ builders used to work, every query a new statement to parse and plan) and as parameters
+(the same statement every time, prepared after a few runs).
+The radius queries need PostGIS; a time window on batches and their files runs on any database.
+
+    python -m benchmarks.prepared_queries dsn [n_queries]
+"""
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+from dbinterfacer import query
+
+
+def inlined_radius(point, range):
+    # where_point_within_range before it was parameterized
+    radius_string = "ST_DWithin(ST_PointFromText('POINT({p[0]} {p[1]})', 4326) ::geography, geom, {r})"
+    return radius_string.format(p=point, r=range)
+
+
+def radius_queries(n):
+    centers = [(-53.133 + random.uniform(-0.01, 0.01), 47.388 + random.uniform(-0.01, 0.01)) for _ in range(n)]
+    inlined = [query.get_select_string(['count(*)'], ['batch_type_1'], [inlined_radius(c, 100)]) for c in centers]
+    parameterized = [query.get_select_string(['count(*)'], ['batch_type_1'], [query.where_point_within_range(c, 100)])
+                     for c in centers]
+    return inlined, parameterized
+
+
+def window_queries(n):
+    starts = [datetime(2017, 12, 11) + timedelta(minutes=random.randrange(10000)) for _ in range(n)]
+    inlined = [query.get_select_string(['batches.id', 'batch_files.file_id'], ['batch_files', 'batches'],
+                                       ["batches.start_time BETWEEN '%s' AND '%s'" % (s, s + timedelta(hours=1))])
+               for s in starts]
+    parameterized = [query.get_select_string(['batches.id', 'batch_files.file_id'], ['batch_files', 'batches'],
+                                             [query.SqlFragment('batches.start_time BETWEEN %s AND %s',
+                                                                [s, s + timedelta(hours=1)])])
+                     for s in starts]
+    return inlined, parameterized
+
+
+def timed(name, dsn_string, selects):
+    start = time.perf_counter()
+    for select in selects:
+        query.query(dsn_string, select)
+    seconds = time.perf_counter() - start
+    print('%-22s %6.3fs  %6.3f ms/query' % (name, seconds, seconds / len(selects) * 1000))
+
+
+def has_postgis(dsn_string):
+    rows, _ = query.query(dsn_string, "SELECT count(*) FROM pg_proc WHERE proname = 'st_dwithin'")
+    return rows[0][0] > 0
+
+
+def main(dsn_string, n):
+    random.seed(0)
+    shapes = [('window', window_queries)]
+    if has_postgis(dsn_string):
+        shapes.insert(0, ('radius', radius_queries))
+    else:
+        print('no PostGIS, skipping the radius queries')
+
+    for name, make in shapes:
+        inlined, parameterized = make(n)
+        # a first run of each so neither pays for the connection
+        query.query(dsn_string, inlined[0])
+        timed(name + ' inlined', dsn_string, inlined)
+        timed(name + ' prepared', dsn_string, parameterized)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
@@ -0,0 +1,214 @@
+"""
+The ingest and query benchmarks at production sizes, on synthetic surveys (see generators).
+For each format and size it times parse_file (and the validation in it), make_csv, make_binary and
+COPYing into a sink that only reads the data, and with a dsn also upload and the query helpers.
+The database should be a throwaway one, the batches made are deleted afterwards.
+The results go to a JSON file, and two of them can be compared.
+
+    python -m benchmarks.suite [--sizes 10k,1m,10m] [--formats nmea,cidco,geojson] [--dsn DSN] [--out FILE]
+    python -m benchmarks.suite --compare old.json new.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+from dbinterfacer import query
+from dbinterfacer.helpers import instrument
+from dbinterfacer.uploaders import CidcoUploader, NmeaUploader, GeoJsonUploader
+from .generators import generate
+from .input_path import offline
+
+# format -> uploader, fields of its offline point model, batch type in the database
+FORMATS = {
+    'nmea': (NmeaUploader, ['time', 'latitude', 'longitude', 'depth'], 'simple depth'),
+    'cidco': (CidcoUploader, ['time', 'latitude', 'longitude', 'depth', 'northing', 'easting'], 'cidco processed'),
+    'geojson': (GeoJsonUploader, ['time', 'latitude', 'longitude', 'depth'], 'simple depth'),
+}
+
+SIZES = {'10k': 10 ** 4, '1m': 10 ** 6, '10m': 10 ** 7}
+
+# points validated one dict at a time for validate_points
+VALIDATE_SAMPLE = 100000
+
+
+class SinkCursor():
+    """
+    Stands in for a cursor in Uploader.copy_points, reading the data as psycopg2 would and dropping it
+    """
+
+    def __init__(self):
+        self.rowcount = -1
+        self.bytes = 0
+
+    def copy_from(self, file, table, columns=None, size=8192):
+        self.drain(file, size)
+
+    def copy_expert(self, sql_string, file, size=8192):
+        self.drain(file, size)
+
+    def drain(self, file, size):
+        while True:
+            data = file.read(size)
+            if not data:
+                break
+            self.bytes += len(data)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    cpu = time.process_time()
+    result = function(*args)
+    return result, {'wall': time.perf_counter() - start, 'cpu': time.process_time() - cpu}
+
+
+def summary(record):
+    """
+    An instrument run without what doesn't go in JSON
+    """
+    return {k: v for k, v in record.items() if k != 'profile'}
+
+
+def bench_offline(kind, path):
+    """
+    parse_file, validation, make_csv, make_binary and the COPY sink, without a database
+    """
+    uploader_class, fields, _ = FORMATS[kind]
+    uploader = offline(uploader_class, fields)
+    with instrument.recording() as recorder:
+        uploader.parse_file(path)
+    result = {'parse_file': summary(recorder.runs[0]), 'points': len(uploader.points)}
+
+    sample = [uploader.points[i] for i in range(min(VALIDATE_SAMPLE, len(uploader.points)))]
+    _, result['validate_points'] = timed(uploader.point_model.validate_points, sample)
+    result['validate_points']['points'] = len(sample)
+
+    # the sink doesn't care, but the binary COPY statement needs a table name
+    uploader.ref_table = 'points'
+    for method, format in (('make_csv', 'text'), ('make_binary', 'binary')):
+        (copy_file, header), result[method] = timed(getattr(uploader, method), 0)
+        uploader.copy_format = format
+        sink = SinkCursor()
+        _, result[method + '_copy_sink'] = timed(uploader.copy_points, sink, copy_file, header)
+        result[method + '_copy_sink']['bytes'] = sink.bytes
+        del copy_file
+    return result
+
+
+def bench_database(kind, path, dsn_string):
+    """
+    parse_file and upload into the database, then the query helpers on the batch, which is then deleted
+    """
+    uploader_class, _, batch_type_name = FORMATS[kind]
+    uploader = uploader_class(dsn_string, batch_type_name)
+    with instrument.recording() as recorder:
+        uploader.parse_file(path)
+        batch_id = uploader.upload([])
+    result = {'upload': summary(recorder.runs[1])}
+
+    table = uploader.ref_table
+    points = 'SELECT time, latitude, longitude, depth FROM {} WHERE batch_id = %s'.format(table)
+    def copy_to_devnull():
+        with open(os.devnull, 'w') as devnull:
+            return query.copy_query(dsn_string, points, devnull, (batch_id,))
+
+    queries = {
+        'query': lambda: query.query(dsn_string, points, (batch_id,)),
+        'iter_rows': lambda: sum(1 for _ in query.iter_rows(dsn_string, points, (batch_id,))),
+        'copy_query': copy_to_devnull,
+        'get_batch_list': lambda: query.get_batch_list(dsn_string, [query.SqlFragment('batches.id = %s', [batch_id])]),
+    }
+    try:
+        result['queries'] = {name: timed(run)[1] for name, run in queries.items()}
+    finally:
+        query.query(dsn_string, 'DELETE FROM {} WHERE batch_id = %s; DELETE FROM batch_files WHERE batch_id = %s; '
+                                'DELETE FROM batches WHERE id = %s RETURNING id'.format(table),
+                    (batch_id, batch_id, batch_id))
+    return result
+
+
+def run_suite(formats, sizes, dsn_string=None, directory=None, seed=0):
+    """
+    :output: the results, a dict for JSON
+    """
+    results = {
+        'started': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+        'database': dsn_string is not None,
+        'runs': [],
+    }
+    directory = directory or tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            for kind in formats:
+                path = os.path.join(directory, '%s-%s' % (kind, size))
+                _, generated = timed(generate, kind, SIZES[size], path, seed)
+                run = {'format': kind, 'size': size, 'file_bytes': os.path.getsize(path), 'generate': generated}
+                run.update(bench_offline(kind, path))
+                if dsn_string is not None:
+                    run.update(bench_database(kind, path, dsn_string))
+                os.remove(path)
+                results['runs'].append(run)
+                print('%-8s %-4s %9d points  parse %7.2fs  make_csv %6.2fs' % (
+                    kind, size, run['points'], run['parse_file']['wall'], run['make_csv']['wall']))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def wall_times(results):
+    """
+    (format, size, what) -> wall seconds of a results file
+    """
+    times = {}
+    for run in results['runs']:
+        for what, value in run.items():
+            if isinstance(value, dict) and 'wall' in value:
+                times[(run['format'], run['size'], what)] = value['wall']
+        for name, value in run.get('queries', {}).items():
+            times[(run['format'], run['size'], 'query ' + name)] = value['wall']
+    return times
+
+
+def compare(old_path, new_path):
+    """
+    Prints the wall times of two results files side by side
+    """
+    with open(old_path) as f:
+        old = wall_times(json.load(f))
+    with open(new_path) as f:
+        new = wall_times(json.load(f))
+    for key in sorted(set(old) & set(new)):
+        print('%-8s %-4s %-26s %9.3fs %9.3fs  x%.2f' % (key + (old[key], new[key], new[key] / max(old[key], 1e-9))))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', default='10k,1m')
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--dsn')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='benchmark-%s.json' % datetime.now().strftime('%Y%m%d-%H%M%S'))
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run_suite(args.formats.split(','), args.sizes.split(','), args.dsn, seed=args.seed)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1, default=str)
+    print('results in %s' % args.out)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
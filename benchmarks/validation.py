@@ -0,0 +1,80 @@
+"""
+Times validating points with the old Point_Model.validate, the compiled one, and a whole batch
+or a batch of columns at once.
+
+    python -m benchmarks.validation [n_points]
+"""
+import sys
+import time
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+from dbinterfacer.helpers.pointmodel import Point_Model
+
+FIELDS = [
+    ('time', 'datetime'),
+    ('latitude', 'decimal'),
+    ('longitude', 'decimal'),
+    ('depth', 'decimal'),
+    ('northing', 'decimal'),
+    ('easting', 'decimal'),
+]
+
+
+def old_validate(model, point):
+    # Point_Model.validate before it was compiled
+    required_fields = list(model.model)
+    for field in point:
+        if field.startswith('pr_'):
+            continue
+
+        if field not in required_fields or len(required_fields) == 0:
+            return False
+        required_fields.remove(field)
+
+        value = point[field]
+        if isinstance(value, model.types[field]) == False:
+            return False
+
+    if len(required_fields) > 0:
+        return False
+    return True
+
+
+def make_points(model, n):
+    start = datetime(2017, 12, 11)
+    value = Decimal('47.3885332')
+    points = []
+    for i in range(n):
+        p = model.generate_point()
+        p['time'] = start + timedelta(seconds=i)
+        for f in ('latitude', 'longitude', 'depth', 'northing', 'easting'):
+            p[f] = value
+        points.append(p)
+    # one in a thousand is invalid
+    for p in points[::1000]:
+        p['depth'] = None
+    return points
+
+
+def timed(name, n, f):
+    start = time.perf_counter()
+    valid = f()
+    seconds = time.perf_counter() - start
+    print('%-18s %.3fs  %5.2fM points/s  %d valid' % (name, seconds, n / seconds / 1e6, valid))
+
+
+def main(n):
+    model = Point_Model(FIELDS)
+    points = make_points(model, n)
+    columns = {f: [p[f] for p in points] for f in model.model}
+
+    print('%d points' % n)
+    timed('old validate', n, lambda: sum(old_validate(model, p) for p in points))
+    timed('compiled validate', n, lambda: sum(map(model.validate, points)))
+    timed('validate_points', n, lambda: len(model.validate_points(points)[0]))
+    timed('validate_columns', n, lambda: len(model.validate_columns(columns)[0]['time']))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,115 @@
+"""
+A process wide cache of the batch types in the database, so making an uploader doesn't cost
+two catalog queries every time.
+"""
+import time
+import threading
+from collections import namedtuple
+from .pool import connection
+from .pointmodel import Point_Model
+from .exceptions import NoBatchTypeException
+
+BatchType = namedtuple('BatchType', ['id', 'ref_table', 'point_model'])
+
+
+class BatchTypeRegistry():
+    """
+    Caches a BatchType (id, ref_table, Point_Model) per (dsn_string, batch_type_name).
+    Entries are refetched once they are older than ttl seconds, or after being invalidated.
+    The Point_Models are shared by everything using the batch type and shouldn't be modified.
+    """
+
+    def __init__(self, ttl=300.0, clock=time.monotonic):
+        """
+        :input: seconds an entry is used for (None to keep them until invalidated),
+            the function giving the current time in seconds
+        """
+        self.ttl = ttl
+        self.clock = clock
+        # (dsn_string, name) -> (BatchType, time fetched)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, dsn_string, batch_type_name):
+        """
+        The BatchType named batch_type_name, fetched if it isn't cached or has expired
+        :output: a BatchType
+        """
+        key = (dsn_string, batch_type_name)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and not self.expired(entry[1]):
+            return entry[0]
+
+        batch_type = self.fetch(dsn_string, batch_type_name)
+        with self.lock:
+            self.entries[key] = (batch_type, self.clock())
+        return batch_type
+
+    def expired(self, fetched):
+        return self.ttl is not None and self.clock() - fetched >= self.ttl
+
+    def fetch(self, dsn_string, batch_type_name):
+        """
+        Queries the batch type and its fields
+        """
+        with connection(dsn_string) as conn:
+            cur = conn.cursor()
+
+            cur.execute('SELECT id, ref_table from batch_types where name = %s', (batch_type_name,))
+            result = cur.fetchone()
+            if result is None:
+                raise NoBatchTypeException("There is no batch type with name '%s'" % batch_type_name)
+            batch_type_id, ref_table = result
+
+            cur.execute('SELECT field_name, field_type from batch_type_fields f, batch_types b where b.id = %s and b.id = f.batch_type_id', (batch_type_id,))
+            fields = cur.fetchall()
+            cur.close()
+
+        return BatchType(batch_type_id, ref_table, Point_Model(fields))
+
+    def preload(self, dsn_string):
+        """
+        Fetches every batch type of the database in one query, replacing what was cached for it
+        :output: the names of the batch types
+        """
+        with connection(dsn_string) as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT b.name, b.id, b.ref_table, f.field_name, f.field_type '
+                        'FROM batch_types b LEFT JOIN batch_type_fields f ON b.id = f.batch_type_id')
+            rows = cur.fetchall()
+            cur.close()
+
+        types, fields = {}, {}
+        for name, batch_type_id, ref_table, field_name, field_type in rows:
+            types[name] = (batch_type_id, ref_table)
+            fields.setdefault(name, [])
+            if field_name is not None:
+                fields[name].append((field_name, field_type))
+
+        now = self.clock()
+        with self.lock:
+            self.invalidate_locked(dsn_string, None)
+            for name, (batch_type_id, ref_table) in types.items():
+                self.entries[(dsn_string, name)] = (BatchType(batch_type_id, ref_table, Point_Model(fields[name])), now)
+        return list(types)
+
+    def invalidate(self, dsn_string=None, batch_type_name=None):
+        """
+        Forgets cached batch types, all of them by default
+        :input: only forget the ones of this dsn_string, only forget the ones with this name
+        """
+        with self.lock:
+            self.invalidate_locked(dsn_string, batch_type_name)
+
+    def invalidate_locked(self, dsn_string, batch_type_name):
+        for key in list(self.entries):
+            if dsn_string is not None and key[0] != dsn_string:
+                continue
+            if batch_type_name is not None and key[1] != batch_type_name:
+                continue
+            del self.entries[key]
+
+
+# the registry used by the uploaders
+registry = BatchTypeRegistry()
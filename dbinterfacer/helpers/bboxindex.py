@@ -0,0 +1,292 @@
+"""
+An in-process index of the batches' bboxes, so finding the batches a new one overlaps
+(or contains, or is nearest to) doesn't go to the database.
+The index is a packed (STR) R-tree loaded once from Batches, and batches uploaded by this process
+are added to it as they are committed. See query.get_batches_intersecting and friends.
+"""
+import math
+import time
+import heapq
+import logging
+import threading
+from itertools import count
+import psycopg2 as psyco
+from .pool import connection
+from .exceptions import PoolTimeoutException
+
+logger = logging.getLogger(__name__)
+
+# entries per node of the tree
+NODE_SIZE = 16
+
+# batches added or changed since the tree was packed before it's packed again
+REPACK_AFTER = 256
+
+LOAD_SQL = "SELECT id, ST_XMin(bbox), ST_YMin(bbox), ST_XMax(bbox), ST_YMax(bbox) FROM batches WHERE bbox IS NOT NULL"
+
+
+def envelope(boxes):
+    """
+    The bbox around boxes of (min_x, min_y, max_x, max_y, ...)
+    """
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def box_distance(box, x, y):
+    """
+    The distance from (x, y) to the box, 0 inside it
+    """
+    dx = max(box[0] - x, 0, x - box[2])
+    dy = max(box[1] - y, 0, y - box[3])
+    return math.hypot(dx, dy)
+
+
+def str_pack(boxes, node_size):
+    """
+    Groups boxes into nodes of up to node_size by sort-tile-recursive: sorted into vertical slices by x,
+    then each slice into nodes by y
+    :input: a list of (min_x, min_y, max_x, max_y, item)
+    :output: a list of (min_x, min_y, max_x, max_y, [the boxes in the node])
+    """
+    n_nodes = -(-len(boxes) // node_size)
+    per_slice = math.ceil(math.sqrt(n_nodes)) * node_size
+    boxes = sorted(boxes, key=lambda b: b[0] + b[2])
+    nodes = []
+    for i in range(0, len(boxes), per_slice):
+        vertical = sorted(boxes[i:i + per_slice], key=lambda b: b[1] + b[3])
+        for j in range(0, len(vertical), node_size):
+            children = vertical[j:j + node_size]
+            nodes.append(envelope(children) + (children,))
+    return nodes
+
+
+class STRTree():
+    """
+    A static R-tree of boxes packed by str_pack. The root is a list of nodes, each node's last item
+    its children, down to the entries (min_x, min_y, max_x, max_y, id) height levels below
+    """
+
+    def __init__(self, entries, node_size=NODE_SIZE):
+        """
+        :input: an iterable of (min_x, min_y, max_x, max_y, id)
+        """
+        self.root = list(entries)
+        self.height = 0
+        while len(self.root) > node_size:
+            self.root = str_pack(self.root, node_size)
+            self.height += 1
+
+    def search(self, test):
+        """
+        The ids of the entries passing test, which must pass every node containing them
+        :input: a function of a box
+        :output: a list of ids
+        """
+        found = []
+        stack = [(self.root, self.height)]
+        while stack:
+            items, height = stack.pop()
+            for item in items:
+                if test(item):
+                    if height:
+                        stack.append((item[4], height - 1))
+                    else:
+                        found.append(item[4])
+        return found
+
+    def iter_nearest(self, x, y):
+        """
+        A generator of (distance, id) of the entries, nearest to (x, y) first
+        """
+        heap = []
+        tiebreak = count()
+
+        def push(items, height):
+            for item in items:
+                heapq.heappush(heap, (box_distance(item, x, y), next(tiebreak), height, item))
+
+        push(self.root, self.height)
+        while heap:
+            distance, _, height, item = heapq.heappop(heap)
+            if height:
+                push(item[4], height - 1)
+            else:
+                yield distance, item[4]
+
+
+def intersects_test(bbox):
+    min_x, min_y, max_x, max_y = bbox
+    return lambda b: b[0] <= max_x and b[2] >= min_x and b[1] <= max_y and b[3] >= min_y
+
+
+def contains_test(bbox):
+    min_x, min_y, max_x, max_y = bbox
+    return lambda b: b[0] <= min_x and b[2] >= max_x and b[1] <= min_y and b[3] >= max_y
+
+
+class BatchIndex():
+    """
+    The bboxes of the batches of a database: an STRTree of them as they were when it was packed,
+    and the ones added or changed since (moved) which are searched one by one until the next pack
+    """
+
+    def __init__(self):
+        # id -> (min_lon, min_lat, max_lon, max_lat)
+        self.boxes = {}
+        self.moved = set()
+        self.tree = STRTree([])
+        self.warm = False
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def fill(self, rows, loaded_at):
+        """
+        Adds the batches loaded from the database and packs the tree.
+        Batches added while they were loading are newer and kept
+        :input: rows of (id, min_lon, min_lat, max_lon, max_lat), when the load started
+        """
+        with self.lock:
+            for row in rows:
+                if row[0] not in self.boxes:
+                    self.boxes[row[0]] = tuple(map(float, row[1:]))
+            self.pack()
+            self.warm = True
+            self.loaded_at = loaded_at
+
+    def pack(self):
+        self.tree = STRTree(box + (batch_id,) for batch_id, box in self.boxes.items())
+        self.moved = set()
+
+    def add(self, batch_id, bbox):
+        """
+        Adds a batch, or moves it if its bbox changed
+        :input: the id, (min_lon, min_lat, max_lon, max_lat)
+        """
+        with self.lock:
+            self.boxes[batch_id] = tuple(map(float, bbox))
+            self.moved.add(batch_id)
+            if len(self.moved) > REPACK_AFTER:
+                self.pack()
+
+    def remove(self, batch_id):
+        with self.lock:
+            if self.boxes.pop(batch_id, None) is not None:
+                self.moved.add(batch_id)
+
+    def search(self, test):
+        with self.lock:
+            found = [i for i in self.tree.search(test) if i not in self.moved]
+            found.extend(i for i in self.moved if i in self.boxes and test(self.boxes[i]))
+        return sorted(found)
+
+    def intersecting(self, bbox):
+        """
+        The ids of the batches whose bbox intersects bbox (touching counts), in order
+        :input: (min_lon, min_lat, max_lon, max_lat)
+        """
+        return self.search(intersects_test(bbox))
+
+    def containing(self, bbox):
+        """
+        The ids of the batches whose bbox contains bbox (or a point, as a box of no size), in order
+        """
+        return self.search(contains_test(bbox))
+
+    def nearest(self, point, k=1):
+        """
+        The ids of the k batches whose bboxes are nearest to the point (in degrees), nearest first
+        :input: (lon, lat), k
+        """
+        x, y = point
+        with self.lock:
+            found = [(box_distance(self.boxes[i], x, y), i) for i in self.moved if i in self.boxes]
+            from_tree = 0
+            for distance, batch_id in self.tree.iter_nearest(x, y):
+                if from_tree == k:
+                    break
+                if batch_id not in self.moved:
+                    found.append((distance, batch_id))
+                    from_tree += 1
+        return [batch_id for _, batch_id in sorted(found)[:k]]
+
+
+class BatchIndexRegistry():
+    """
+    A BatchIndex per dsn_string. An index is cold (get returns None) until it has loaded,
+    which get starts in a background thread, and again once it's older than ttl seconds,
+    since batches uploaded by other processes are only picked up by loading
+    """
+
+    def __init__(self, ttl=300.0, clock=time.monotonic, background=True):
+        """
+        :input: seconds an index is used for (None to keep it), the function giving the current time
+            in seconds, whether to load in a thread (or in get)
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self.background = background
+        self.indexes = {}
+        # dsn_string -> the error of its last failed load
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def get(self, dsn_string):
+        """
+        The warm index of the database, or None after starting to load it
+        """
+        with self.lock:
+            index = self.indexes.get(dsn_string)
+            if index is not None and (not index.warm or not self.expired(index)):
+                return index if index.warm else None
+            index = self.indexes[dsn_string] = BatchIndex()
+
+        if self.background:
+            threading.Thread(target=self.load, args=(dsn_string, index), daemon=True).start()
+            return None
+        self.load(dsn_string, index)
+        return index if index.warm else None
+
+    def expired(self, index):
+        return self.ttl is not None and self.clock() - index.loaded_at >= self.ttl
+
+    def load(self, dsn_string, index):
+        """
+        Fills the index from Batches. If that fails the index is dropped, to be tried again by the next get.
+        Database, connection and pool errors are logged and kept in errors, others are raised
+        """
+        loaded_at = self.clock()
+        filled = False
+        try:
+            with connection(dsn_string) as conn:
+                cur = conn.cursor()
+                cur.execute(LOAD_SQL)
+                rows = cur.fetchall()
+                cur.close()
+            index.fill(rows, loaded_at)
+            filled = True
+        except (psyco.Error, PoolTimeoutException, OSError) as e:
+            logger.warning("Loading the batch index failed, falling back to SQL: %r", e)
+            self.errors[dsn_string] = e
+        finally:
+            if not filled:
+                with self.lock:
+                    if self.indexes.get(dsn_string) is index:
+                        del self.indexes[dsn_string]
+        if filled:
+            self.errors.pop(dsn_string, None)
+
+    def add(self, dsn_string, batch_id, bbox):
+        """
+        Adds a committed batch to the index of the database, if there is one
+        """
+        with self.lock:
+            index = self.indexes.get(dsn_string)
+        if index is not None:
+            index.add(batch_id, bbox)
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+
+
+registry = BatchIndexRegistry()
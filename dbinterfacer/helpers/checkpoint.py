@@ -0,0 +1,62 @@
+"""
+Checkpoints of Uploader.chunked_upload: a small JSON file recording the batch a chunked upload is filling
+and how far it got, so running the same upload again after a failure carries on from the last committed chunk.
+
+A checkpoint is a dict of
+    batch_id - the batch being filled
+    batch_type_name, ref_table - what it's a batch of
+    source, source_size - the path and size of the file being uploaded (None for streams)
+    points_committed - the valid points committed so far, in the order they're parsed
+It's written after each commit, through a temporary file so a crash never leaves half of one.
+The database has the last word on points_committed (a crash can come between a commit and the checkpoint),
+see Uploader.chunked_upload.
+"""
+import os
+import json
+from .sourcefile import source_path
+
+
+def load(path):
+    """
+    :output: the checkpoint dict in the file, or None if there isn't one
+    """
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save(path, state):
+    """
+    Writes the checkpoint dict, replacing the one in the file
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporary, 'w') as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def remove(path):
+    """
+    Deletes the checkpoint once its upload is complete
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def source_info(source):
+    """
+    The path and size of the file behind source, so a checkpoint isn't resumed with another file
+    :output: path, size (None, None for streams)
+    """
+    path = source_path(source)
+    if path is None:
+        return None, None
+    path = os.fsdecode(os.path.abspath(path))
+    return path, os.path.getsize(path)
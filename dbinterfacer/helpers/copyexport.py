@@ -0,0 +1,425 @@
+"""
+Columnar exports of query results (see query.iter_columns, iter_record_batches and export_parquet).
+The rows are streamed with COPY (...) TO STDOUT in PostgreSQL's binary format and decoded a block of rows
+at a time into a numpy array per column, without a python object per value.
+
+Before the COPY the query is described (run with LIMIT 0) and wrapped so every column comes out as a type
+the decoder knows: numerics as float8, geometries as WKB (ST_AsBinary) and anything else unknown as text.
+A fixed width column is sent with its nulls replaced and a flag of which ones were null, so rows of
+only fixed width columns all have the same layout and numpy decodes them in one go.
+Rows with variable width values (text, WKB) are decoded one by one.
+The COPY runs in a thread writing to a pipe that's read as the blocks are used, so at most
+a block or two are in memory whatever the size of the result.
+
+Needs numpy, and pyarrow for the Arrow record batches and Parquet.
+"""
+import os
+import json
+import struct
+import threading
+from collections import namedtuple
+import numpy
+from psycopg2 import sql
+from .pgbinary import HEADER, UNIX_TO_PG_MICROSECONDS
+
+# days from 1970-01-01 to postgres' epoch, 2000-01-01
+UNIX_TO_PG_DAYS = 10957
+
+# the oids of fixed width types -> (dtype on the wire, dtype of the column)
+FIXED_TYPES = {
+    16: ('?', '?'),                         # bool
+    20: ('>i8', 'i8'),                      # int8
+    21: ('>i2', 'i2'),                      # int2
+    23: ('>i4', 'i4'),                      # int4
+    26: ('>u4', 'u4'),                      # oid
+    700: ('>f4', 'f4'),                     # float4
+    701: ('>f8', 'f8'),                     # float8
+    1082: ('>i4', 'datetime64[D]'),         # date
+    1114: ('>i8', 'datetime64[us]'),        # timestamp
+    1184: ('>i8', 'datetime64[us]'),        # timestamptz, in UTC
+}
+
+TEXT_TYPES = {25, 1042, 1043, 19}           # text, bpchar, varchar, name
+BYTEA = 17
+
+BOOL = 16
+FLOAT8 = 701
+TEXT = 25
+
+# what the nulls of a fixed width type are replaced with, '0' for the others
+NULL_STANDINS = {
+    16: 'false',
+    1082: '2000-01-01',
+    1114: '2000-01-01',
+    1184: '2000-01-01 00:00+00',
+}
+
+# the types cast in the wrapping query, oid -> (cast, oid of the result). Other unknown types are cast to text
+CASTS = {
+    1700: ('float8', FLOAT8),               # numeric
+}
+
+GEOMETRY_TYPES = ('geometry', 'geography')
+
+# how many bytes of COPY data are read and decoded at a time
+PARSE_BYTES = 256 * 1024
+
+_row_count = struct.Struct('!h')
+_length = struct.Struct('!i')
+
+# a column of the export: its name, the oid of what the COPY sends, the select expression,
+# the expression of its null flag (None for variable width columns, which send their nulls),
+# whether it's a geometry as WKB
+ExportColumn = namedtuple('ExportColumn', ['name', 'oid', 'expression', 'null_flag', 'geometry'])
+
+
+def describe(cur, select_string):
+    """
+    The columns of a query and how each is selected for the export
+    :input: a cursor, the query with its parameters already in (see cursor.mogrify)
+    :output: a list of ExportColumns
+    """
+    cur.execute('SELECT * FROM ({}) q LIMIT 0'.format(select_string))
+    description = cur.description
+    names = [col.name for col in description]
+    duplicates = sorted(set(n for n in names if names.count(n) > 1))
+    if duplicates:
+        raise ValueError("Exported columns need distinct names, %s are repeated" % duplicates)
+
+    known = set(FIXED_TYPES) | TEXT_TYPES | {BYTEA} | set(CASTS)
+    unknown = sorted(set(col.type_code for col in description) - known)
+    type_names = {}
+    if unknown:
+        cur.execute('SELECT oid, typname FROM pg_type WHERE oid = ANY(%s)', (unknown,))
+        type_names = dict(cur.fetchall())
+
+    columns = []
+    for col in description:
+        column = sql.SQL('q.{}').format(sql.Identifier(col.name))
+        oid, geometry = col.type_code, False
+        if oid in FIXED_TYPES or oid in TEXT_TYPES or oid == BYTEA:
+            expression = column
+        elif type_names.get(oid) in GEOMETRY_TYPES:
+            expression = sql.SQL('ST_AsBinary({})').format(column)
+            oid, geometry = BYTEA, True
+        else:
+            cast, oid = CASTS.get(oid, ('text', TEXT))
+            expression = sql.SQL('{}::{}').format(column, sql.SQL(cast))
+
+        null_flag = None
+        if oid in FIXED_TYPES:
+            null_flag = sql.SQL('{} IS NULL').format(column)
+            expression = sql.SQL('coalesce({}, {})').format(expression, sql.Literal(NULL_STANDINS.get(oid, '0')))
+        columns.append(ExportColumn(col.name, oid, expression, null_flag, geometry))
+    return columns
+
+
+def copy_statement(select_string, columns):
+    """
+    The COPY of the query with the columns' expressions, in binary
+    """
+    expressions = []
+    for c in columns:
+        expressions.append(sql.SQL('{} AS {}').format(c.expression, sql.Identifier(c.name)))
+        if c.null_flag is not None:
+            expressions.append(c.null_flag)
+    return sql.SQL('COPY (SELECT {} FROM ({}) q) TO STDOUT WITH (FORMAT binary)').format(
+        sql.SQL(', ').join(expressions), sql.SQL(select_string))
+
+
+class CopyDecoder():
+    """
+    Decodes the binary COPY data of ExportColumns, fed in pieces as they come, into blocks of rows.
+    What's fed is decoded PARSE_BYTES or more at a time, and blocks are taken from the decoded rows.
+    A block is a dict of column name -> numpy array, a masked array if the column has nulls in the block
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        # the oids of the values of a row, the null flags following their columns
+        self.wire = []
+        for c in columns:
+            self.wire.append(c.oid)
+            if c.null_flag is not None:
+                self.wire.append(BOOL)
+        self.buffer = bytearray()
+        self.position = 0
+        self.started = False
+        self.finished = False
+        # decoded runs of rows, (rows, [values of each column], [null flags of each column] or None)
+        self.pieces = []
+        self.rows = 0
+
+        # the layout of a row when every value is there and has a fixed width
+        self.row_dtype = None
+        if all(oid in FIXED_TYPES for oid in self.wire):
+            fields = [('count', '>i2')]
+            for i, oid in enumerate(self.wire):
+                fields.extend([('length%d' % i, '>i4'), ('value%d' % i, FIXED_TYPES[oid][0])])
+            self.row_dtype = numpy.dtype(fields)
+            self.widths = [numpy.dtype(FIXED_TYPES[oid][0]).itemsize for oid in self.wire]
+
+    def feed(self, data):
+        """
+        Adds the next piece of the COPY data
+        """
+        self.buffer += data
+        if not self.started and len(self.buffer) >= len(HEADER):
+            if bytes(self.buffer[:11]) != HEADER[:11]:
+                raise ValueError("Not binary COPY data")
+            # the header extension area is skipped
+            self.position = len(HEADER) + _length.unpack_from(self.buffer, len(HEADER) - 4)[0]
+            self.started = True
+        if self.started and len(self.buffer) - self.position >= PARSE_BYTES:
+            self.parse()
+
+    def parse(self):
+        """
+        Decodes all the complete rows fed so far
+        """
+        while not self.finished:
+            piece = self.parse_fixed() or self.parse_rows()
+            if piece is None:
+                break
+            self.pieces.append(piece)
+            self.rows += piece[0]
+        del self.buffer[:self.position]
+        self.position = 0
+
+    def take(self, n_rows, final=False):
+        """
+        The next n_rows decoded rows, or fewer if final (once all the data is fed)
+        :output: a block, or None if there aren't enough rows (or none at all)
+        """
+        if final and self.started:
+            self.parse()
+        if self.rows == 0 or (self.rows < n_rows and not final):
+            return None
+
+        taken = []
+        remaining = n_rows
+        while remaining > 0 and self.pieces:
+            n, values, nulls = self.pieces[0]
+            if n <= remaining:
+                taken.append(self.pieces.pop(0))
+                remaining -= n
+            else:
+                taken.append((remaining, [v[:remaining] for v in values],
+                              None if nulls is None else [m[:remaining] for m in nulls]))
+                self.pieces[0] = (n - remaining, [v[remaining:] for v in values],
+                                  None if nulls is None else [m[remaining:] for m in nulls])
+                remaining = 0
+        self.rows -= n_rows - remaining
+        return self.block(taken)
+
+    def parse_fixed(self):
+        """
+        The complete rows fed so far decoded at once by numpy, when every value has a fixed width.
+        Stops before the trailer
+        :output: (rows, [array of each value of the row], None) or None if the next row isn't one
+        """
+        if self.row_dtype is None:
+            return None
+        size = self.row_dtype.itemsize
+        n = (len(self.buffer) - self.position) // size
+        if n == 0:
+            return None
+        rows = numpy.frombuffer(self.buffer, self.row_dtype, count=n, offset=self.position)
+        whole = rows['count'] == len(self.wire)
+        for i, width in enumerate(self.widths):
+            whole &= rows['length%d' % i] == width
+        if not whole.all():
+            n = int(numpy.argmin(whole))
+            if n == 0:
+                return None
+            rows = rows[:n]
+        self.position += n * size
+        return n, [rows['value%d' % i].copy() for i in range(len(self.wire))], None
+
+    def parse_rows(self):
+        """
+        The complete rows fed so far decoded one by one, up to the trailer
+        :output: (rows, [list of each value of the row], [list of null flags of each value]) or None
+        """
+        buffer = self.buffer
+        position = self.position
+        end = len(buffer)
+        values = [[] for _ in self.wire]
+        nulls = [[] for _ in self.wire]
+        n = 0
+        while position + 2 <= end:
+            count = _row_count.unpack_from(buffer, position)[0]
+            if count == -1:
+                self.finished = True
+                position += 2
+                break
+            row = position + 2
+            row_values = []
+            for _ in range(count):
+                if row + 4 > end:
+                    break
+                length = _length.unpack_from(buffer, row)[0]
+                row += 4
+                if length == -1:
+                    row_values.append(None)
+                    continue
+                if row + length > end:
+                    break
+                row_values.append(bytes(buffer[row:row + length]))
+                row += length
+            else:
+                for i, value in enumerate(row_values):
+                    values[i].append(value)
+                    nulls[i].append(value is None)
+                position = row
+                n += 1
+                continue
+            # the row isn't all there yet
+            break
+        self.position = position
+        if n == 0:
+            return None
+        return n, values, nulls
+
+    def block(self, pieces):
+        """
+        The block of decoded pieces of rows
+        """
+        values = []
+        for i, oid in enumerate(self.wire):
+            parts = [self.wire_values(oid, piece[1][i], None if piece[2] is None else piece[2][i]) for piece in pieces]
+            values.append(parts[0] if len(parts) == 1 else numpy.concatenate(parts))
+
+        block = {}
+        i = 0
+        for c in self.columns:
+            column = values[i]
+            i += 1
+            if c.null_flag is not None:
+                mask = values[i]
+                i += 1
+            else:
+                mask = numpy.fromiter((v is None for v in column), '?', len(column))
+            block[c.name] = numpy.ma.masked_array(column, mask) if mask.any() else column
+        return block
+
+    def wire_values(self, oid, values, nulls):
+        """
+        The values of a column of the wire in a piece of rows, as a numpy array of the column's dtype
+        """
+        if nulls is not None:
+            if oid in FIXED_TYPES:
+                values = numpy.frombuffer(b''.join(values), FIXED_TYPES[oid][0])
+            elif oid in TEXT_TYPES:
+                values = numpy.array([None if v is None else v.decode('utf-8') for v in values], dtype=object)
+            else:
+                values = numpy.array(values, dtype=object)
+
+        if oid == 1082:
+            return (values.astype('i8') + UNIX_TO_PG_DAYS).astype('datetime64[D]')
+        if oid in (1114, 1184):
+            return (values.astype('i8') + UNIX_TO_PG_MICROSECONDS).astype('datetime64[us]')
+        if oid in FIXED_TYPES:
+            return values.astype(FIXED_TYPES[oid][1])
+        return values
+
+
+def iter_copy_blocks(conn, cur, copy_string, columns, block_size):
+    """
+    A generator of the blocks of the COPY. The COPY runs in a thread writing to a pipe, which holds
+    at most a pipe's worth of data: the database waits while the blocks are used.
+    Stopping early cancels the COPY, the connection's transaction then has to be rolled back
+    :input: the connection and a cursor of it, the statement (see copy_statement), the ExportColumns,
+        rows per block
+    """
+    read_fd, write_fd = os.pipe()
+    reader = os.fdopen(read_fd, 'rb', buffering=0)
+    writer = os.fdopen(write_fd, 'wb')
+    errors = []
+
+    def copy():
+        try:
+            cur.copy_expert(copy_string, writer)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                writer.close()
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=copy, name='dbinterfacer-export', daemon=True)
+    thread.start()
+    decoder = CopyDecoder(columns)
+    try:
+        while True:
+            data = reader.read(PARSE_BYTES)
+            if not data:
+                break
+            decoder.feed(data)
+            block = decoder.take(block_size)
+            while block is not None:
+                yield block
+                block = decoder.take(block_size)
+
+        thread.join()
+        if errors:
+            raise errors[0]
+        block = decoder.take(block_size, final=True)
+        while block is not None:
+            yield block
+            block = decoder.take(block_size, final=True)
+    finally:
+        if thread.is_alive():
+            conn.cancel()
+        # a COPY still writing gets a broken pipe
+        reader.close()
+        thread.join()
+
+
+def empty_block(columns):
+    """
+    A block of no rows with the dtypes of the ExportColumns
+    """
+    return {c.name: numpy.empty(0, FIXED_TYPES[c.oid][1] if c.oid in FIXED_TYPES else object) for c in columns}
+
+
+def arrow_schema(columns):
+    """
+    The Arrow schema of the ExportColumns. Geometry columns are binary WKB,
+    described in the 'geo' metadata as GeoParquet expects
+    """
+    import pyarrow
+
+    types = {
+        16: pyarrow.bool_(), 20: pyarrow.int64(), 21: pyarrow.int16(), 23: pyarrow.int32(), 26: pyarrow.uint32(),
+        700: pyarrow.float32(), 701: pyarrow.float64(), 1082: pyarrow.date32(),
+        1114: pyarrow.timestamp('us'), 1184: pyarrow.timestamp('us', tz='UTC'), BYTEA: pyarrow.binary(),
+    }
+    fields = [pyarrow.field(c.name, types.get(c.oid, pyarrow.string())) for c in columns]
+    geometries = [c.name for c in columns if c.geometry]
+    metadata = None
+    if geometries:
+        metadata = {b'geo': json.dumps({
+            'version': '1.0.0',
+            'primary_column': geometries[0],
+            'columns': {name: {'encoding': 'WKB', 'geometry_types': []} for name in geometries},
+        }).encode()}
+    return pyarrow.schema(fields, metadata=metadata)
+
+
+def record_batch(block, schema):
+    """
+    A block as an Arrow RecordBatch of the schema
+    """
+    import pyarrow
+
+    arrays = []
+    for field in schema:
+        values = block[field.name]
+        mask = None
+        if isinstance(values, numpy.ma.MaskedArray):
+            mask = numpy.ma.getmaskarray(values)
+            values = values.data
+        arrays.append(pyarrow.array(values, type=field.type, mask=mask))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
@@ -0,0 +1,80 @@
+from itertools import repeat
+
+
+class ChunkStream():
+    """
+    A read-only file-like object over an iterable of chunks (strings or bytes).
+    Chunks are only pulled from the iterable when a read needs them, so COPY can consume
+    a generator without the whole payload ever being built in memory.
+    """
+
+    def __init__(self, chunks):
+        """
+        :input: an iterable of str or bytes chunks
+        """
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.pos = 0
+
+    def next_chunk(self):
+        """
+        Replaces the exhausted buffer with the next non-empty chunk.
+        Returns False once there are no chunks left
+        """
+        for chunk in self.chunks:
+            if len(chunk) > 0:
+                self.buffer = chunk
+                self.pos = 0
+                return True
+        return False
+
+    def read(self, size=-1):
+        """
+        Reads up to size characters (everything left if size is negative)
+        """
+        pieces = []
+        while size != 0:
+            if self.pos >= len(self.buffer) and not self.next_chunk():
+                break
+            end = len(self.buffer)
+            if size > 0:
+                end = min(end, self.pos + size)
+                size -= end - self.pos
+            pieces.append(self.buffer[self.pos:end])
+            self.pos = end
+        return self.buffer[:0].join(pieces)
+
+    def readline(self, size=-1):
+        """
+        Reads up to and including the next newline, or at most size characters
+        """
+        pieces = []
+        while size != 0:
+            if self.pos >= len(self.buffer) and not self.next_chunk():
+                break
+            newline = '\n' if isinstance(self.buffer, str) else b'\n'
+            end = self.buffer.find(newline, self.pos)
+            end = len(self.buffer) if end == -1 else end + 1
+            if size > 0:
+                end = min(end, self.pos + size)
+                size -= end - self.pos
+            pieces.append(self.buffer[self.pos:end])
+            found = self.buffer[end - 1:end] == newline
+            self.pos = end
+            if found:
+                break
+        return self.buffer[:0].join(pieces)
+
+
+def render_text(points, batch_id):
+    """
+    Renders points as lines of tab-delimited text, the default format of COPY.
+    Works a column at a time straight from the arrays of the PointBuffer.
+    :input: a PointBuffer, the batch_id
+    :output: a string with one line per point
+    """
+    if len(points) == 0:
+        return ''
+    columns = [points.column_strings(f) for f in points.fields]
+    columns.append(repeat(str(batch_id), len(points)))
+    return '\n'.join(map('\t'.join, zip(*columns))) + '\n'
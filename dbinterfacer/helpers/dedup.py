@@ -0,0 +1,130 @@
+"""
+Finds the parsed points already uploaded to a ref table, so a re-submitted file (or an overlapping export)
+doesn't add the same soundings again. See Uploader.drop_duplicates.
+
+Two points are the same when their time, latitude, longitude and depth are, each quantized (see DEFAULTS).
+The check is exact and done in the database: the points' keys are COPYed into a temporary table and
+anti-joined against the points of the complete batches of the ref table, so it sees every batch however
+it was uploaded, and stops seeing a batch once it's deleted.
+"""
+from datetime import timedelta
+from itertools import count, islice
+from array import array
+from psycopg2 import sql
+from .copystream import ChunkStream
+
+DEFAULTS = {
+    # the step each field is quantized to before comparing, in the units of the columns
+    # (microseconds for time, see PointBuffer)
+    'quanta': {'time': 1000, 'latitude': 1e-7, 'longitude': 1e-7, 'depth': 1e-3},
+    # rows per chunk COPYed into the temporary table, and per fetch of the duplicates found
+    'block_size': 10000,
+}
+
+_settings = dict(DEFAULTS)
+
+KEYS_TABLE = 'dedup_keys'
+
+
+def configure(**settings):
+    """
+    Changes the DEFAULTS for the checks made from now on
+    """
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown dedup settings %s" % sorted(unknown))
+    _settings.update(settings)
+
+
+def key_fields(points, quanta=None):
+    """
+    The fields of points the key is made of, and the quantum of each
+    :input: a PointBuffer, dict of field -> quantum (the configured quanta if None)
+    :output: list of (field, quantum)
+    """
+    quanta = _settings['quanta'] if quanta is None else quanta
+    return [(f, quanta[f]) for f in points.fields if f in quanta]
+
+
+def quantized(column, field, quantum):
+    """
+    The SQL expression of column quantized, the same for the ref table's points and the parsed ones
+    :input: sql.Composable of the column, the field name, its quantum
+    :output: sql.Composed
+    """
+    if field == 'time':
+        return sql.SQL('floor(extract(epoch FROM {}) * 1000000 / {})').format(column, sql.Literal(quantum))
+    return sql.SQL('round({}::numeric / {}::numeric)').format(column, sql.Literal(repr(quantum)))
+
+
+def key_chunks(points, fields, block_size):
+    """
+    Renders the index and the key fields of each point as COPY text, block_size lines at a time
+    """
+    lines = map('\t'.join, zip(map(str, count()), *[points.column_strings(f) for f, _ in fields]))
+    while True:
+        block = list(islice(lines, block_size))
+        if not block:
+            return
+        yield '\n'.join(block) + '\n'
+
+
+def time_window(points, quanta):
+    """
+    The times the ref table's points can match points in, one quantum wider than theirs on each side
+    :output: (start, end), or None if the key has no time
+    """
+    if 'time' not in quanta:
+        return None
+    start, end = points.ranges(['time'])['time']
+    margin = timedelta(microseconds=quanta['time'])
+    return start - margin, end + margin
+
+
+def find_duplicates(cur, ref_table, points, quanta=None):
+    """
+    Compares the points with the points of the complete batches of ref_table, and with each other.
+    Runs in cur's transaction, the temporary table is dropped when it ends
+    :input: cursor, the ref table's name, a PointBuffer, dict of field -> quantum (the configured quanta if None)
+    :output: array('b') of 1 for each point to keep, 0 for the ones already in ref_table
+        or repeating an earlier point of points
+    """
+    keep = array('b', [1]) * len(points)
+    fields = key_fields(points, quanta)
+    if len(points) == 0 or not fields:
+        return keep
+    quanta = dict(fields)
+    block_size = _settings['block_size']
+    names = sql.SQL(', ').join(sql.Identifier(f) for f, _ in fields)
+
+    cur.execute(sql.SQL('CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT 0::bigint AS i, {} FROM {} WITH NO DATA')
+                .format(sql.Identifier(KEYS_TABLE), names, sql.Identifier(ref_table)))
+    cur.copy_expert(sql.SQL('COPY {} (i, {}) FROM STDIN').format(sql.Identifier(KEYS_TABLE), names),
+                    ChunkStream(key_chunks(points, fields, block_size)))
+    cur.execute(sql.SQL('ANALYZE {}').format(sql.Identifier(KEYS_TABLE)))
+
+    def keys(alias):
+        return [quantized(sql.SQL('{}.{}').format(sql.Identifier(alias), sql.Identifier(f)), f, q)
+                for f, q in fields]
+
+    matches = [sql.SQL('{} = {}').format(r, k) for r, k in zip(keys('r'), keys('k'))]
+    params = {}
+    window = time_window(points, quanta)
+    if window is not None:
+        matches.append(sql.SQL('r.time BETWEEN %(start)s AND %(end)s'))
+        params['start'], params['end'] = window
+
+    # only the points of complete batches, see query.COMPLETE_BATCHES
+    query = sql.SQL(
+        'SELECT k.i FROM (SELECT *, row_number() OVER (PARTITION BY {} ORDER BY i) AS n FROM {}) k '
+        'WHERE k.n > 1 OR EXISTS (SELECT 1 FROM {} r JOIN batches ON batches.id = r.batch_id '
+        'WHERE batches.end_time IS NOT NULL AND {})'
+    ).format(sql.SQL(', ').join(keys(KEYS_TABLE)), sql.Identifier(KEYS_TABLE), sql.Identifier(ref_table),
+             sql.SQL(' AND ').join(matches))
+    cur.execute(query, params)
+    while True:
+        rows = cur.fetchmany(block_size)
+        if not rows:
+            return keep
+        for (i,) in rows:
+            keep[i] = 0
@@ -1,3 +1,9 @@
 
 class NoBatchTypeException(Exception):
     pass
+
+class NoPointsException(Exception):
+    pass
+
+class PoolTimeoutException(Exception):
+    pass
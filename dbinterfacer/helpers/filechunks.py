@@ -0,0 +1,48 @@
+"""
+Splitting files into byte ranges that start and end on line boundaries, so each range can be parsed
+on its own (see Uploader.parse_file with workers > 1).
+Files are binary and seekable.
+"""
+
+
+def align_to_line(file, offset):
+    """
+    The offset of the first line starting at or after offset
+    """
+    if offset <= 0:
+        return 0
+    file.seek(offset - 1)
+    file.readline()
+    return file.tell()
+
+
+def split_lines(file, start, n_chunks):
+    """
+    Splits the file from start to its end into up to n_chunks ranges of whole lines
+    :input: a binary file, the offset of the first line, the number of ranges wanted
+    :output: a list of (start, end) offsets
+    """
+    file.seek(0, 2)
+    size = file.tell()
+    step = max(1, (size - start) // max(1, n_chunks))
+
+    offsets = [start]
+    for i in range(1, n_chunks):
+        offset = align_to_line(file, start + i * step)
+        if offset > offsets[-1] and offset < size:
+            offsets.append(offset)
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+
+def iter_lines(file, start, end=None):
+    """
+    A generator of the lines starting in [start, end), end being the end of the file when None
+    """
+    file.seek(start)
+    position = start
+    for line in iter(file.readline, b''):
+        if end is not None and position >= end:
+            break
+        position += len(line)
+        yield line
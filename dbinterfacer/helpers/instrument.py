@@ -0,0 +1,303 @@
+"""
+Instrumentation of uploads and queries: where the time of each Uploader run and query.query call went.
+
+A run (upload, stream_upload, parse_file, query...) is made of stages (parse_file, validate, render, copy...),
+and for each the wall and cpu seconds, the rows in and out, the points rejected and the bytes sent over COPY
+are recorded. A stage run several times in a run (validating chunk after chunk) is added up, and stages
+can nest (stream_upload's copy includes the parsing and rendering COPY pulls through).
+Finished runs are handed to a callback as a dict (see Recorder) and kept in the recorder's runs.
+
+It's off until enable() (or a with recording()). While off, run and stage give a shared object
+that does nothing, so the instrumented code pays for a function call and an empty with block.
+cProfile, pstats and tracemalloc are only imported once something asks for profiles or memory,
+and resource (Unix only) when a run finishes.
+"""
+import io
+import sys
+import time
+import threading
+from collections import deque
+from functools import wraps
+from contextlib import contextmanager
+
+# the counters of a stage, added up across its calls
+COUNTERS = ('rows_in', 'rows_out', 'rejected', 'bytes')
+
+_recorder = None
+_local = threading.local()
+
+
+class NullStage():
+    """
+    What run and stage give while instrumentation is off
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counters):
+        pass
+
+    def wrap_reader(self, file):
+        return file
+
+
+NULL = NullStage()
+
+
+class Stage():
+    """
+    A stage while it's running. Its counters are set with add, and go to the stage's totals in the run on exit
+    """
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+        self.counters = {}
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        totals = self.run.stage_totals(self.name)
+        totals['calls'] += 1
+        totals['wall'] += time.perf_counter() - self.wall
+        totals['cpu'] += time.process_time() - self.cpu
+        for counter, value in self.counters.items():
+            totals[counter] += value
+        return False
+
+    def add(self, **counters):
+        """
+        Adds to the stage's counters (COUNTERS)
+        """
+        for counter, value in counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def wrap_reader(self, file):
+        """
+        The file-like object counting what's read from it into the stage's bytes
+        """
+        return CountingReader(file, self)
+
+
+class CountingReader():
+    """
+    A file-like object for COPY that counts the size of what is read through it
+    """
+
+    def __init__(self, file, stage):
+        self.file = file
+        self.stage = stage
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.stage.add(bytes=len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = self.file.readline(size)
+        self.stage.add(bytes=len(data))
+        return data
+
+
+class Run():
+    """
+    A run while it's running, see Recorder for what it becomes
+    """
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.stages = {}
+        self.profile = None
+
+    def stage_totals(self, name):
+        totals = self.stages.get(name)
+        if totals is None:
+            totals = self.stages[name] = dict({'calls': 0, 'wall': 0.0, 'cpu': 0.0}, **{c: 0 for c in COUNTERS})
+        return totals
+
+    def __enter__(self):
+        _local.run = self
+        if self.recorder.trace_memory:
+            import tracemalloc
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        if self.recorder.profile:
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        if self.profile is not None:
+            self.profile.disable()
+        _local.run = None
+
+        peak_memory = stats = None
+        if self.recorder.trace_memory:
+            import tracemalloc
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        if self.profile is not None:
+            import pstats
+            stats = pstats.Stats(self.profile, stream=io.StringIO())
+
+        record = {
+            'name': self.name,
+            'wall': wall,
+            'cpu': cpu,
+            'stages': self.stages,
+            'error': None if exc[0] is None else repr(exc[1]),
+            'max_rss': max_rss(),
+            'peak_memory': peak_memory,
+            'profile': stats,
+        }
+        self.recorder.finish(record)
+        return False
+
+
+def max_rss():
+    """
+    The process' peak resident memory so far in bytes, None without the resource module (Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Recorder():
+    """
+    Receives the finished runs, each a dict of
+        name, wall, cpu - the run's seconds
+        stages - stage name -> dict of calls, wall, cpu and COUNTERS, added up
+            (a run started in another is one more stage of it)
+        error - the repr of the exception the run ended with, or None
+        max_rss - the process' peak resident memory so far, in bytes (None on Windows)
+        peak_memory - the peak memory allocated by python during the run if trace_memory, in bytes
+        profile - a pstats.Stats of the run if profile
+    """
+
+    def __init__(self, callback=None, profile=False, trace_memory=False, keep=1000):
+        """
+        :input: a function called with each finished run, whether to cProfile runs,
+            whether to trace the memory allocated in runs (tracemalloc, slow),
+            how many of the latest runs to keep in runs
+        """
+        self.callback = callback
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.runs = deque(maxlen=keep)
+        self.lock = threading.Lock()
+        # whether enable started tracemalloc, so disable only stops its own tracing
+        self.started_tracing = False
+
+    def finish(self, record):
+        with self.lock:
+            self.runs.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+
+def enable(callback=None, profile=False, trace_memory=False, keep=1000):
+    """
+    Starts recording runs, see Recorder
+    :output: the Recorder
+    """
+    global _recorder
+    recorder = Recorder(callback, profile, trace_memory, keep)
+    if trace_memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            recorder.started_tracing = True
+    _recorder = recorder
+    return _recorder
+
+
+def disable():
+    """
+    Stops recording runs
+    :output: the Recorder that was recording, or None
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None and recorder.started_tracing:
+        import tracemalloc
+        tracemalloc.stop()
+    return recorder
+
+
+@contextmanager
+def recording(callback=None, profile=False, trace_memory=False, keep=1000):
+    """
+    enable for a with block, giving the Recorder
+    """
+    recorder = enable(callback, profile, trace_memory, keep)
+    try:
+        yield recorder
+    finally:
+        disable()
+
+
+def run(name):
+    """
+    A context for a run, or a stage of the current run if there is one
+    """
+    if _recorder is None:
+        return NULL
+    current = getattr(_local, 'run', None)
+    if current is not None:
+        return Stage(current, name)
+    return Run(_recorder, name)
+
+
+def stage(name):
+    """
+    A context for a stage of the current run, which does nothing outside of a run
+    """
+    current = getattr(_local, 'run', None)
+    if current is None:
+        return NULL
+    return Stage(current, name)
+
+
+def instrumented(name):
+    """
+    A decorator making each call of the function a run (see run)
+    """
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return function(*args, **kwargs)
+            with run(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def staged(name):
+    """
+    A decorator making each call of the function a stage of the current run (see stage)
+    """
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,146 @@
+from array import array
+from bisect import bisect_left
+from itertools import repeat
+from .timestamps import DAY_MICROSECONDS
+
+
+class PositionInterpolator():
+    """
+    Places depth soundings between GPS fixes by linear interpolation, in batches.
+    Fix times and positions and depth times are collected into arrays, then every ready depth
+    gets its bracketing pair of fixes from one sorted search over the fix times.
+    Times are int64 microseconds since the epoch. Depths only come with a time of day, their date
+    is taken from the latest fix seen, choosing the nearest day so midnight rollover works.
+    Fixes may arrive out of order, depths are only resolved once they are reorder_window older
+    than the newest fix (or when final).
+    Depths before the first fix are extrapolated from the first two, depths after the last are dropped.
+    """
+
+    def __init__(self, reorder_window=10 * 10 ** 6):
+        """
+        :input: how long (microseconds) to wait for late fixes before resolving a depth
+        """
+        self.reorder_window = reorder_window
+        self.fix_times = array('q')
+        self.fix_lats = array('d')
+        self.fix_lons = array('d')
+        self.fixes_sorted = True
+        self.last_fix_time = None
+
+        self.depth_times = array('q')
+        self.depths = []
+        # depths seen before any fix, as (time of day, depth)
+        self.undated = []
+        # depths added since the last resolve
+        self.new_depths = 0
+
+    def __len__(self):
+        """
+        The number of depths waiting to be resolved
+        """
+        return len(self.depths) + len(self.undated)
+
+    def add_fix(self, time, lat, lon):
+        """
+        :input: microseconds since the epoch, latitude and longitude as floats
+        """
+        if len(self.fix_times) > 0 and time < self.fix_times[-1]:
+            self.fixes_sorted = False
+        self.fix_times.append(time)
+        self.fix_lats.append(lat)
+        self.fix_lons.append(lon)
+        self.last_fix_time = time
+
+        if len(self.undated) > 0:
+            undated, self.undated = self.undated, []
+            # already counted as new
+            self.new_depths -= len(undated)
+            for time_of_day, depth in undated:
+                self.add_depth(time_of_day, depth)
+
+    def add_depth(self, time_of_day, depth):
+        """
+        :input: microseconds since midnight, the depth (passed through as is)
+        """
+        self.new_depths += 1
+        if self.last_fix_time is None:
+            self.undated.append((time_of_day, depth))
+            return
+
+        # the time with this time of day nearest to the last fix
+        offset = (time_of_day - self.last_fix_time % DAY_MICROSECONDS) % DAY_MICROSECONDS
+        if offset > DAY_MICROSECONDS // 2:
+            offset -= DAY_MICROSECONDS
+        self.depth_times.append(self.last_fix_time + offset)
+        self.depths.append(depth)
+
+    def settled(self):
+        """
+        True once every waiting depth is dated and reorder_window older than the newest fix,
+        so no later fix can change where it is placed
+        """
+        if len(self.undated) > 0:
+            return False
+        if len(self.depth_times) == 0:
+            return True
+        return max(self.fix_times) - self.reorder_window >= max(self.depth_times)
+
+    def fix_span(self):
+        """
+        The time between the oldest and newest fix held
+        """
+        if len(self.fix_times) == 0:
+            return 0
+        return max(self.fix_times) - min(self.fix_times)
+
+    def sort_fixes(self):
+        if self.fixes_sorted:
+            return
+        order = sorted(range(len(self.fix_times)), key=self.fix_times.__getitem__)
+        self.fix_times = array('q', map(self.fix_times.__getitem__, order))
+        self.fix_lats = array('d', map(self.fix_lats.__getitem__, order))
+        self.fix_lons = array('d', map(self.fix_lons.__getitem__, order))
+        self.fixes_sorted = True
+
+    def resolve(self, final=False):
+        """
+        Interpolates the positions of all the depths that are ready.
+        Resolved depths and the fixes no later depth can need are dropped.
+        :input: final - True once there are no more fixes coming
+        :output: 4 lists: times, latitudes, longitudes, depths
+        """
+        self.new_depths = 0
+        if len(self.fix_times) < 2:
+            return [], [], [], []
+        self.sort_fixes()
+
+        fix_times, lats, lons = self.fix_times, self.fix_lats, self.fix_lons
+        horizon = fix_times[-1] if final else fix_times[-1] - self.reorder_window
+
+        # index of the first fix at or after each depth, the fixes either side of it are used
+        brackets = list(map(max, map(bisect_left, repeat(fix_times), self.depth_times), repeat(1)))
+
+        times, out_lats, out_lons, depths = [], [], [], []
+        pending = []
+        for t, j, depth in zip(self.depth_times, brackets, self.depths):
+            if t > horizon:
+                pending.append((t, depth))
+                continue
+            t0, t1 = fix_times[j - 1], fix_times[j]
+            ratio = (t - t0) / (t1 - t0) if t1 != t0 else 0.0
+            times.append(t)
+            out_lats.append(lats[j - 1] + (lats[j] - lats[j - 1]) * ratio)
+            out_lons.append(lons[j - 1] + (lons[j] - lons[j - 1]) * ratio)
+            depths.append(depth)
+
+        self.depth_times = array('q', [t for t, d in pending])
+        self.depths = [d for t, d in pending]
+
+        # keep the fix before the horizon for the next bracket
+        keep = max(0, bisect_left(fix_times, horizon) - 1)
+        if keep > 0 and not final:
+            del self.fix_times[:keep]
+            del self.fix_lats[:keep]
+            del self.fix_lons[:keep]
+
+        return times, out_lats, out_lons, depths
@@ -0,0 +1,100 @@
+"""
+A fast path for the few NMEA sentences the NmeaUploader uses, working on the raw bytes of a line
+instead of building pynmea2 message objects.
+"""
+from functools import reduce
+from operator import xor
+from decimal import Decimal, InvalidOperation
+from datetime import datetime
+from .timestamps import EPOCH, DAY_MICROSECONDS
+
+
+def split_sentence(sentence):
+    """
+    Returns the comma separated fields of a sentence (the first being the talker and type),
+    or None if its '*hh' checksum doesn't match the xor of the bytes between '$' and '*'.
+    Sentences without a checksum are accepted, as pynmea2 does.
+    :input: bytes of a sentence
+    """
+    sentence = sentence.rstrip(b'\r\n')
+    star = sentence.rfind(b'*')
+    if star != -1:
+        body = sentence[1:star]
+        try:
+            expected = int(sentence[star + 1:], 16)
+        except ValueError:
+            return None
+        if reduce(xor, body, 0) != expected:
+            return None
+    else:
+        body = sentence[1:]
+    return body.split(b',')
+
+
+def nmea_l_to_float(nmea_real, compass):
+    """
+    Converts 'dddmm.mmmmmmm' and 'D' (N,E,S,W) to degrees
+    :input: the number as str or bytes, the compass direction as str or bytes
+    """
+    nmea_real = float(nmea_real)
+    degrees = int(nmea_real / 100)
+    minutes = nmea_real % 100
+    result = degrees + minutes / 60.0
+    if compass in ('W', 'S', b'W', b'S'):
+        result = -1 * result
+    return result
+
+
+_days_cache = {}
+
+def epoch_days(datestamp):
+    """
+    Days since the epoch of a 'ddmmyy' datestamp (2 digit years as %y: 69-99 are 19xx).
+    Cached, since a file only has a few dates.
+    """
+    days = _days_cache.get(datestamp)
+    if days is None:
+        year = int(datestamp[4:6])
+        date = datetime(year + (2000 if year < 69 else 1900), int(datestamp[2:4]), int(datestamp[0:2]))
+        days = (date - EPOCH).days
+        if len(_days_cache) > 1024:
+            _days_cache.clear()
+        _days_cache[datestamp] = days
+    return days
+
+
+def parse_rmc(sentence):
+    """
+    Parses the bytes of an RMC sentence.
+    Times are rounded the same way as pynmea2 ('hhmmss.ss', 'ddmmyy' with 2 digit years as %y).
+    :output: (microseconds since the epoch, latitude, longitude), or None if malformed or without a fix
+    """
+    fields = split_sentence(sentence)
+    if fields is None or len(fields) < 10:
+        return None
+    _, timestamp, _, lat, lat_dir, lon, lon_dir, _, _, datestamp = fields[:10]
+    if len(timestamp) < 6 or len(datestamp) != 6 or lat == b'' or lon == b'':
+        return None
+
+    try:
+        micros = int(float(timestamp[6:]) * 1000000) if len(timestamp) > 6 else 0
+        seconds = (int(timestamp[0:2]) * 60 + int(timestamp[2:4])) * 60 + int(timestamp[4:6])
+        return (epoch_days(datestamp) * DAY_MICROSECONDS + seconds * 10 ** 6 + micros,
+                nmea_l_to_float(lat, lat_dir),
+                nmea_l_to_float(lon, lon_dir))
+    except ValueError:
+        return None
+
+
+def parse_dbt(sentence):
+    """
+    Parses the bytes of a DBT (or proprietary ADBT) sentence.
+    :output: the depth in meters as a Decimal, or None if malformed or missing
+    """
+    fields = split_sentence(sentence)
+    if fields is None or len(fields) < 4 or fields[3] == b'':
+        return None
+    try:
+        return Decimal(fields[3].decode('ascii'))
+    except (InvalidOperation, UnicodeDecodeError):
+        return None
@@ -0,0 +1,258 @@
+import struct
+from decimal import Decimal
+from datetime import datetime, timedelta
+from itertools import chain, repeat
+from collections import namedtuple
+from operator import itemgetter, sub
+
+# https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+TRAILER = struct.pack('!h', -1)
+
+PG_EPOCH = datetime(2000, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+# PointBuffer times are microseconds since 1970-01-01, postgres' since 2000-01-01
+UNIX_TO_PG_MICROSECONDS = (PG_EPOCH - datetime(1970, 1, 1)) // ONE_MICROSECOND
+
+NUMERIC_POS = 0x0000
+NUMERIC_NEG = 0x4000
+NUMERIC_NAN = 0xC000
+NUMERIC_PINF = 0xD000
+NUMERIC_NINF = 0xF000
+
+_field_count = struct.Struct('!h')
+_int4 = struct.Struct('!ii')
+_float8 = struct.Struct('!id')
+_timestamp = struct.Struct('!iq')
+_numeric_head = struct.Struct('!ihhHH')
+
+# ascii digits to their values, for numeric_column
+_DIGIT_VALUES = bytes.maketrans(b'0123456789', bytes(range(10)))
+_NOT_DIGITS = str.maketrans('', '', '-.')
+
+
+def int4_bytes(value):
+    return _int4.pack(4, value)
+
+def numeric_bytes(value):
+    """
+    numeric is a list of base 10000 digits with the weight (base 10000 exponent) of the first one,
+    a sign and the display scale. Floats are written with their shortest repr.
+    """
+    if isinstance(value, float):
+        value = Decimal(repr(value))
+    sign, digits, exp = value.as_tuple()
+    if not isinstance(exp, int):
+        special = NUMERIC_NAN
+        if exp == 'F':
+            special = NUMERIC_NINF if sign else NUMERIC_PINF
+        return _numeric_head.pack(8, 0, 0, special, 0)
+
+    dscale = max(0, -exp)
+
+    # line the decimal digits up with the base 10000 groups
+    pad = exp % 4
+    digits = digits + (0,) * pad
+    exp -= pad
+    digits = (0,) * (-len(digits) % 4) + digits
+
+    groups = [digits[i] * 1000 + digits[i + 1] * 100 + digits[i + 2] * 10 + digits[i + 3]
+              for i in range(0, len(digits), 4)]
+    weight = len(groups) + exp // 4 - 1
+
+    start, end = 0, len(groups)
+    while start < end and groups[start] == 0:
+        start += 1
+        weight -= 1
+    while end > start and groups[end - 1] == 0:
+        end -= 1
+    groups = groups[start:end]
+
+    if len(groups) == 0:
+        weight, sign = 0, 0
+
+    head = _numeric_head.pack(8 + 2 * len(groups), len(groups), weight, NUMERIC_NEG if sign else NUMERIC_POS, dscale)
+    return head + struct.pack('!%dH' % len(groups), *groups)
+
+
+# a column where every value takes up the same number of bytes, stored back to back
+Fixed = namedtuple('Fixed', ['data', 'width'])
+
+
+def scalar_column(to_bytes):
+    """
+    Makes a column encoder out of a single value encoder
+    """
+    def encode_column(values):
+        return [list(map(to_bytes, values))]
+    return encode_column
+
+def base_10000(digits):
+    """
+    Converts decimal digits (one byte per digit, each group of 4 being one base 10000 digit)
+    into big-endian uint16s, treating the whole column as one big integer:
+    pairs of decimal digits are combined in 16 bit lanes, then pairs of those in 32 bit lanes.
+    """
+    size = len(digits)
+    x = int.from_bytes(digits, 'big')
+    mask_16 = int.from_bytes(b'\x00\xff' * (size // 2), 'big')
+    x = ((x >> 8) & mask_16) * 10 + (x & mask_16)
+    mask_32 = int.from_bytes(b'\x00\x00\xff\xff' * (size // 4), 'big')
+    x = ((x >> 16) & mask_32) * 100 + (x & mask_32)
+
+    # each 32 bit lane now holds one base 10000 digit in its low 16 bits
+    lanes = x.to_bytes(size, 'big')
+    groups = bytearray(size // 2)
+    groups[0::2] = lanes[2::4]
+    groups[1::2] = lanes[3::4]
+    return groups
+
+def uniform_digits(strings):
+    """
+    The fast path of numeric_column, for columns where every value is written with the same layout
+    (same length, decimal point in the same place, same sign), as fixed format exports are.
+    Returns (digits, int_width, frac_width, sign, dscale), or None if the layout isn't uniform
+    """
+    n = len(strings)
+    length = len(strings[0])
+    dot = strings[0].find('.')
+    if any(map(length.__ne__, map(len, strings))) or any(map(dot.__ne__, map(str.find, strings, repeat('.')))):
+        return None
+
+    joined = ''.join(strings)
+    minuses = joined.count('-')
+    if minuses not in (0, n):
+        return None
+    digits = joined.translate(_NOT_DIGITS)
+    if not digits.isdigit():
+        return None
+
+    int_len = (length if dot == -1 else dot) - minuses // n
+    frac_len = 0 if dot == -1 else length - dot - 1
+    int_width = -(-int_len // 4) * 4
+    frac_width = -(-frac_len // 4) * 4
+
+    # spread the digits out with zero padding, one strided copy per digit position
+    digits = digits.encode('ascii').translate(_DIGIT_VALUES)
+    width = int_width + frac_width
+    offset = int_width - int_len
+    padded = bytearray(n * width)
+    for i in range(int_len + frac_len):
+        padded[offset + i::width] = digits[i::int_len + frac_len]
+
+    sign = NUMERIC_NEG if minuses else NUMERIC_POS
+    return padded, int_width, frac_width, sign, frac_len
+
+def timestamp_column(values):
+    """
+    Encodes a PointBuffer time column (microseconds since 1970)
+    """
+    micros = map(sub, values, repeat(UNIX_TO_PG_MICROSECONDS))
+    return [Fixed(b''.join(map(_timestamp.pack, repeat(8), micros)), _timestamp.size)]
+
+def float8_column(values):
+    return [Fixed(b''.join(map(_float8.pack, repeat(8), values)), _float8.size)]
+
+def numeric_column(values):
+    """
+    Encodes a whole column of numerics at once.
+    Every value is padded out to the same number of base 10000 groups (Postgres strips the extra
+    zeros) so the digits of the whole column can be converted together by base_10000.
+    Returns two fixed width columns, the numeric headers and the digits.
+    """
+    strings = list(map(str, values))
+    n = len(strings)
+
+    uniform = uniform_digits(strings)
+    if uniform is not None:
+        digits, int_width, frac_width, sign, dscale = uniform
+    else:
+        signs = [NUMERIC_NEG if s[0] == '-' else NUMERIC_POS for s in strings]
+        parts = list(map(str.partition, map(str.lstrip, strings, repeat('-')), repeat('.')))
+        int_parts = list(map(itemgetter(0), parts))
+        frac_parts = list(map(itemgetter(2), parts))
+
+        int_width = -(-max(map(len, int_parts)) // 4) * 4
+        frac_width = -(-max(map(len, frac_parts)) // 4) * 4
+        digits = ''.join(chain.from_iterable(zip(
+            map(str.zfill, int_parts, repeat(int_width)),
+            map(str.ljust, frac_parts, repeat(frac_width), repeat('0')))))
+
+        # exponents, NaN, Infinity
+        if not digits.isdigit():
+            return scalar_column(numeric_bytes)(values)
+        digits = digits.encode('ascii').translate(_DIGIT_VALUES)
+        dscales = map(len, frac_parts)
+
+    n_groups = (int_width + frac_width) // 4
+    if uniform is not None:
+        heads = _numeric_head.pack(8 + 2 * n_groups, n_groups, int_width // 4 - 1, sign, dscale) * n
+    else:
+        heads = b''.join(map(_numeric_head.pack, repeat(8 + 2 * n_groups), repeat(n_groups), repeat(int_width // 4 - 1),
+                             signs, dscales))
+    return [Fixed(heads, _numeric_head.size), Fixed(base_10000(digits), 2 * n_groups)]
+
+
+def split_fixed(column, n):
+    """
+    Turns a fixed width column into a list of the bytes of each value
+    """
+    data, width = column
+    return [data[i:i + width] for i in range(0, n * width, width)]
+
+
+# maps the python type of a field to the function encoding its PointBuffer column
+COLUMN_ENCODERS = {
+    datetime: timestamp_column,
+    float: float8_column,
+    Decimal: numeric_column,
+}
+
+
+class BinaryEncoder():
+    """
+    Encodes points in PostgreSQL's binary COPY format (COPY ... WITH (FORMAT binary)),
+    which saves both the str() of every value and Postgres parsing the text back.
+    The column types have to match the table exactly: datetime -> timestamp, float -> float8,
+    Decimal -> numeric and the batch_id -> integer.
+    Values are encoded a column at a time straight from the arrays of a PointBuffer.
+    """
+
+    def __init__(self, fields, types):
+        """
+        :input: the ordered list of fields to output, dict of field name -> python type
+            (Point_Model.types)
+        """
+        self.fields = fields
+        self.encoders = [COLUMN_ENCODERS[types[f]] for f in fields]
+
+    def encode(self, points, batch_id, header=False, trailer=False):
+        """
+        Encodes the points as rows, each ending with the batch_id.
+        When every column is fixed width (no numerics in exponent notation) the rows are assembled with
+        one strided copy per byte of the row, otherwise the values are joined row by row.
+        :input: a PointBuffer, the batch_id, whether to add the file header and trailer
+        :output: bytes
+        """
+        n = len(points)
+        if n == 0:
+            return (HEADER if header else b'') + (TRAILER if trailer else b'')
+
+        columns = [Fixed(_field_count.pack(len(self.fields) + 1) * n, _field_count.size)]
+        for f, encode_column in zip(self.fields, self.encoders):
+            columns.extend(encode_column(points.raw_column(f)))
+        columns.append(Fixed(int4_bytes(batch_id) * n, _int4.size))
+
+        if all(isinstance(c, Fixed) for c in columns):
+            row_width = sum(c.width for c in columns)
+            rows = bytearray(n * row_width)
+            offset = 0
+            for data, width in columns:
+                for i in range(width):
+                    rows[offset + i::row_width] = data[i::width]
+                offset += width
+        else:
+            columns = [split_fixed(c, n) if isinstance(c, Fixed) else c for c in columns]
+            rows = b''.join(chain.from_iterable(zip(*columns)))
+
+        return b''.join([HEADER if header else b'', rows, TRAILER if trailer else b''])
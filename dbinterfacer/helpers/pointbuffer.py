@@ -0,0 +1,154 @@
+from array import array
+from itertools import repeat, compress
+from operator import add, sub, floordiv
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+class PointBuffer():
+    """
+    Columnar storage for the points of a Point_Model.
+    Every field gets a typed array: times are int64 microseconds since the epoch (naive, UTC)
+    and decimals and floats are float64, instead of a dict of boxed values per point.
+    Points are appended as dicts and moved into the columns chunk_size at a time.
+    Iterating or indexing gives point dicts back, so it can stand in for a list of points.
+    Decimals are kept to float64's precision: ones of up to 15 significant digits come back exactly,
+    longer ones as the shortest decimal of the nearest float64 (Decimal(repr(float(value))))
+    """
+
+    # the python type of a field -> typecode of the array storing it
+    TYPECODES = {
+        datetime: 'q',
+        float: 'd',
+        Decimal: 'd',
+    }
+
+    def __init__(self, point_model, chunk_size=4096):
+        """
+        :input: the Point_Model of the points, how many points to collect before growing the columns
+        """
+        self.fields = list(point_model.model)
+        self.types = point_model.types
+        self.chunk_size = chunk_size
+        self.columns = {f: array(self.TYPECODES[self.types[f]]) for f in self.fields}
+        self.pending = []
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]]) + len(self.pending)
+
+    def __iter__(self):
+        self.flush()
+        columns = [self.get_column(f) for f in self.fields]
+        for values in zip(*columns):
+            yield dict(zip(self.fields, values))
+
+    def __getitem__(self, i):
+        self.flush()
+        return {f: next(self.from_column(f, [self.columns[f][i]])) for f in self.fields}
+
+    def append(self, point):
+        """
+        Adds a point, it should already be validated. pr_ fields are not stored.
+        :input: a point dict
+        """
+        self.pending.append(point)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, points):
+        for p in points:
+            self.append(p)
+
+    def extend_buffer(self, other):
+        """
+        Adds all the points of another PointBuffer of the same model
+        """
+        self.flush()
+        for f in self.fields:
+            self.columns[f].extend(other.raw_column(f))
+
+    def extend_columns(self, columns):
+        """
+        Adds points given a column at a time, as they are stored (see TYPECODES):
+        microseconds since the epoch for times and floats for decimals and floats
+        :input: dict of field -> iterable of values, all of the same length
+        """
+        self.flush()
+        columns = {f: array(self.TYPECODES[self.types[f]], columns[f]) for f in self.fields}
+        if len(set(map(len, columns.values()))) > 1:
+            raise ValueError("Columns must all have the same length")
+        for f in self.fields:
+            self.columns[f].extend(columns[f])
+
+    def compress(self, selectors):
+        """
+        Keeps only the points whose selector is true
+        :input: an iterable of a selector per point, in order
+        """
+        self.flush()
+        selectors = array('b', selectors)
+        for f in self.fields:
+            self.columns[f] = array(self.columns[f].typecode, compress(self.columns[f], selectors))
+
+    def flush(self):
+        """
+        Moves the pending points into the columns, a whole column at a time
+        """
+        if len(self.pending) == 0:
+            return
+        for f in self.fields:
+            self.columns[f].extend(self.to_column(f, [p[f] for p in self.pending]))
+        self.pending = []
+
+    def to_column(self, field, values):
+        """
+        Converts values of the model's type to what the column stores
+        """
+        if self.types[field] is datetime:
+            return map(floordiv, map(sub, values, repeat(EPOCH)), repeat(ONE_MICROSECOND))
+        return map(float, values)
+
+    def from_column(self, field, values):
+        """
+        Converts values stored in a column back to the model's type
+        """
+        if self.types[field] is datetime:
+            return map(add, repeat(EPOCH), map(timedelta, repeat(0), repeat(0), values))
+        if self.types[field] is Decimal:
+            return map(Decimal, map(repr, values))
+        return iter(values)
+
+    def raw_column(self, field):
+        """
+        The array storing field
+        """
+        self.flush()
+        return self.columns[field]
+
+    def get_column(self, field):
+        """
+        An iterator of the values of field, as the model's type
+        """
+        return self.from_column(field, self.raw_column(field))
+
+    def column_strings(self, field):
+        """
+        An iterator of the values of field as strings, as COPY's text format expects them
+        """
+        if self.types[field] is datetime:
+            return map(str, self.get_column(field))
+        return map(repr, self.raw_column(field))
+
+    def ranges(self, fields):
+        """
+        The min and max of each field, as the model's type
+        :input: list of field names
+        :output: dict of field -> [min, max], or None for every field if there are no points
+        """
+        self.flush()
+        if len(self) == 0:
+            return {f: None for f in fields}
+        return {f: list(self.from_column(f, [min(self.columns[f]), max(self.columns[f])])) for f in fields}
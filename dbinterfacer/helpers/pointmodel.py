@@ -1,5 +1,7 @@
 from decimal import Decimal
 from datetime import datetime
+from itertools import repeat, compress
+from operator import not_
 
 class Point_Model():
     """
@@ -37,24 +39,115 @@ class Point_Model():
             - all fields in model are in point
             - all non pr_ fields in point are in model
             - all the field are of the correct type
+        Uses the function compiled for the model, see check for why a point is invalid
         """
-        required_fields = list(self.model)
-        for field in point:
-            # don't check private fields
-            if field.startswith('pr_'):
+        return self.compiled(point)
+
+
+    def check(self, point):
+        """
+        Why a point isn't valid
+        :output: a string with the reason, or None if the point is valid
+        """
+        for field, field_type in self.field_types:
+            if field not in point:
+                return "missing field '%s'" % field
+            if not isinstance(point[field], field_type):
+                return "field '%s' is %s, expected %s" % (field, type(point[field]).__name__, field_type.__name__)
+        return self.check_fields(point)
+
+
+    def check_fields(self, fields):
+        """
+        Why a set of field names doesn't match the model (pr_ fields are allowed)
+        :output: a string with the reason, or None if they match
+        """
+        for field in self.model:
+            if field not in fields:
+                return "missing field '%s'" % field
+        for field in fields:
+            if field not in self.model and not field.startswith('pr_'):
+                return "unexpected field '%s'" % field
+        return None
+
+
+    def validate_points(self, points, first_row=0):
+        """
+        Validates a batch of points
+        :input: a list of points, the row number of the first one (for the report)
+        :output: the list of valid points, a list of (row, reason) for the rejected ones
+        """
+        flags = list(map(self.compiled, points))
+        valid = list(compress(points, flags))
+        if len(valid) == len(points):
+            return valid, []
+        bad = compress(range(len(points)), map(not_, flags))
+        return valid, [(first_row + i, self.check(points[i])) for i in bad]
+
+
+    def validate_columns(self, columns, first_row=0):
+        """
+        Validates a batch of points given a column at a time
+        :input: a dict of field -> list of values (of the field's type), the row number of the first point
+        :output: the columns of the valid points, a list of (row, reason) for the rejected ones
+        """
+        lengths = set(map(len, columns.values()))
+        if len(lengths) > 1:
+            raise ValueError("Columns must all have the same length")
+        n = lengths.pop() if lengths else 0
+
+        reason = self.check_fields(columns)
+        if reason is not None:
+            return {f: [] for f in columns}, [(first_row + i, reason) for i in range(n)]
+
+        reasons = {}
+        for field, field_type in self.field_types:
+            column = columns[field]
+            flags = list(map(isinstance, column, repeat(field_type)))
+            if all(flags):
                 continue
+            for i in compress(range(n), map(not_, flags)):
+                if i not in reasons:
+                    reasons[i] = "field '%s' is %s, expected %s" % (field, type(column[i]).__name__, field_type.__name__)
+
+        if len(reasons) == 0:
+            return columns, []
+        keep = [i not in reasons for i in range(n)]
+        valid = {f: list(compress(column, keep)) for f, column in columns.items()}
+        return valid, [(first_row + i, reasons[i]) for i in sorted(reasons)]
+
 
-            if field not in required_fields or len(required_fields) == 0:
-                return False
-            required_fields.remove(field)
+    def compile(self):
+        """
+        Generates the validate function of the model: a chain of isinstance checks on the model's fields,
+        and a check of the point's size (only points with pr_ fields get their keys looked at)
+        """
+        self.field_types = [(name, self.types[name]) for name in self.model]
 
-            value = point[field]
-            if isinstance(value, self.types[field]) == False:
-                return False
+        checks = ['isinstance(point[%r], type_%d)' % (name, i) for i, (name, _) in enumerate(self.field_types)]
+        checks.append('(len(point) == %d or check_fields(point) is None)' % len(self.field_types))
+        source = (
+            'def validate(point):\n'
+            '    try:\n'
+            '        return bool(%s)\n'
+            '    except KeyError:\n'
+            '        return False\n' % ' and '.join(checks))
 
-        if len(required_fields) > 0:
-            return False
-        return True
+        namespace = {'type_%d' % i: field_type for i, (_, field_type) in enumerate(self.field_types)}
+        namespace['check_fields'] = self.check_fields
+        exec(source, namespace)
+        self.compiled = namespace['validate']
+
+
+    def __getstate__(self):
+        # the compiled function can't be pickled, it's made again on unpickling
+        state = dict(self.__dict__)
+        del state['compiled']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile()
 
 
     def set_model(self, fields):
@@ -66,6 +159,7 @@ class Point_Model():
         self.types = {}
         for tuple in fields:
             self.add_field(tuple)
+        self.compile()
 
     def add_field(self, tuple):
         """
@@ -78,3 +172,49 @@ class Point_Model():
 
         obj = self.FIELD_MAP[type]
         self.types[name] = obj
+        self.compile()
+
+
+class Rejections():
+    """
+    A report of the points a Point_Model rejected: how many for each reason,
+    and the row (the point's number in its file) and reason of the first few
+    """
+
+    def __init__(self, keep=100):
+        """
+        :input: how many (row, reason) examples to keep
+        """
+        self.keep = keep
+        self.counts = {}
+        self.examples = []
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def add(self, row, reason, count=1):
+        """
+        Records that count points starting at row were rejected for reason
+        """
+        self.counts[reason] = self.counts.get(reason, 0) + count
+        if len(self.examples) < self.keep:
+            self.examples.append((row, reason))
+
+    def extend(self, rejected):
+        """
+        :input: an iterable of (row, reason), as returned by Point_Model.validate_points
+        """
+        for row, reason in rejected:
+            self.add(row, reason)
+
+    def merge(self, other, row_offset=0):
+        """
+        Adds the rejections of another report, its rows shifted by row_offset
+        """
+        for reason, count in other.counts.items():
+            self.counts[reason] = self.counts.get(reason, 0) + count
+        room = self.keep - len(self.examples)
+        self.examples.extend((row + row_offset, reason) for row, reason in other.examples[:max(0, room)])
+
+    def __repr__(self):
+        return 'Rejections(%d: %r)' % (len(self), self.counts)
@@ -0,0 +1,218 @@
+"""
+Connection pools shared by query() and the uploaders, one per dsn_string, so repeated calls reuse
+connections instead of paying for the connect (TLS handshake, auth) every time.
+
+    with connection(dsn_string) as conn:
+        cur = conn.cursor()
+        ...
+
+The transaction is committed when the block exits normally and rolled back if it raises,
+then the connection goes back to the pool.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+import psycopg2 as psyco
+from .exceptions import PoolTimeoutException
+
+# used for pools made by get_pool, change with configure()
+DEFAULTS = {
+    'min_size': 1,
+    'max_size': 10,
+    'ping_after': 30.0,
+    'timeout': 30.0,
+}
+
+
+class ConnectionPool():
+    """
+    A thread safe pool of connections to one database.
+    Connections are checked before being handed out: closed ones are replaced, and ones that have been
+    idle for more than ping_after seconds are sent a 'SELECT 1' first.
+    A pool belongs to the process that made it, connections are never shared with a forked child.
+    """
+
+    def __init__(self, dsn_string, min_size=1, max_size=10, ping_after=30.0, timeout=30.0, connect=psyco.connect):
+        """
+        :input:
+            - dsn_string
+            - min_size, how many connections are opened up front and kept open
+            - max_size, the most connections open at once, checkouts past that wait for one to be returned
+            - ping_after, seconds a connection can be idle before it's checked with a query on checkout
+                (0 to always check, None to never)
+            - timeout, seconds to wait for a connection before raising PoolTimeoutException
+            - connect, the function opening a connection from the dsn_string
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+
+        self.dsn_string = dsn_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self.connect = connect
+        self.pid = os.getpid()
+
+        # (connection, time it was returned), most recently returned last
+        self.idle = []
+        self.in_use = 0
+        self.opened = 0
+        self.condition = threading.Condition()
+
+        for _ in range(min_size):
+            self.idle.append((self.open(), time.monotonic()))
+
+    def open(self):
+        conn = self.connect(dsn=self.dsn_string)
+        with self.condition:
+            self.opened += 1
+        return conn
+
+    def size(self):
+        """
+        The number of open connections, idle or not
+        """
+        return len(self.idle) + self.in_use
+
+    def healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if self.ping_after is None or time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psyco.Error:
+            return False
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except psyco.Error:
+            pass
+
+    def get(self):
+        """
+        Checks out a healthy connection, opening one if none are idle and the pool isn't full
+        :output: a connection, to be given back with put()
+        """
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while len(self.idle) == 0 and self.in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutException("No connection to '%s' was free within %ss" % (self.dsn_string, self.timeout))
+                self.condition.wait(remaining)
+            self.in_use += 1
+            idle = self.idle.pop() if len(self.idle) > 0 else None
+
+        try:
+            if idle is not None:
+                conn, idle_since = idle
+                if self.healthy(conn, idle_since):
+                    return conn
+                self.discard(conn)
+            return self.open()
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+    def put(self, conn, broken=False):
+        """
+        Gives a connection back, ending whatever transaction it is in.
+        :input: the connection, True if it shouldn't be reused
+        """
+        if not broken and not conn.closed:
+            try:
+                conn.rollback()
+            except psyco.Error:
+                broken = True
+
+        with self.condition:
+            self.in_use -= 1
+            if broken or conn.closed or len(self.idle) >= self.max_size:
+                self.discard(conn)
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        A connection for a with block, committed on success and rolled back on an exception
+        """
+        conn = self.get()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            self.put(conn, broken=isinstance(e, (psyco.OperationalError, psyco.InterfaceError)))
+            raise
+        self.put(conn)
+
+    def close(self):
+        """
+        Closes the idle connections. Connections in use are closed when they're given back
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.max_size = 0
+        for conn, _ in idle:
+            self.discard(conn)
+
+
+_pools = {}
+_lock = threading.Lock()
+# pools inherited through a fork, kept so their connections (the parent's) aren't closed by the child
+_inherited = []
+
+
+def configure(**settings):
+    """
+    Sets the defaults (min_size, max_size, ping_after, timeout) of pools made from now on
+    """
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown pool settings %s" % sorted(unknown))
+    DEFAULTS.update(settings)
+
+
+def get_pool(dsn_string):
+    """
+    The pool of dsn_string, made with DEFAULTS on first use
+    """
+    with _lock:
+        pool = _pools.get(dsn_string)
+        if pool is not None and pool.pid != os.getpid():
+            _inherited.append(pool)
+            pool = None
+        if pool is None:
+            pool = _pools[dsn_string] = ConnectionPool(dsn_string, **DEFAULTS)
+        return pool
+
+
+@contextmanager
+def connection(dsn_string):
+    """
+    A pooled connection to dsn_string for a with block, see ConnectionPool.connection
+    """
+    with get_pool(dsn_string).connection() as conn:
+        yield conn
+
+
+def close_all():
+    """
+    Closes and forgets every pool
+    """
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
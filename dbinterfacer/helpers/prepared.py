@@ -0,0 +1,149 @@
+"""
+Server-side prepared statements managed per connection, so queries of the same shape (the same sql
+with different parameters) are parsed and planned by Postgres once instead of every time.
+"""
+import re
+import threading
+import weakref
+from itertools import count
+from collections import OrderedDict
+import psycopg2 as psyco
+
+DEFAULTS = {
+    # runs of a statement on a connection before it's prepared, None to never prepare
+    'threshold': 5,
+    # prepared statements kept per connection, the least recently used is deallocated past it
+    'max_statements': 100,
+}
+
+PLACEHOLDER = re.compile(r'%%|%s')
+
+_settings = dict(DEFAULTS)
+_statements = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+_names = count(1)
+
+
+def configure(**settings):
+    """
+    Changes the DEFAULTS for connections from now on
+    """
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown prepared statement settings %s" % sorted(unknown))
+    _settings.update(settings)
+
+
+def to_dollar_placeholders(sql_string):
+    """
+    Turns the %s placeholders of a psycopg2 statement into $1, $2... (and %% into %), for PREPARE
+    :output: the statement, the number of placeholders
+    """
+    n = [0]
+
+    def replace(match):
+        if match.group() == '%%':
+            return '%'
+        n[0] += 1
+        return '$%d' % n[0]
+
+    return PLACEHOLDER.sub(replace, sql_string), n[0]
+
+
+class StatementCache():
+    """
+    The statements of one connection: how often each sql string ran, and the name it's prepared as
+    (None for ones Postgres can't prepare, they're always run as they are)
+    """
+
+    def __init__(self, threshold, max_statements):
+        self.threshold = threshold
+        self.max_statements = max_statements
+        self.runs = {}
+        self.names = OrderedDict()
+
+    def execute(self, cur, sql_string, parameters=None):
+        """
+        Runs the statement on the cursor, through EXECUTE once it has run threshold times
+        :input: cursor, an sql string with %s placeholders, a sequence of parameters (or None)
+        """
+        name = self.names.get(sql_string)
+        if name is None and sql_string not in self.names:
+            name = self.count_run(cur, sql_string, parameters)
+
+        if name is None:
+            cur.execute(sql_string, parameters)
+            return
+
+        self.names.move_to_end(sql_string)
+        parameters = parameters or ()
+        if parameters:
+            cur.execute('EXECUTE %s (%s)' % (name, ','.join(['%s'] * len(parameters))), parameters)
+        else:
+            cur.execute('EXECUTE %s' % name)
+
+    def count_run(self, cur, sql_string, parameters):
+        """
+        Counts a run of a statement that isn't prepared, preparing it once it reaches the threshold
+        :output: the name it's prepared as, or None
+        """
+        if self.threshold is None or isinstance(parameters, dict):
+            return None
+        runs = self.runs.get(sql_string, 0) + 1
+        if runs < self.threshold:
+            # statements with their values inlined are never the same twice, don't count them forever
+            if len(self.runs) >= 10 * self.max_statements:
+                self.runs.clear()
+            self.runs[sql_string] = runs
+            return None
+
+        self.runs.pop(sql_string, None)
+        name = self.prepare(cur, sql_string, parameters)
+        self.names[sql_string] = name
+        if len(self.names) > self.max_statements:
+            old_sql, old_name = self.names.popitem(last=False)
+            if old_name is not None:
+                cur.execute('DEALLOCATE %s' % old_name)
+        return name
+
+    def prepare(self, cur, sql_string, parameters):
+        """
+        PREPAREs the statement in a savepoint, so a statement Postgres can't prepare
+        (several statements, parameter types it can't infer) doesn't abort the transaction
+        :output: the name of the prepared statement, or None
+        """
+        if parameters:
+            statement, n = to_dollar_placeholders(sql_string)
+            if n != len(parameters):
+                return None
+        else:
+            statement = sql_string
+
+        with _lock:
+            name = 'dbinterfacer_%d' % next(_names)
+        cur.execute('SAVEPOINT dbinterfacer_prepare')
+        try:
+            cur.execute('PREPARE %s AS %s' % (name, statement))
+        except psyco.DatabaseError:
+            cur.execute('ROLLBACK TO SAVEPOINT dbinterfacer_prepare')
+            name = None
+        cur.execute('RELEASE SAVEPOINT dbinterfacer_prepare')
+        return name
+
+
+def statements(conn):
+    """
+    The StatementCache of a connection
+    """
+    with _lock:
+        cache = _statements.get(conn)
+        if cache is None:
+            cache = _statements[conn] = StatementCache(_settings['threshold'], _settings['max_statements'])
+    return cache
+
+
+def execute(cur, sql_string, parameters=None):
+    """
+    Runs the statement on the cursor, prepared once its connection has run it often enough (see StatementCache)
+    """
+    statements(cur.connection).execute(cur, sql_string, parameters)
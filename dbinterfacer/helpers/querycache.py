@@ -0,0 +1,178 @@
+"""
+A process wide cache of query results, so the same viewport asked for again doesn't cost a round trip.
+Results are dropped when a batch is uploaded over the area they cover (see Uploader.invalidate_cached_queries).
+"""
+import re
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'rows', 'extent', 'stored'])
+
+
+def normalize_sql(sql_string):
+    """
+    Collapses the whitespace of a statement outside of its '' literals, so the same query
+    written differently gets the same key
+    """
+    parts = sql_string.split("'")
+    parts[0::2] = [re.sub(r'\s+', ' ', part) for part in parts[0::2]]
+    return "'".join(parts).strip()
+
+
+def freeze(parameters):
+    """
+    A hashable version of sql parameters (None, a sequence or a mapping)
+    """
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return tuple(sorted((k, freeze_value(v)) for k, v in parameters.items()))
+    return tuple(map(freeze_value, parameters))
+
+
+def freeze_value(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(map(freeze_value, value))
+    return value
+
+
+def intersects(a, b):
+    """
+    Whether two (min_lon, min_lat, max_lon, max_lat) boxes overlap, None being everywhere
+    """
+    if a is None or b is None:
+        return True
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class QueryCache():
+    """
+    Caches (rows, header) results per (dsn_string, normalized sql, parameters), least recently used first out.
+    Each result has the extent (min_lon, min_lat, max_lon, max_lat) of the points it depends on,
+    or None if any new batch can change it.
+    Bounded by max_entries results and max_rows rows in all, entries older than ttl seconds aren't used.
+    """
+
+    def __init__(self, max_entries=1024, max_rows=1000000, ttl=None, clock=time.monotonic):
+        """
+        :input: the most results kept, the most rows kept in all, seconds a result is used for
+            (None to keep them until evicted or invalidated), the function giving the current time in seconds
+        """
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.rows = 0
+        # bumped by every invalidate, so a result fetched while a batch was committed isn't kept
+        self.generation = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, dsn_string, sql_string, parameters=None):
+        return (dsn_string, normalize_sql(sql_string), freeze(parameters))
+
+    def get(self, key):
+        """
+        The cached result of key, or None (counted as a hit or a miss)
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and self.clock() - entry.stored >= self.ttl:
+                self.remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key, value, extent=None, generation=None):
+        """
+        Caches a (rows, header) result, evicting the least recently used ones past the bounds.
+        Results with more than max_rows rows aren't kept, nor ones fetched before an invalidate
+        :input: the key, the result, its extent, the generation from before it was fetched
+        """
+        rows = len(value[0])
+        if rows > self.max_rows:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = CacheEntry(value, rows, extent, self.clock())
+            self.rows += rows
+            while len(self.entries) > self.max_entries or self.rows > self.max_rows:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def fetch(self, dsn_string, sql_string, parameters, extent, run):
+        """
+        The cached result of the query, or run() cached.
+        Callers get their own copy of the lists
+        :input: the query, its extent (see QueryCache), a function running it returning (rows, header)
+        :output: rows, header
+        """
+        return self.fetch_key(self.key(dsn_string, sql_string, parameters), extent, run)
+
+    def fetch_key(self, key, extent, run):
+        """
+        fetch by any hashable key
+        """
+        value = self.get(key)
+        if value is None:
+            generation = self.generation
+            value = run()
+            self.put(key, value, extent, generation)
+        rows, header = value
+        return list(rows), list(header)
+
+    def invalidate(self, dsn_string=None, bbox=None):
+        """
+        Drops the results of dsn_string (or every database) whose extent intersects bbox (or all of them)
+        :input: dsn_string, (min_lon, min_lat, max_lon, max_lat)
+        """
+        with self.lock:
+            self.generation += 1
+            for key in [k for k, entry in self.entries.items()
+                        if (dsn_string is None or k[0] == dsn_string) and intersects(entry.extent, bbox)]:
+                self.remove(key)
+                self.invalidations += 1
+
+    def remove(self, key):
+        # needs self.lock
+        self.rows -= self.entries.pop(key).rows
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.rows = 0
+
+    def stats(self):
+        """
+        The counters and size of the cache
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self.entries), 'rows': self.rows}
+
+
+cache = QueryCache()
+
+# the caches an upload invalidates
+caches = [cache]
+
+
+def invalidate(dsn_string=None, bbox=None):
+    """
+    QueryCache.invalidate of every cache in caches
+    """
+    for c in caches:
+        c.invalidate(dsn_string, bbox)
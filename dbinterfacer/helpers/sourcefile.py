@@ -0,0 +1,136 @@
+"""
+The input layer of the uploaders: files are memory mapped when they can be and read in blocks of whole
+lines, so parsers can work on a block at a time instead of a line at a time.
+Streams that can't be mapped (pipes, Django's in memory uploads, ...) fall back to buffered reads.
+"""
+import io
+import os
+import mmap
+from contextlib import contextmanager
+
+# roughly how many bytes of lines are handed to a parser at a time
+BLOCK_SIZE = 256 * 1024
+
+
+@contextmanager
+def open_source(source):
+    """
+    Opens source in binary mode if it's a path, otherwise yields it as is (it is then left open)
+    :input: a path or a binary file object
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, 'rb') as file:
+            yield file
+    else:
+        yield source
+
+
+def source_path(source):
+    """
+    The path of the file on disk behind source, or None for streams that aren't regular files
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        return source
+    name = getattr(source, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+
+def map_file(file):
+    """
+    Memory maps a whole file read only
+    :output: the mmap, or None if the file isn't a non-empty regular file
+    """
+    try:
+        fileno = file.fileno()
+        file.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    if os.fstat(fileno).st_size == 0:
+        return None
+    try:
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+
+def iter_mapped_blocks(file, mapped, block_size, end=None):
+    """
+    Walks the mapping from the position of file to end, yielding memoryview slices ending on a line boundary.
+    The pages of blocks that have been handed out are released as it goes
+    and the file is left positioned after what was read.
+    """
+    view = memoryview(mapped)
+    size = len(mapped) if end is None else min(end, len(mapped))
+    start = file.tell()
+    released = start - start % mmap.PAGESIZE
+    try:
+        while start < size:
+            stop = mapped.find(b'\n', min(start + block_size, size) - 1, size) + 1
+            if stop == 0:
+                stop = size
+            block = view[start:stop]
+            try:
+                yield block
+            finally:
+                block.release()
+            start = stop
+
+            # what's been parsed won't be read again, don't let it count towards the resident size
+            done = start - start % mmap.PAGESIZE
+            if done > released and hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_DONTNEED, released, done - released)
+                released = done
+    finally:
+        view.release()
+        file.seek(start)
+
+
+def iter_read_blocks(file, block_size, end=None):
+    """
+    Reads the file block_size at a time up to end, yielding bytes ending on a line boundary
+    """
+    rest = b''
+    remaining = None if end is None else end - file.tell()
+    while True:
+        if remaining is not None:
+            block_size = min(block_size, remaining)
+            remaining -= block_size
+        data = file.read(block_size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            rest = data
+            continue
+        rest = data[end:]
+        yield data[:end]
+    if rest:
+        yield rest
+
+
+def iter_blocks(file, block_size=BLOCK_SIZE, end=None):
+    """
+    A generator of the rest of the file in blocks of whole lines (the last one may not end with a newline).
+    Blocks are memoryviews of a mapping of the file when it can be mapped, bytes otherwise,
+    and are only valid until the next one is asked for.
+    :input: a binary file object, the offset to stop at (the end of the file when None)
+    """
+    mapped = map_file(file)
+    if mapped is None:
+        yield from iter_read_blocks(file, block_size, end)
+        return
+    try:
+        yield from iter_mapped_blocks(file, mapped, block_size, end)
+    finally:
+        mapped.close()
+
+
+def iter_lines(file, block_size=BLOCK_SIZE):
+    """
+    A generator of the rest of the lines of the file, newlines included, read through iter_blocks
+    """
+    for block in iter_blocks(file, block_size):
+        yield from io.BytesIO(block)
@@ -0,0 +1,147 @@
+"""
+Web mercator (z/x/y) tiles of the depth points, decimated in the database to a grid of at most
+cells_per_side * cells_per_side cells per tile with the min/mean/max depth of each,
+so a tile is the same size however many soundings are under it.
+"""
+import math
+from .querycache import QueryCache, caches
+
+# half the width of the web mercator (EPSG:3857) square, in metres
+MERCATOR_HALF_WIDTH = 20037508.342789244
+
+# how many grid cells across a tile, the level of detail of a tile at any zoom
+CELLS_PER_SIDE = 64
+
+# the size of a tile's vector tile coordinate space
+MVT_EXTENT = 4096
+
+MVT_LAYER = 'soundings'
+
+MAX_ZOOM = 30
+
+# the decimated points of a tile, grouped by the cell they snap to. The grid's origin is half a cell
+# in from the tile's corner, so the points snap to the centre of the tile cell they're in
+CELLS_SQL = """SELECT ST_SnapToGrid(ST_Transform(points.geom, 3857), %s, %s, %s, %s) AS cell,
+            count(*) AS n, min(points.depth) AS min_depth, avg(points.depth) AS mean_depth, max(points.depth) AS max_depth
+        FROM {table} points
+        WHERE points.geom && ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, 3857), 4326){batches}
+        GROUP BY cell"""
+
+BINS_SQL = """SELECT ST_X(lonlat) AS lon, ST_Y(lonlat) AS lat, n, min_depth, mean_depth, max_depth
+FROM (
+    SELECT ST_Transform(cell, 4326) AS lonlat, n, min_depth, mean_depth, max_depth
+    FROM ({cells}) cells
+) bins"""
+
+MVT_SQL = """SELECT ST_AsMVT(tile, %s, %s, 'geom')
+FROM (
+    SELECT ST_AsMVTGeom(cell, ST_MakeEnvelope(%s, %s, %s, %s, 3857), %s, 0, false) AS geom, n,
+        min_depth::float8 AS min_depth, mean_depth::float8 AS mean_depth, max_depth::float8 AS max_depth
+    FROM ({cells}) cells
+) tile"""
+
+
+# without batch_ids a tile has the points of the complete batches only, see query.COMPLETE_BATCHES
+COMPLETE_BATCHES_SQL = ' AND points.batch_id IN (SELECT id FROM batches WHERE end_time IS NOT NULL)'
+
+
+def check_tile(z, x, y):
+    """
+    Raises a ValueError unless z/x/y is a tile
+    """
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise ValueError("There is no tile %s/%s/%s" % (z, x, y))
+
+
+def tile_bounds(z, x, y):
+    """
+    The corners of a tile in web mercator metres
+    :input: zoom, column, row (from the top)
+    :output: (min_x, min_y, max_x, max_y)
+    """
+    check_tile(z, x, y)
+    size = 2 * MERCATOR_HALF_WIDTH / 2 ** z
+    min_x = -MERCATOR_HALF_WIDTH + x * size
+    max_y = MERCATOR_HALF_WIDTH - y * size
+    return (min_x, max_y - size, min_x + size, max_y)
+
+
+def tile_extent(z, x, y):
+    """
+    The corners of a tile in degrees, for the cache
+    :output: (min_lon, min_lat, max_lon, max_lat)
+    """
+    check_tile(z, x, y)
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+
+
+def quote_table(name):
+    """
+    A table name quoted for sql, schema and all
+    """
+    return '.'.join('"%s"' % part.replace('"', '""') for part in name.split('.'))
+
+
+def cells_sql(table, z, x, y, batch_ids=None, cells_per_side=CELLS_PER_SIDE):
+    """
+    The sql grouping the points of the tile into cells, and its parameters
+    :input: the points' table, the tile, the batches to include (None for all the complete ones), the grid size
+    :output: sql, a list of parameters
+    """
+    min_x, min_y, max_x, max_y = bounds = tile_bounds(z, x, y)
+    cell = (max_x - min_x) / cells_per_side
+    params = [min_x + cell / 2, min_y + cell / 2, cell, cell]
+    params.extend(bounds)
+    batches = COMPLETE_BATCHES_SQL
+    if batch_ids is not None:
+        batches = ' AND points.batch_id = ANY(%s)'
+        params.append(sorted(batch_ids))
+    return CELLS_SQL.format(table=quote_table(table), batches=batches), params
+
+
+def bins_sql(table, z, x, y, batch_ids=None, cells_per_side=CELLS_PER_SIDE):
+    """
+    The sql for the cells of the tile as rows of lon, lat (of the cell's centre), n, min, mean and max depth
+    :output: sql, a list of parameters
+    """
+    cells, params = cells_sql(table, z, x, y, batch_ids, cells_per_side)
+    return BINS_SQL.format(cells=cells), params
+
+
+def mvt_sql(table, z, x, y, batch_ids=None, cells_per_side=CELLS_PER_SIDE, extent=MVT_EXTENT):
+    """
+    The sql for the cells of the tile as a Mapbox vector tile, a layer of points with
+    n, min_depth, mean_depth and max_depth
+    :output: sql, a list of parameters
+    """
+    cells, params = cells_sql(table, z, x, y, batch_ids, cells_per_side)
+    return MVT_SQL.format(cells=cells), [MVT_LAYER, extent] + list(tile_bounds(z, x, y)) + [extent] + params
+
+
+class TileCache(QueryCache):
+    """
+    A QueryCache of tiles by what they are rather than their sql:
+    (dsn_string, kind, table, z, x, y, batch ids, cells per side).
+    Every tile's extent is its corners, so an upload only drops the tiles it lands on
+    """
+
+    def tile_key(self, dsn_string, kind, table, z, x, y, batch_ids, cells_per_side):
+        batches = None if batch_ids is None else frozenset(batch_ids)
+        return (dsn_string, kind, table, z, x, y, batches, cells_per_side)
+
+    def fetch_tile(self, dsn_string, kind, table, z, x, y, batch_ids, cells_per_side, run):
+        """
+        The cached tile, or run() cached
+        :output: rows, header
+        """
+        key = self.tile_key(dsn_string, kind, table, z, x, y, batch_ids, cells_per_side)
+        return self.fetch_key(key, tile_extent(z, x, y), run)
+
+
+cache = TileCache(max_entries=4096, max_rows=4096 * CELLS_PER_SIDE * CELLS_PER_SIDE // 4)
+caches.append(cache)
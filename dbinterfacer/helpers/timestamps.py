@@ -0,0 +1,109 @@
+"""
+Timestamp parsing for the fixed layouts the uploaders see, much cheaper than datetime.strptime.
+Anything not in the expected layout goes through strptime, so results and errors are the same.
+"""
+from array import array
+from functools import lru_cache
+from itertools import repeat
+from operator import add, mul, itemgetter
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+DAY_MICROSECONDS = 24 * 60 * 60 * 10 ** 6
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+ISO_8601_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+CIDCO_FORMAT = '%Y/%m/%d %H:%M:%S.%f'
+TIME_OF_DAY_FORMAT = '%H:%M:%S.%f'
+
+# 'YYYY/MM/DD HH:MM:' and 'SS.ffffff' of a CIDCO time
+_cidco_minute = itemgetter(slice(0, 17))
+_cidco_seconds = itemgetter(slice(17, None))
+
+
+def to_micros(date):
+    """
+    Microseconds since the epoch of a naive datetime
+    """
+    return (date - EPOCH) // ONE_MICROSECOND
+
+
+def parse_iso8601(text):
+    """
+    Parses 'YYYY-MM-DDTHH:MM:SS.fffZ' (1 to 6 fraction digits) to a naive datetime,
+    the same as datetime.strptime(text, ISO_8601_FORMAT)
+    """
+    if (21 < len(text) <= 27 and text[4] == '-' and text[7] == '-' and text[10] == 'T' and text[13] == ':'
+            and text[16] == ':' and text[19] == '.' and text[-1] == 'Z'):
+        fraction = text[20:-1]
+        digits = text[0:4] + text[5:7] + text[8:10] + text[11:13] + text[14:16] + text[17:19] + fraction
+        if digits.isdigit():
+            return datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                            int(text[11:13]), int(text[14:16]), int(text[17:19]), int(fraction.ljust(6, '0')))
+    return datetime.strptime(text, ISO_8601_FORMAT)
+
+
+def cidco_micros(raw):
+    """
+    Microseconds since the epoch of b'YYYY/MM/DD HH:MM:SS.fff' (1 to 6 fraction digits),
+    the same as datetime.strptime(raw.decode(), CIDCO_FORMAT)
+    """
+    minute = _minute_micros(raw[:17])
+    if minute is not None and 20 < len(raw) <= 26 and raw[19:20] == b'.':
+        digits = raw[17:19] + raw[20:]
+        if digits.isdigit() and raw[17:19] < b'60':
+            return minute + int(raw[17:19]) * 10 ** 6 + int(raw[20:].ljust(6, b'0'))
+    return to_micros(datetime.strptime(raw.decode('ascii'), CIDCO_FORMAT))
+
+
+def cidco_column_micros(raws):
+    """
+    Converts a list of CIDCO times to an array of microseconds since the epoch all at once:
+    each distinct minute is parsed once, and when every time has the same number of fraction digits
+    the seconds of the whole column are converted in one pass.
+    Falls back to cidco_micros for each time otherwise.
+    :input: list of bytes like b'YYYY/MM/DD HH:MM:SS.fff'
+    :output: array('q')
+    """
+    minutes = list(map(_cidco_minute, raws))
+    minute_micros = {m: _minute_micros(m) for m in set(minutes)}
+    seconds = list(map(_cidco_seconds, raws))
+    widths = set(map(len, seconds))
+
+    if None not in minute_micros.values() and len(widths) == 1:
+        width = widths.pop()
+        joined = b' '.join(seconds)
+        # every one is 'SS.f' to 'SS.ffffff'
+        if 3 < width <= 9 and joined[2::width + 1] == b'.' * len(raws):
+            digits = joined.replace(b'.', b'').split(b' ')
+            if b''.join(digits).isdigit() and max(digits) < b'60':
+                scale = 10 ** (9 - width)
+                return array('q', map(add, map(minute_micros.__getitem__, minutes),
+                                      map(mul, map(int, digits), repeat(scale))))
+    return array('q', map(cidco_micros, raws))
+
+
+def _minute_micros(raw):
+    """
+    Microseconds since the epoch of b'YYYY?MM?DD?HH:MM:', or None if it isn't in that layout
+    """
+    if len(raw) == 17 and raw[13:14] == b':' and raw[16:17] == b':':
+        digits = raw[0:4] + raw[5:7] + raw[8:10] + raw[11:13] + raw[14:16]
+        if digits.isdigit() and raw[4:5] + raw[7:8] + raw[10:11] == b'// ':
+            return to_micros(datetime(int(raw[0:4]), int(raw[5:7]), int(raw[8:10]), int(raw[11:13]), int(raw[14:16])))
+    return None
+
+
+@lru_cache(maxsize=256)
+def time_of_day(raw):
+    """
+    Converts b'HH:MM:SS.fff' (1 to 6 fraction digits, the time lines are logged with) to microseconds since midnight,
+    the same as datetime.strptime(raw.decode(), TIME_OF_DAY_FORMAT).
+    Cached, lines logged together share a time.
+    """
+    if 9 < len(raw) <= 15 and raw[2:3] + raw[5:6] + raw[8:9] == b'::.':
+        digits = raw[0:2] + raw[3:5] + raw[6:8] + raw[9:]
+        if digits.isdigit() and raw[0:2] < b'24' and raw[3:5] < b'60' and raw[6:8] < b'60':
+            return ((int(raw[0:2]) * 60 + int(raw[3:5])) * 60 + int(raw[6:8])) * 10 ** 6 + int(raw[9:].ljust(6, b'0'))
+    time = datetime.strptime(raw.decode('ascii'), TIME_OF_DAY_FORMAT)
+    return ((time.hour * 60 + time.minute) * 60 + time.second) * 10 ** 6 + time.microsecond
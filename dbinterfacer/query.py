@@ -1,61 +1,375 @@
-import psycopg2 as psyco
+import math
+from itertools import count
+from functools import lru_cache
+from collections import deque
+from contextlib import contextmanager
+from psycopg2 import sql
+from psycopg2.extensions import encodings
+from .helpers.pool import connection
+from .helpers import querycache, prepared, batchtypes, tiles, bboxindex, instrument
 
+# how many rows a server-side cursor fetches per round trip
+ITERSIZE = 10000
 
+# numpy dtypes of the postgres types (by oid) iter_arrays knows, others are kept as objects
+NUMPY_TYPES = {
+    16: '?',                # bool
+    20: 'i8',               # int8
+    21: 'i2',               # int2
+    23: 'i4',               # int4
+    700: 'f4',              # float4
+    701: 'f8',              # float8
+    1700: 'f8',             # numeric
+    1082: 'datetime64[D]',  # date
+    1114: 'datetime64[us]', # timestamp
+}
+
+COPY_TO_FORMATS = ('csv', 'text', 'binary')
+
+# rows per row group of export_parquet
+PARQUET_BLOCK_SIZE = 128 * 1024
+
+# the batches that are completely uploaded: the time range of a batch is only set once all its points are in
+# (see Uploader.chunked_upload), get_batch_list and get_select_string leave the others out
+COMPLETE_BATCHES = 'batches.end_time IS NOT NULL'
+
+# the tables of points, get_select_string joins them to batches for COMPLETE_BATCHES
+POINT_TABLES = ('batch_type_1', 'batch_type_2')
+
+# how the tables join, (table, table, condition)
+JOINS = [
+    ('batch_files', 'batches', 'batch_files.batch_id = batches.id'),
+    ('batch_files', 'django.upload_file', 'batch_files.file_id = django.upload_file.id'),
+    ('batch_type_1', 'batches', 'batch_type_1.batch_id = batches.id'),
+    ('batch_type_2', 'batches', 'batch_type_2.batch_id = batches.id'),
+    ('batch_types', 'batches', 'batches.batch_type_id = batch_types.id'),
+    ('batch_type_fields', 'batch_types', 'batch_type_fields.batch_type_id = batch_types.id'),
+    ('batch_type_fields', 'lookup_field_types', 'batch_type_fields.field_type = lookup_field_types.name'),
+    ('django.upload_file', 'django.upload_upload', 'django.upload_file.upload_id = django.upload_upload.id'),
+    ('django.upload_upload', 'django.user_user', 'django.upload_upload.user_id = django.user_user.id'),
+    ('django.upload_upload', 'django.upload_upload_sensors', 'django.upload_upload.id = django.upload_upload_sensors.upload_id'),
+    ('django.upload_upload_sensors', 'django.user_sensor', 'django.upload_upload_sensors.sensor_id = django.user_sensor.id'),
+]
+
+
+def make_join_graph(joins):
+    """
+    table -> {table it joins -> condition}
+    """
+    graph = {}
+    for t1, t2, condition in joins:
+        graph.setdefault(t1, {})[t2] = condition
+        graph.setdefault(t2, {})[t1] = condition
+    return graph
+
+
+JOIN_GRAPH = make_join_graph(JOINS)
+
+# the fewest metres in a degree of latitude, so range extents are never too small
+METRES_PER_DEGREE = 110000.0
+
+_cursor_ids = count()
+
+
+class SqlFragment(str):
+    """
+    A piece of sql with %s placeholders and the parameters that go in them, in order.
+    It's a str, so it goes wherever sql strings do; get_select_string and the queries pick up the parameters.
+    Adding it to a string or another fragment keeps the parameters, in placeholder order
+    """
+
+    def __new__(cls, sql_string, params=()):
+        fragment = super().__new__(cls, sql_string)
+        fragment.params = tuple(params)
+        return fragment
+
+    def __add__(self, other):
+        if not isinstance(other, str):
+            return NotImplemented
+        return SqlFragment(str(self) + other, self.params + getattr(other, 'params', ()))
+
+    def __radd__(self, other):
+        if not isinstance(other, str):
+            return NotImplemented
+        return SqlFragment(other + str(self), getattr(other, 'params', ()) + self.params)
+
+
+def fragment_params(parts):
+    """
+    The parameters of the SqlFragments among parts, in order (plain strings have none)
+    """
+    params = []
+    for part in parts:
+        params.extend(getattr(part, 'params', ()))
+    return params
+
+
+def sql_parameters(sql_string, parameters):
+    """
+    The parameters a statement runs with: the ones given, or else those of an SqlFragment.
+    Raises ValueError if an SqlFragment with parameters is given more, where they'd go is unknown
+    """
+    params = getattr(sql_string, 'params', None)
+    if params:
+        if parameters is not None:
+            raise ValueError("parameters given for an SqlFragment that has its own, put them in the fragment")
+        return params
+    return parameters
+
+
+@instrument.instrumented('query')
 def query(dsn_string, sql_string, parameters=None):
     """
-    Runs the query and returns an array of row-tuples
-    :inputs: dsn_string and an sql string, optional sql parameters
+    Runs the query on a pooled connection and returns an array of row-tuples.
+    Statements run often on a connection are prepared (see helpers.prepared)
+    :inputs: dsn_string and an sql string (or SqlFragment), optional sql parameters
     :outputs: an array of tuples
     """
 
-    conn = psyco.connect(dsn=dsn_string)
-    cur = conn.cursor()
-    cur.execute(sql_string, parameters)
+    with connection(dsn_string) as conn:
+        cur = conn.cursor()
+        with instrument.stage('execute'):
+            prepared.execute(cur, sql_string, sql_parameters(sql_string, parameters))
 
-    result_rows = cur.fetchall()
-    header = list(map(lambda col: col.name, cur.description))
+        with instrument.stage('fetch') as stage:
+            result_rows = cur.fetchall()
+            stage.add(rows_out=len(result_rows))
+        header = list(map(lambda col: col.name, cur.description))
+        cur.close()
 
-    conn.commit();
-    cur.close();
-    conn.close();
     return result_rows, header
 
 
+def cached_query(dsn_string, sql_string, parameters=None, extent=None):
+    """
+    query, with the result kept in querycache.cache. It's dropped once a batch intersecting extent
+    is uploaded by this process (or once evicted, or after the cache's ttl)
+    :inputs: dsn_string and an sql string, optional sql parameters, the (min_lon, min_lat, max_lon, max_lat)
+        of the points the result depends on, None if it can change with any batch (see poly_extent, range_extent)
+    :outputs: an array of tuples, the header
+    """
+    return querycache.cache.fetch(dsn_string, sql_string, sql_parameters(sql_string, parameters), extent,
+                                  lambda: query(dsn_string, sql_string, parameters))
+
+
+@contextmanager
+def server_cursor(dsn_string, sql_string, parameters=None, itersize=ITERSIZE):
+    """
+    A named (server-side) cursor that has run the query, for a with block.
+    Rows stay on the server until they're fetched, itersize at a time when iterating.
+    It holds a pooled connection until the block ends
+    """
+    with connection(dsn_string) as conn:
+        cur = conn.cursor(name='dbinterfacer_%d' % next(_cursor_ids))
+        cur.itersize = itersize
+        try:
+            cur.execute(sql_string, sql_parameters(sql_string, parameters))
+            yield cur
+        finally:
+            cur.close()
+
+
+def iter_rows(dsn_string, sql_string, parameters=None, itersize=ITERSIZE):
+    """
+    A generator of the row-tuples of the query, fetched from a server-side cursor itersize at a time,
+    so the whole result is never in memory (see query for all of it at once)
+    :inputs: dsn_string and an sql string, optional sql parameters, rows per round trip
+    """
+    with server_cursor(dsn_string, sql_string, parameters, itersize) as cur:
+        yield from cur
+
+
+def iter_row_blocks(dsn_string, sql_string, parameters=None, block_size=ITERSIZE):
+    """
+    A generator of lists of up to block_size row-tuples of the query, one round trip each
+    :inputs: dsn_string and an sql string, optional sql parameters, rows per list
+    """
+    with server_cursor(dsn_string, sql_string, parameters, block_size) as cur:
+        while True:
+            rows = cur.fetchmany(block_size)
+            if not rows:
+                break
+            yield rows
+
+
+def iter_arrays(dsn_string, sql_string, parameters=None, block_size=ITERSIZE, dtype=None):
+    """
+    A generator of numpy structured arrays of up to block_size rows of the query, one round trip each.
+    A block with NULLs is a masked array, with the NULLs masked (see block_array).
+    Needs numpy.
+    :inputs: dsn_string and an sql string, optional sql parameters, rows per array,
+        the dtype of the arrays (by default one field per column, named as the columns, see NUMPY_TYPES)
+    """
+    import numpy
+
+    with server_cursor(dsn_string, sql_string, parameters, block_size) as cur:
+        while True:
+            rows = cur.fetchmany(block_size)
+            if dtype is None:
+                # the description is only there once something is fetched
+                dtype = numpy.dtype([(col.name, NUMPY_TYPES.get(col.type_code, 'O')) for col in cur.description])
+            if not rows:
+                break
+            yield block_array(rows, dtype)
+
+
+def block_array(rows, dtype):
+    """
+    The rows as a numpy structured array, or as a masked array if any of them has a NULL, as numpy would
+    otherwise fail on a NULL in an integer field or quietly make it False or NaN in others.
+    Masked values are zero (None in object fields).
+    :inputs: list of row tuples, the numpy dtype
+    """
+    import numpy
+
+    columns = list(zip(*rows))
+    nullable = [i for i, values in enumerate(columns) if None in values]
+    if not nullable:
+        return numpy.array(rows, dtype=dtype)
+
+    data = numpy.zeros(len(rows), dtype=dtype)
+    mask = numpy.zeros(len(rows), dtype=[(name, '?') for name in dtype.names])
+    for i, name in enumerate(dtype.names):
+        if i in nullable:
+            nulls = numpy.fromiter((v is None for v in columns[i]), '?', len(rows))
+            mask[name] = nulls
+            data[name][~nulls] = [v for v in columns[i] if v is not None]
+        else:
+            data[name] = columns[i]
+    return numpy.ma.masked_array(data, mask=mask)
+
+
+def copy_query(dsn_string, sql_string, file, parameters=None, format='csv', header=False):
+    """
+    Writes the result of the query to a file with COPY (...) TO STDOUT, without making python rows.
+    The fastest way to export a lot of rows
+    :inputs: dsn_string and an sql string (without a final ';'), the file-like object to write to,
+        optional sql parameters, the COPY format ('csv', 'text' or 'binary'), whether csv gets a header line
+    :output: the number of rows
+    """
+    if format not in COPY_TO_FORMATS:
+        raise ValueError("format must be one of %s" % (COPY_TO_FORMATS,))
+
+    with connection(dsn_string) as conn:
+        cur = conn.cursor()
+        options = [sql.SQL('FORMAT {}').format(sql.SQL(format))]
+        if header:
+            options.append(sql.SQL('HEADER'))
+        copy_string = sql.SQL('COPY ({}) TO STDOUT WITH ({})').format(
+            sql.SQL(cur.mogrify(sql_string, sql_parameters(sql_string, parameters)).decode(encodings[conn.encoding])),
+            sql.SQL(', ').join(options))
+        cur.copy_expert(copy_string, file)
+        rows = cur.rowcount
+        cur.close()
+
+    return rows
+
+
+@contextmanager
+def column_blocks(dsn_string, sql_string, parameters=None, block_size=ITERSIZE):
+    """
+    The columns of the query and a generator of its rows as blocks of numpy arrays, for a with block,
+    streamed with a binary COPY (see helpers.copyexport). It holds a pooled connection until the block ends.
+    Needs numpy.
+    :inputs: dsn_string and an sql string (without a final ';'), optional sql parameters, rows per block
+    :output: the list of copyexport.ExportColumns, the generator of blocks
+    """
+    from .helpers import copyexport
+
+    with connection(dsn_string) as conn:
+        cur = conn.cursor()
+        select_string = cur.mogrify(sql_string, sql_parameters(sql_string, parameters)).decode(encodings[conn.encoding])
+        columns = copyexport.describe(cur, select_string)
+        blocks = copyexport.iter_copy_blocks(conn, cur, copyexport.copy_statement(select_string, columns),
+                                             columns, block_size)
+        try:
+            yield columns, blocks
+        finally:
+            blocks.close()
+            cur.close()
+
+
+def iter_columns(dsn_string, sql_string, parameters=None, block_size=ITERSIZE):
+    """
+    A generator of the result of the query in blocks of up to block_size rows, each a dict of
+    column name -> numpy array (a masked array if the column has nulls), see column_blocks.
+    Numerics come out as float64, geometries as WKB bytes and types without a numpy dtype as strings.
+    :inputs: dsn_string and an sql string, optional sql parameters, rows per block
+    """
+    with column_blocks(dsn_string, sql_string, parameters, block_size) as (_, blocks):
+        yield from blocks
+
+
+def query_columns(dsn_string, sql_string, parameters=None):
+    """
+    The whole result of the query as a dict of column name -> numpy array, see iter_columns
+    """
+    import numpy
+    from .helpers import copyexport
+
+    with column_blocks(dsn_string, sql_string, parameters) as (columns, blocks):
+        blocks = [copyexport.empty_block(columns)] + list(blocks)
+    return {c.name: (numpy.ma.concatenate if any(isinstance(b[c.name], numpy.ma.MaskedArray) for b in blocks)
+                     else numpy.concatenate)([b[c.name] for b in blocks]) for c in columns}
+
+
+def iter_record_batches(dsn_string, sql_string, parameters=None, block_size=ITERSIZE):
+    """
+    A generator of the result of the query as Arrow RecordBatches of up to block_size rows, see iter_columns.
+    Geometries are binary WKB. Needs pyarrow
+    """
+    from .helpers import copyexport
+
+    with column_blocks(dsn_string, sql_string, parameters, block_size) as (columns, blocks):
+        schema = copyexport.arrow_schema(columns)
+        for block in blocks:
+            yield copyexport.record_batch(block, schema)
+
+
+def export_parquet(dsn_string, sql_string, path, parameters=None, block_size=PARQUET_BLOCK_SIZE, compression='snappy'):
+    """
+    Writes the result of the query to a Parquet file a row group of block_size rows at a time, see iter_record_batches.
+    Geometry columns are WKB, with GeoParquet's metadata. Needs pyarrow
+    :inputs: dsn_string and an sql string, the path (or file-like object) to write to, optional sql parameters,
+        rows per row group, the Parquet compression
+    :output: the number of rows
+    """
+    import pyarrow
+    import pyarrow.parquet
+    from .helpers import copyexport
+
+    rows = 0
+    with column_blocks(dsn_string, sql_string, parameters, block_size) as (columns, blocks):
+        schema = copyexport.arrow_schema(columns)
+        with pyarrow.parquet.ParquetWriter(path, schema, compression=compression) as writer:
+            for block in blocks:
+                batch = copyexport.record_batch(block, schema)
+                writer.write_table(pyarrow.Table.from_batches([batch], schema=schema))
+                rows += batch.num_rows
+    return rows
+
+
 def get_select_string(outputs, tables, wheres):
     """
     Makes a full sql select statement (without a final ';')
     :inputs: 3 arrays
-      * tables - tables used in the query (all possible joins are done)
+      * tables - tables used in the query, joined along the shortest paths of JOINS
+          (the tables in between are added to the query)
       * wheres - an array of sql_boolean clauses, added to the WHERE part
       * outputs - which fields should be in the output (the SELECT part)
-     :output: a big SQL string
-    """
-
-    output_s = ','.join(outputs)
-    tables_s = ','.join(tables)
-
-    # TODO: joins have not been updated
-    tables.sort()
-    all_joins = {
-        'batch_files:batches' : 'batch_files.batch_id = batches.id',
-        'batch_files:django.upload_file' : 'batch_files.file_id = django.upload_file.id',
-        'batch_type_1:batches' : 'batch_type_1.batch_id = batches.id',
-        'batch_type_fields:batch_types' : 'batch_type_fields.batch_type_id = batch_types.id',
-        'batch_type_fields:lookup_field_types' : 'batch_type_fields.field_type = lookup_field_types.name',
-        'django.upload_file:django.upload_upload' : 'django.upload_file.upload_id = django.upload_upload.id',
-        'django.upload_upload:django.user_user' : 'django.upload_upload.user_id = django.user_user.id',
-        'django.upload_upload:django.upload_upload_sensors' : 'django.upload_upload.id = django.upload_upload_sensors.upload_id',
-        'django.upload_upload_sensors:django.user_sensor' : 'django.upload_upload_sensors.sensor_id = django.user_sensor.id',
-        'django.upload_upload_sensors:django.user_sensor' : 'django.upload_upload_sensors.sensor_id = django.user_sensor.id',
-    }
-
-    joins = []
-    for i, t1 in enumerate(tables):
-        for t2 in tables[i + 1:]:
-            combo = "{}:{}".format(t1, t2)
-            if combo in all_joins:
-                joins.append(all_joins[combo])
-    joins_s = " and ".join(joins)
+      Any of them can be SqlFragments (like the where_ builders make), plain strings are used as they are
+      (a literal % in one needs to be %% once a fragment has parameters)
+    Queries of POINT_TABLES only see the points of complete batches (COMPLETE_BATCHES)
+     :output: a big SQL string, an SqlFragment with the parameters of the parts in order
+    """
+    tables = list(tables)
+    wheres = list(wheres or [])
+    if any(t in POINT_TABLES for t in tables):
+        if 'batches' not in tables:
+            tables.append('batches')
+        wheres.append(COMPLETE_BATCHES)
+
+    select_s, joins_s = select_skeleton(tuple(outputs), tuple(tables))
 
     other_wheres_s = ""
     if wheres:
@@ -65,9 +379,69 @@ def get_select_string(outputs, tables, wheres):
     if where_s != '':
         where_s = "WHERE " + where_s
 
-    select_s = """ SELECT %s FROM %s %s""" % (output_s, tables_s, where_s,)
+    select_s = """%s %s""" % (select_s, where_s,)
+
+    return SqlFragment(select_s, fragment_params(list(outputs) + tables + wheres))
+
+
+@lru_cache(maxsize=1024)
+def select_skeleton(outputs, tables):
+    """
+    The SELECT ... FROM ... part of get_select_string and the join conditions of the tables, memoized
+    :input: tuples of the outputs and the tables
+    :output: the select string, the joins string
+    """
+    path_tables, joins = join_path(tables)
+    from_tables = list(tables) + [t for t in path_tables if t not in tables]
+    select_s = """ SELECT %s FROM %s""" % (','.join(outputs), ','.join(from_tables))
+    return select_s, " and ".join(joins)
 
-    return select_s
+
+def join_path(tables):
+    """
+    Connects the tables through JOIN_GRAPH, each one joined to the ones before it by the shortest path there is
+    (tables that can't be reached are left unjoined)
+    :input: the table names
+    :output: the tables on the paths (including the ones given), the join conditions in (table, table) order
+    """
+    tables = sorted(set(tables))
+    if not tables:
+        return [], []
+
+    connected = {tables[0]}
+    edges = set()
+    for table in tables[1:]:
+        if table in connected:
+            continue
+        path = shortest_path(connected, table)
+        if path is None:
+            connected.add(table)
+            continue
+        for t1, t2 in zip(path, path[1:]):
+            edges.add(tuple(sorted((t1, t2))))
+        connected.update(path)
+
+    return sorted(connected), [JOIN_GRAPH[t1][t2] for t1, t2 in sorted(edges)]
+
+
+def shortest_path(sources, target):
+    """
+    A shortest list of tables from one of sources to target along JOIN_GRAPH (breadth first), None if there isn't one
+    """
+    previous = {s: None for s in sources}
+    frontier = deque(sorted(sources))
+    while frontier:
+        table = frontier.popleft()
+        if table == target:
+            path = [table]
+            while previous[path[-1]] is not None:
+                path.append(previous[path[-1]])
+            return path[::-1]
+        for neighbour in sorted(JOIN_GRAPH.get(table, ())):
+            if neighbour not in previous:
+                previous[neighbour] = table
+                frontier.append(neighbour)
+    return None
 
 
 def where_point_in_poly(poly_points):
@@ -75,11 +449,11 @@ def where_point_in_poly(poly_points):
     a where bool, where geom is contained in the polygon made of the inputted points
     :input: an array of tuples [(lon, lat), (lon, lat)...]. THE LAST TUPLE SHOULD BE THE SAME
         AS THE FIRST
-    :output: a where clause string
+    :output: a where clause SqlFragment, the polygon is a parameter
     """
     poly_points_string = map("{0[0]} {0[1]}".format, poly_points)
     linestring = "LINESTRING(" + ",".join(poly_points_string) + ")"
-    where = "ST_Contains( ST_Polygon( ST_GeomFromText('" + linestring + "'), 4326), geom)"
+    where = SqlFragment("ST_Contains( ST_Polygon( ST_GeomFromText(%s), 4326), geom)", [linestring])
 
     return where
 
@@ -88,14 +462,41 @@ def where_point_within_range(point, range):
     """
     a where bool, where geom is within the range (metres)
     :input: point - (lon, lat), range - positive number
-    :output: a where clause string
+    :output: a where clause SqlFragment, the point and range are parameters
+    """
+    radius_string = "ST_DWithin(ST_SetSRID(ST_MakePoint(%s, %s), 4326) ::geography, geom, %s)"
+    return SqlFragment(radius_string, [point[0], point[1], range])
+
+
+def poly_extent(poly_points):
+    """
+    The extent of a where_point_in_poly polygon, for cached_query
+    :input: an array of tuples [(lon, lat), (lon, lat)...]
+    :output: (min_lon, min_lat, max_lon, max_lat)
+    """
+    lons, lats = zip(*poly_points)
+    return (float(min(lons)), float(min(lats)), float(max(lons)), float(max(lats)))
+
+
+def range_extent(point, range):
+    """
+    A box around a where_point_within_range circle, for cached_query
+    :input: point - (lon, lat), range - positive number (metres)
+    :output: (min_lon, min_lat, max_lon, max_lat)
     """
-    radius_string = "ST_DWithin(ST_PointFromText('POINT({p[0]} {p[1]})', 4326) ::geography, geom, {r})"
-    radius_string = radius_string.format(p=point, r=range)
-    return radius_string
+    lon, lat = float(point[0]), float(point[1])
+    d_lat = range / METRES_PER_DEGREE
+    if abs(lat) + d_lat >= 90:
+        return (-180.0, max(lat - d_lat, -90.0), 180.0, min(lat + d_lat, 90.0))
+    d_lon = d_lat / math.cos(math.radians(abs(lat) + d_lat))
+    return (lon - d_lon, lat - d_lat, lon + d_lon, lat + d_lat)
 
 
-def get_batch_list(dsn_string, where_list=[]):
+def get_batch_list(dsn_string, where_list=[], cached=False, extent=None):
+    """
+    The start_time, end_time and id of the complete batches matching where_list,
+    from the cache if cached (extent as in cached_query)
+    """
     select = get_select_string(
         [
             'batches.start_time',
@@ -103,13 +504,100 @@ def get_batch_list(dsn_string, where_list=[]):
             'batches.id',
         ],
         ['batches'],
-        where_list)
+        list(where_list) + [COMPLETE_BATCHES])
+    if cached:
+        return cached_query(dsn_string, select, extent=extent)
     return query(dsn_string, select)
 
 
-def get_batch_bbox(dsn_string, batch_id):
+def get_batch_bbox(dsn_string, batch_id, cached=False):
+    """
+    The min lon, min lat, max lon and max lat of a batch, from the cache if cached
+    """
     select = get_select_string(
         ['ST_Xmin(bbox)', 'ST_Ymin(bbox)', 'ST_Xmax(bbox)', 'ST_Ymax(bbox)'],
         ['batches'],
-        ['batches.id = %s'])
-    return query(dsn_string, select, parameters=(batch_id, ))
+        [SqlFragment('batches.id = %s', [batch_id])])
+    if cached:
+        return cached_query(dsn_string, select)
+    return query(dsn_string, select)
+
+
+def get_depth_tile(dsn_string, batch_type_name, z, x, y, batch_ids=None, cells_per_side=tiles.CELLS_PER_SIDE,
+                   cached=True):
+    """
+    The points of a batch type in a web mercator tile, decimated to a grid of cells_per_side squared cells:
+    a row per cell with points, of the cell's centre and the count, min, mean and max depth of its points.
+    Without batch_ids only the complete batches are included (see COMPLETE_BATCHES).
+    From tiles.cache if cached, until a batch landing on the tile is uploaded
+    :input: dsn_string, the batch type, the tile's zoom, column and row, the ids of the batches to include
+        (None for all of them), the grid size
+    :output: rows of (lon, lat, n, min_depth, mean_depth, max_depth), the header
+    """
+    table = batchtypes.registry.get(dsn_string, batch_type_name).ref_table
+    select = SqlFragment(*tiles.bins_sql(table, z, x, y, batch_ids, cells_per_side))
+    if not cached:
+        return query(dsn_string, select)
+    return tiles.cache.fetch_tile(dsn_string, 'bins', table, z, x, y, batch_ids, cells_per_side,
+                                  lambda: query(dsn_string, select))
+
+
+def get_depth_mvt(dsn_string, batch_type_name, z, x, y, batch_ids=None, cells_per_side=tiles.CELLS_PER_SIDE,
+                  cached=True):
+    """
+    get_depth_tile as a Mapbox vector tile (ST_AsMVT), a layer of a point per cell
+    with n, min_depth, mean_depth and max_depth
+    :output: the tile's bytes
+    """
+    table = batchtypes.registry.get(dsn_string, batch_type_name).ref_table
+    select = SqlFragment(*tiles.mvt_sql(table, z, x, y, batch_ids, cells_per_side))
+    if cached:
+        rows, _ = tiles.cache.fetch_tile(dsn_string, 'mvt', table, z, x, y, batch_ids, cells_per_side,
+                                         lambda: query(dsn_string, select))
+    else:
+        rows, _ = query(dsn_string, select)
+    return bytes(rows[0][0] or b'')
+
+
+def get_batches_intersecting(dsn_string, bbox):
+    """
+    The ids of the batches whose bbox intersects bbox, from bboxindex.registry,
+    or the database while the index is cold
+    :input: dsn_string, (min_lon, min_lat, max_lon, max_lat)
+    :output: a sorted list of batch ids
+    """
+    index = bboxindex.registry.get(dsn_string)
+    if index is not None:
+        return index.intersecting(bbox)
+    select = SqlFragment('SELECT id FROM batches WHERE bbox && ST_MakeEnvelope(%s, %s, %s, %s, 4326) ORDER BY id',
+                         bbox)
+    return [row[0] for row in query(dsn_string, select)[0]]
+
+
+def get_batches_containing(dsn_string, bbox):
+    """
+    The ids of the batches whose bbox contains bbox, as get_batches_intersecting
+    :input: dsn_string, (min_lon, min_lat, max_lon, max_lat), the same twice for a point
+    :output: a sorted list of batch ids
+    """
+    index = bboxindex.registry.get(dsn_string)
+    if index is not None:
+        return index.containing(bbox)
+    select = SqlFragment('SELECT id FROM batches WHERE bbox ~ ST_MakeEnvelope(%s, %s, %s, %s, 4326) ORDER BY id',
+                         bbox)
+    return [row[0] for row in query(dsn_string, select)[0]]
+
+
+def get_nearest_batches(dsn_string, point, k=1):
+    """
+    The ids of the k batches with bboxes nearest to the point (in degrees), as get_batches_intersecting
+    :input: dsn_string, (lon, lat), k
+    :output: a list of batch ids, nearest first
+    """
+    index = bboxindex.registry.get(dsn_string)
+    if index is not None:
+        return index.nearest(point, k)
+    select = SqlFragment('SELECT id FROM batches WHERE bbox IS NOT NULL '
+                         'ORDER BY bbox <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326), id LIMIT %s',
+                         [point[0], point[1], k])
+    return [row[0] for row in query(dsn_string, select)[0]]
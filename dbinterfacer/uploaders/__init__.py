@@ -1,4 +1,9 @@
+"""
+The uploaders. Their optional and slow to import dependencies (pynmea2, ijson, multiprocessing...)
+are imported by the methods that use them, so importing the package stays cheap.
+"""
 from .uploader import Uploader
 from .nmea import NmeaUploader
 from .geojson import GeoJsonUploader
 from .cidco import CidcoUploader
+from .ingest import BatchIngest, IngestJob, ingest_files
@@ -1,28 +1,40 @@
-from ..uploaders import Uploader
+from .uploader import Uploader
+from ..helpers.timestamps import cidco_column_micros
 
-from decimal import Decimal
-from datetime import datetime
+from array import array
 
 
 class CidcoUploader(Uploader):
-
-    def parse_file(self, file):
-        # skip 2 header lines
-        next(file, None)
-        next(file, None)
-
-        for row in file:
-            # decode from byte to string and split
-            entries = row.decode('utf-8').split(';')
-            p = self.point_model.generate_point()
-            p['time'] = datetime.strptime(entries[0], '%Y/%m/%d %H:%M:%S.%f')
-            p['latitude'] = Decimal(entries[1])
-            p['longitude'] = Decimal(entries[2])
-            p['depth'] = Decimal(entries[3])
-            p['northing'] = Decimal(entries[4])
-            p['easting'] = Decimal(entries[5])
-
-            self.add_point(p)
-
-        super(CidcoUploader, self).parse_file(file)
+    """
+    Uploads CIDCO processed sounding exports: 2 header lines, then
+    'YYYY/MM/DD HH:MM:SS.fff;latitude;longitude;depth;northing;easting' rows
+    """
+
+    header_lines = 2
+    # rows don't depend on each other
+    columnar = True
+    splittable = True
+
+    # the fields of a row, in order
+    row_fields = ('time', 'latitude', 'longitude', 'depth', 'northing', 'easting')
+
+    def iter_columns(self, blocks):
+        """
+        Splits each block into its fields all at once and takes the columns out of the flat list of fields,
+        numbers are converted straight from the bytes and times a column at a time
+        """
+        width = len(self.row_fields)
+        for block in blocks:
+            rows = bytes(block).split(b'\n')
+            if rows[-1] == b'':
+                rows.pop()
+            entries = b';'.join(rows).split(b';')
+            if len(entries) != width * len(rows):
+                bad = next(r for r in rows if r.count(b';') != width - 1)
+                raise ValueError("Can't parse the CIDCO row %r" % bad)
+
+            columns = {'time': cidco_column_micros(entries[0::width])}
+            for i, field in enumerate(self.row_fields[1:], 1):
+                columns[field] = array('d', map(float, entries[i::width]))
+            yield columns
 
@@ -1,19 +1,41 @@
-from ..uploaders import Uploader
-import ijson
-from datetime import datetime
+from .uploader import Uploader
+from ..helpers.timestamps import parse_iso8601
+import importlib
+from functools import lru_cache
+
+# ijson backends, fastest first
+IJSON_BACKENDS = ('yajl2_c', 'yajl2_cffi', 'yajl2', 'python')
+
+
+@lru_cache(maxsize=None)
+def fastest_ijson_backend():
+    """
+    The fastest ijson backend that can be imported (yajl2_c needs the C extension and libyajl),
+    looked for on first use
+    """
+    for name in IJSON_BACKENDS:
+        try:
+            return importlib.import_module('ijson.backends.' + name)
+        except ImportError:
+            continue
+    raise ImportError("No ijson backend is available")
+
 
 class GeoJsonUploader(Uploader):
 
-    def parse_file(self, file):
+    # the ijson backend, fastest_ijson_backend's if None
+    ijson = None
+
+    def iter_points(self, file):
+        ijson = self.ijson or fastest_ijson_backend()
         json_points = ijson.items(file, 'features.item')
 
         for jp in json_points:
             p = self.point_model.generate_point()
-            time = datetime.strptime(jp['properties']['time'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            p['time'] = time
-            p['depth'] = jp['properties']['depth']
-            p['longitude'] = jp['geometry']['coordinates'][0]
-            p['latitude'] = jp['geometry']['coordinates'][1]
-            self.add_point(p)
-
-        super(GeoJsonUploader, self).parse_file(file)
+            properties = jp['properties']
+            coordinates = jp['geometry']['coordinates']
+            p['time'] = parse_iso8601(properties['time'])
+            p['depth'] = properties['depth']
+            p['longitude'] = coordinates[0]
+            p['latitude'] = coordinates[1]
+            yield p
@@ -0,0 +1,163 @@
+"""
+Uploads many files at once. Files are parsed in a pool of processes while the COPY data they've finished so far
+is streamed to the database over pooled connections, so parsing and database I/O overlap.
+Each file is its own batch, uploaded in its own transaction: a file that fails is rolled back and reported,
+the others are still committed.
+"""
+import queue
+from copy import copy
+from collections import namedtuple
+from .uploader import RANGE_FIELDS
+from ..helpers import sourcefile
+from ..helpers.pool import connection
+from ..helpers.copystream import ChunkStream
+
+# how long the COPY waits for a chunk before checking that its parser is still alive
+CHUNK_POLL_SECONDS = 1.0
+
+IngestJob = namedtuple('IngestJob', ['uploader_class', 'source', 'batch_type_name', 'file_ids'])
+IngestJob.__new__.__defaults__ = ((),)
+
+IngestResult = namedtuple('IngestResult', ['job', 'batch_id', 'rows_parsed', 'rejections', 'error'])
+
+
+def parse_job(uploader, source, batch_id, chunks):
+    """
+    Parses a file in a worker process of BatchIngest, putting its COPY data on the chunks queue as it's made.
+    The end is marked with None, even when parsing fails.
+    :input: the uploader (with nothing parsed yet), the path of the file, the batch_id, the queue
+    :output: the ranges of the valid points, the Rejections, the number of points parsed
+    """
+    try:
+        ranges = {f: None for f in RANGE_FIELDS}
+        with sourcefile.open_source(source) as file:
+            for chunk in uploader.iter_copy_chunks(file, batch_id, ranges):
+                chunks.put(chunk)
+        return ranges, uploader.rejections, uploader.rows_parsed
+    finally:
+        chunks.put(None)
+
+
+class IngestReport:
+    """
+    The results of BatchIngest.run, one IngestResult per job in the order of the jobs
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def batch_ids(self):
+        return [r.batch_id for r in self.results if r.error is None]
+
+    @property
+    def failures(self):
+        return [r for r in self.results if r.error is not None]
+
+    def __repr__(self):
+        return '<IngestReport %d uploaded, %d failed>' % (len(self.batch_ids), len(self.failures))
+
+
+class BatchIngest:
+    """
+    Uploads a list of IngestJobs (uploader class, file path, batch type name, file ids) as new batches.
+    Up to `workers` jobs are in flight at once: each has a process parsing it and a thread holding
+    a pooled connection that COPYs the chunks as they come. The queue between them holds at most
+    queue_size chunks, so a parser waits for a slow COPY rather than filling memory.
+    """
+
+    def __init__(self, dsn_string, workers=2, queue_size=4, **uploader_options):
+        """
+        :input:
+            - dsn_string
+            - workers, how many files are parsed and uploaded at once
+            - queue_size, how many chunks of COPY data can wait for the database per file
+            - the rest are passed to the uploaders (chunk_size, copy_format)
+        """
+        self.dsn_string = dsn_string
+        self.workers = workers
+        self.queue_size = queue_size
+        self.uploader_options = uploader_options
+
+    def run(self, jobs):
+        """
+        Uploads every job, returns an IngestReport. Errors don't stop the other jobs, they're in the report
+        :input: an iterable of IngestJobs (or tuples of the same fields)
+        :output: IngestReport
+        """
+        from multiprocessing import Manager
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        jobs = [IngestJob(*job) for job in jobs]
+        with Manager() as manager, \
+                ProcessPoolExecutor(max_workers=self.workers) as parsers, \
+                ThreadPoolExecutor(max_workers=self.workers) as copiers:
+            futures = [copiers.submit(self.run_job, job, parsers, manager.Queue(self.queue_size)) for job in jobs]
+            return IngestReport([f.result() for f in futures])
+
+    def run_job(self, job, parsers, chunks):
+        """
+        Uploads one job in its own transaction, in a thread of run
+        :input: the IngestJob, the process pool, a queue for the chunks
+        :output: IngestResult
+        """
+        uploader = job.uploader_class(self.dsn_string, job.batch_type_name, **self.uploader_options)
+        try:
+            with connection(self.dsn_string) as conn:
+                cur = conn.cursor()
+                batch_id = uploader.insert_empty_batch(cur)
+                uploader.link_files_to_batch(cur, batch_id, job.file_ids)
+
+                # the worker gets a copy with the batch type already looked up
+                worker = copy(uploader)
+                parsed = parsers.submit(parse_job, worker, job.source, batch_id, chunks)
+                try:
+                    uploader.copy_points(cur, ChunkStream(self.iter_chunks(chunks, parsed)), uploader.get_header())
+                except Exception:
+                    # a parser that failed midway can make the COPY fail too, its error is the one to report
+                    self.drain(chunks, parsed)
+                    if parsed.exception() is not None:
+                        raise parsed.exception()
+                    raise
+
+                ranges, uploader.rejections, uploader.rows_parsed = parsed.result()
+                uploader.set_ranges(ranges)
+                uploader.update_batch_ranges(cur, batch_id)
+                cur.close()
+        except Exception as e:
+            return IngestResult(job, None, uploader.rows_parsed, uploader.rejections, e)
+
+        uploader.invalidate_cached_queries()
+        uploader.index_batch(batch_id)
+        return IngestResult(job, batch_id, uploader.rows_parsed, uploader.rejections, None)
+
+    def iter_chunks(self, chunks, parsed):
+        """
+        A generator of the chunks a parser puts on the queue, until its end marker.
+        Stops early if the parser's process died without one
+        """
+        while True:
+            try:
+                chunk = chunks.get(timeout=CHUNK_POLL_SECONDS)
+            except queue.Empty:
+                if parsed.done():
+                    return
+                continue
+            if chunk is None:
+                return
+            yield chunk
+
+    def drain(self, chunks, parsed):
+        """
+        Throws away what's left on the queue (when the COPY failed), so the parser isn't stuck on a full queue
+        """
+        for _ in self.iter_chunks(chunks, parsed):
+            pass
+
+
+def ingest_files(dsn_string, jobs, **kwargs):
+    """
+    Uploads a list of IngestJobs, see BatchIngest
+    :output: IngestReport
+    """
+    return BatchIngest(dsn_string, **kwargs).run(jobs)
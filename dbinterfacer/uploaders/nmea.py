@@ -1,6 +1,7 @@
-from ..uploaders import Uploader
-import pynmea2
-from datetime import datetime
+from .uploader import Uploader
+from ..helpers.interpolation import PositionInterpolator
+from ..helpers import nmeatokenizer, filechunks, sourcefile, timestamps
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
 
@@ -9,46 +10,114 @@ class NmeaUploader(Uploader):
     Class for upload NMEA files. Uploads only: time, lat, lon, depth
     """
 
-    def parse_file(self, file):
-        input = file.__iter__()
+    all_sentences = ("$GPGGA",
+                    "$GPGSA",
+                    "$GPRMC",
+                    "$GPVTG",
+                    "$PADBT",
+                    "$PTNTHPR",
+                    "$STATUS",
+                    '$SDDBT')
+    # parsed straight from the bytes by nmeatokenizer
+    rmc_sentences = (b"$GPRMC",)
+    dbt_sentences = (b"$PADBT", b'$SDDBT')
+    # RMC and DBT from other talkers, parsed with pynmea2 (imported when a file is parsed, it's slow to import)
+    fallback_sentences = (b"$GNRMC", b'$IIDBT')
+
+    # depths are interpolated between fixes, iter_range_points reads past both ends for them
+    splittable = True
+    # how far before a range to start looking for fixes
+    lead_in_bytes = 64 * 1024
+
+    def iter_points(self, file):
+        import pynmea2
+
         streamreader = pynmea2.NMEAStreamReader()
+        positions = PositionInterpolator()
+
+        for l in sourcefile.iter_lines(file):
+            self.read_line(l, positions, streamreader)
+
+            # interpolate in batches, depths still waiting for fixes don't count towards the next one
+            if positions.new_depths >= self.chunk_size:
+                yield from self.make_depth_points(positions.resolve())
 
-        depth_queue = []
-        self.prev_gps, self.next_gps = (None, None)
+        yield from self.make_depth_points(positions.resolve(final=True))
 
+    def iter_range_points(self, file, start, end):
+        """
+        The depths logged in [start, end) need the fixes around them, which can be on the other side of
+        either end: the fixes of a lead-in before start (at least two reorder windows of them) are read first,
+        and the fixes after end are read until no later one can move a depth of the range.
+        Each depth is then placed with the same fixes as when the whole file is parsed at once.
+        """
+        import pynmea2
 
-        all_sentences = ("$GPGGA",
-                        "$GPGSA",
-                        "$GPRMC",
-                        "$GPVTG",
-                        "$PADBT",
-                        "$PTNTHPR",
-                        "$STATUS",
-                        '$SDDBT')
-        accepted_sentences = ("$GPRMC", "$PADBT",'$SDDBT')
+        streamreader = pynmea2.NMEAStreamReader()
+
+        lead_in = self.lead_in_bytes
+        while True:
+            positions = PositionInterpolator()
+            lead_start = filechunks.align_to_line(file, start - lead_in)
+            for l in filechunks.iter_lines(file, lead_start, start):
+                self.read_line(l, positions, streamreader, depths=False)
+            if lead_start == 0 or positions.fix_span() > 2 * positions.reorder_window:
+                break
+            lead_in *= 4
+
+        for l in filechunks.iter_lines(file, start, end):
+            self.read_line(l, positions, streamreader)
+            if positions.new_depths >= self.chunk_size:
+                yield from self.make_depth_points(positions.resolve())
+
+        yield from self.make_depth_points(positions.resolve())
+        if not positions.settled():
+            for l in filechunks.iter_lines(file, end):
+                if self.read_line(l, positions, streamreader, depths=False) and positions.settled():
+                    break
+
+        yield from self.make_depth_points(positions.resolve(final=True))
+
+    def read_line(self, line, positions, streamreader, depths=True):
+        """
+        Adds the fix or depth logged on a line to positions
+        :input: the line, the PositionInterpolator, the pynmea2 stream reader, False to skip depths
+        :output: True if it was a fix
+        """
+        try:
+            time, data = line.split(b" ")
+        except Exception as e:
+            return False
+
+        if data.startswith(self.rmc_sentences):
+            fix = nmeatokenizer.parse_rmc(data)
+            if fix is not None:
+                positions.add_fix(*fix)
+                return True
+
+        elif data.startswith(self.dbt_sentences):
+            if depths:
+                depth = nmeatokenizer.parse_dbt(data)
+                if depth is not None:
+                    positions.add_depth(timestamps.time_of_day(time), depth)
+
+        elif data.startswith(self.fallback_sentences):
+            import pynmea2
 
-        for l in input:
-            l = l.decode('utf-8')
-            if l == '\n':
-                continue
             try:
-                time, data = l.split(" ")
-            except Exception as e:
-                continue
-            if data.startswith(accepted_sentences):
-                for msg in streamreader.next(data):
-                    if isinstance(msg, pynmea2.RMC):
-                        self.update_gps(msg)
-                        # try processing depth msgs
-                        if len(depth_queue) > 0:
-                            ready_depth_points = self.make_depth_points(depth_queue)
-                            for p in ready_depth_points:
-                                self.add_point(p)
-
-                    if isinstance(msg, pynmea2.types.proprietary.adb.ADBT) or isinstance(msg, pynmea2.types.talker.DBT):
-                        depth_queue.append((msg, time))
-
-        super(NmeaUploader, self).parse_file(file)
+                messages = list(streamreader.next(data.decode('utf-8')))
+            except (pynmea2.ParseError, UnicodeDecodeError):
+                return False
+            is_fix = False
+            for msg in messages:
+                if isinstance(msg, pynmea2.RMC):
+                    is_fix = self.add_fix(positions, msg) or is_fix
+
+                if depths and isinstance(msg, pynmea2.types.talker.DBT) and msg.depth_meters is not None:
+                    positions.add_depth(timestamps.time_of_day(time), msg.depth_meters)
+            return is_fix
+
+        return False
 
     def rmc_to_point(self, m):
 
@@ -62,56 +131,41 @@ class NmeaUploader(Uploader):
         return point
 
 
-    def update_gps(self, msg):
-        msg.time = datetime.combine(msg.datestamp, msg.timestamp)
-        msg.lat_r = NmeaUploader.nmea_l_to_dec(msg.lat, msg.lat_dir)
-        msg.lon_r = NmeaUploader.nmea_l_to_dec(msg.lon, msg.lon_dir)
-        self.prev_gps = self.next_gps
-        self.next_gps = msg
-
-
-    def make_depth_points(self, depth_queue):
-        # try determining locations of depth points
-        ready_messages = self.calculate_locations(depth_queue)
+    def add_fix(self, positions, msg):
+        """
+        Adds the time and position of an RMC message to the interpolator, skips ones without a fix
+        :output: True if it was added
+        """
+        if msg.datestamp is None or msg.timestamp is None or msg.lat == '' or msg.lon == '':
+            return False
+        time = datetime.combine(msg.datestamp, msg.timestamp)
+        # newer pynmea2 gives the time in UTC, to_micros takes naive UTC
+        if time.tzinfo is not None:
+            time = time.astimezone(timezone.utc).replace(tzinfo=None)
+        lat = nmeatokenizer.nmea_l_to_float(msg.lat, msg.lat_dir)
+        lon = nmeatokenizer.nmea_l_to_float(msg.lon, msg.lon_dir)
+        positions.add_fix(timestamps.to_micros(time), lat, lon)
+        return True
+
+
+    def make_depth_points(self, resolved):
+        """
+        Makes points out of the lists returned by PositionInterpolator.resolve
+        """
+        times, lats, lons, depths = resolved
 
         ready_points = []
-        for m in ready_messages:
+        for time, lat, lon, depth in zip(times, lats, lons, depths):
             point = self.point_model.generate_point()
-            point['time'] = m.time
-            point['latitude'] = m.lat_r
-            point['longitude'] = m.lon_r
-            point['depth'] = m.depth_meters
+            point['time'] = timestamps.EPOCH + timedelta(microseconds=time)
+            point['latitude'] = Decimal(lat)
+            point['longitude'] = Decimal(lon)
+            point['depth'] = depth
             ready_points.append(point)
 
         return ready_points
 
 
-    def calculate_locations(self, depth_queue):
-        if self.prev_gps == None or self.next_gps == None:
-            return []
-
-        time_delta = self.next_gps.time - self.prev_gps.time
-        lat_delta = self.next_gps.lat_r - self.prev_gps.lat_r
-        lon_delta = self.next_gps.lon_r - self.prev_gps.lon_r
-
-        results = []
-        for i in range(len(depth_queue)):
-            (msg, time_string) = depth_queue.pop(0)
-            time_obj = datetime.strptime(time_string, "%H:%M:%S.%f").time()
-            time = datetime.combine(self.prev_gps.datestamp, time_obj)
-            if time > self.next_gps.time:
-                depth_queue.append((msg, time_string))
-                continue
-            time_d = time - self.prev_gps.time
-            time_ratio = time_d / time_delta
-            msg.time = time
-            msg.lat_r = lat_delta * Decimal(time_ratio) + self.prev_gps.lat_r
-            msg.lon_r = lon_delta * Decimal(time_ratio) + self.prev_gps.lon_r
-            results.append(msg)
-
-        return results
-
-
     def nmea_l_to_dec(nmea_real, compass):
         """
         Converts a string of 'dddmm.mmmmmmm' and 'D' (N,E,S,W)
@@ -121,10 +175,4 @@ class NmeaUploader(Uploader):
         :param compass: a char one of [N,E,S,W]
         :returns: a Decimal
         """
-        nmea_real = float(nmea_real)
-        degrees = int(nmea_real / 100)
-        minutes = nmea_real % 100
-        result = degrees + minutes / 60.0
-        if compass == 'W' or compass == 'S':
-            result = -1 * result
-        return Decimal(result)
+        return Decimal(nmeatokenizer.nmea_l_to_float(nmea_real, compass))
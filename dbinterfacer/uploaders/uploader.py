@@ -1,9 +1,92 @@
-from io import StringIO
-from functools import reduce
-import psycopg2 as psyco        # pg driver
-import psycopg2.extras
-from ..helpers.exceptions import NoBatchTypeException
-from ..helpers.pointmodel import Point_Model
+from io import StringIO, BytesIO
+from itertools import islice, repeat
+from array import array
+from copy import copy
+from psycopg2 import sql
+from ..helpers.exceptions import NoPointsException
+from ..helpers import batchtypes, querycache, prepared, bboxindex, dedup, instrument
+from ..helpers.pointmodel import Rejections
+from ..helpers.pointbuffer import PointBuffer
+from ..helpers.copystream import ChunkStream, render_text
+from ..helpers.pgbinary import BinaryEncoder
+from ..helpers import filechunks, sourcefile, checkpoint
+from ..helpers.pool import connection
+from ..query import SqlFragment
+
+# how much COPY asks for from the file-like object at a time
+COPY_BUFFER_SIZE = 64 * 1024
+
+# the fields the time range and bbox of a batch come from
+RANGE_FIELDS = ['time', 'latitude', 'longitude']
+
+# how many points chunked_upload COPYs per transaction by default
+COMMIT_SIZE = 500000
+
+
+def merge_ranges(current, new):
+    """
+    Widens the [min, max] ranges in current so they include the ranges in new.
+    Either can have None for a field with no values yet
+    """
+    for key in current:
+        if new[key] is None:
+            continue
+        if current[key] is None:
+            current[key] = list(new[key])
+        else:
+            current[key] = [min(current[key][0], new[key][0]), max(current[key][1], new[key][1])]
+    return current
+
+
+def skip_points(chunks, n_points, ranges):
+    """
+    The PointBuffers of an iterable after its first n_points points, which are dropped,
+    and ranges is updated with them (see merge_ranges). A chunk with the n_points-th point is cut after it
+    """
+    for chunk in chunks:
+        if n_points <= 0:
+            yield chunk
+            continue
+        merge_ranges(ranges, chunk.ranges(RANGE_FIELDS))
+        size = len(chunk)
+        if n_points < size:
+            chunk.compress(array('b', [0]) * n_points + array('b', [1]) * (size - n_points))
+            yield chunk
+        n_points -= size
+    if n_points > 0:
+        raise ValueError("The file has %d fewer valid points than were already committed" % n_points)
+
+
+def take_points(first, chunks, n_points, progress):
+    """
+    A generator of first and then chunks from the iterator chunks until they add up to at least n_points,
+    counting them in progress['points']
+    """
+    chunk = first
+    total = 0
+    while chunk is not None:
+        yield chunk
+        total += len(chunk)
+        progress['points'] += len(chunk)
+        if total >= n_points:
+            return
+        chunk = next(chunks, None)
+
+
+def parse_range(uploader, path, start, end):
+    """
+    Parses the lines of path starting in [start, end), in a worker process of Uploader.parse_file.
+    :input: the uploader (with an empty points buffer), the path, the byte range
+    :output: the PointBuffer of valid points, their ranges, the Rejections, the number of points parsed
+    """
+    with open(path, 'rb') as file:
+        if uploader.columnar:
+            file.seek(start)
+            for columns in uploader.iter_columns(sourcefile.iter_blocks(file, end=end)):
+                uploader.add_columns(columns)
+        else:
+            uploader.add_all(uploader.iter_range_points(file, start, end))
+    return uploader.points, uploader.points.ranges(RANGE_FIELDS), uploader.rejections, uploader.rows_parsed
 
 
 class Uploader:
@@ -12,20 +95,60 @@ class Uploader:
     specific parser. This class initalizes the point model and interacts with the database.
     """
 
-    def __init__(self, dsn_string, batch_type_name):
+    COPY_FORMATS = ('text', 'binary')
+
+    # lines before the first data line of a file
+    header_lines = 0
+    # whether the subclass parses blocks of lines a column at a time with iter_columns
+    columnar = False
+    # whether iter_range_points is implemented (or the subclass is columnar),
+    # so files can be parsed by several processes
+    splittable = False
+    # roughly how much of the file each process is given at a time
+    split_bytes = 4 * 2 ** 20
+
+    # attributes that are only set up when first needed, so making an uploader doesn't touch the database
+    LAZY_ATTRIBUTES = ('batch_type_id', 'ref_table', 'point_model', 'points')
+
+    def __init__(self, dsn_string, batch_type_name, chunk_size=10000, copy_format='text', workers=1):
         """
-        initalizes values and point_model
+        initalizes values, the point_model is looked up when it's first needed
         :input:
             - dsn_string
             - the name of the batch_type the point_model is to be based off
                 (should match the name of a type in the database)
+            - chunk_size, how many points stream_upload holds in memory at once
+            - copy_format, 'text' (tab-delimited) or 'binary' (PostgreSQL's binary COPY format,
+                the columns of ref_table must then match the point_model types exactly)
+            - workers, how many processes parse_file uses for files that can be split
         """
+        if copy_format not in self.COPY_FORMATS:
+            raise ValueError("copy_format must be one of %s" % (self.COPY_FORMATS,))
 
         self.dsn_string = dsn_string
         self.batch_type_name = batch_type_name
-        self.points = []
-        self.set_ref_table_and_fields()
-
+        self.chunk_size = chunk_size
+        self.copy_format = copy_format
+        self.workers = workers
+        # the points the parser made so far, and why the invalid ones were dropped
+        self.rows_parsed = 0
+        self.rejections = Rejections()
+        # how many points drop_duplicates dropped
+        self.duplicates_dropped = 0
+
+    def __getattr__(self, name):
+        """
+        Looks up the batch type (set_ref_table_and_fields) or makes the points buffer on first use
+        """
+        if name not in self.LAZY_ATTRIBUTES:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        if name == 'points':
+            self.points = PointBuffer(self.point_model)
+        else:
+            self.set_ref_table_and_fields()
+        return self.__dict__[name]
+
+    @instrument.instrumented('upload')
     def upload(self, file_ids):
         """
         Makes a new batch and uploads all of the points. Also connects files to batchself.
@@ -34,131 +157,561 @@ class Uploader:
         :output: int - id of batch
         """
 
-        conn = psyco.connect(dsn=self.dsn_string)
-        cur = conn.cursor()
+        with connection(self.dsn_string) as conn:
+            cur = conn.cursor()
+
+            batch_id = self.insert_batch(cur)
+            self.link_files_to_batch(cur, batch_id, file_ids)
 
-        batch_id = self.insert_batch(cur)
-        self.link_files_to_batch(cur, batch_id, file_ids)
+            if self.copy_format == 'binary':
+                copy_file, header = self.make_binary(batch_id)
+            else:
+                copy_file, header = self.make_csv(batch_id)
+            self.copy_points(cur, copy_file, header)
+            cur.close()
+
+        self.invalidate_cached_queries()
+        self.index_batch(batch_id)
+        return batch_id
 
-        copy_file, header = self.make_csv(batch_id)
-        cur.copy_from(copy_file, self.ref_table, columns=header)
+    @instrument.instrumented('stream_upload')
+    def stream_upload(self, source, file_ids):
+        """
+        Parses the file and uploads its points in a single pass, without storing them in self.points.
+        Points are validated and rendered chunk_size at a time, and COPY pulls the chunks lazily.
+        The time range and bbox are accumulated as the points go by and written to the batch
+        at the end of the same transaction.
+        Returns the new batch_id
+        :input: the path or binary file object to parse, a list of file_ids used in the batch
+        :output: int - id of batch
+        """
 
-        conn.commit()
-        cur.close()
-        conn.close()
+        with connection(self.dsn_string) as conn:
+            cur = conn.cursor()
 
+            batch_id = self.insert_empty_batch(cur)
+            self.link_files_to_batch(cur, batch_id, file_ids)
+
+            ranges = {f: None for f in RANGE_FIELDS}
+            with sourcefile.open_source(source) as file:
+                chunks = self.iter_copy_chunks(file, batch_id, ranges)
+                self.copy_points(cur, ChunkStream(chunks), self.get_header())
+
+            self.set_ranges(ranges)
+            self.update_batch_ranges(cur, batch_id)
+            cur.close()
+
+        self.invalidate_cached_queries()
+        self.index_batch(batch_id)
         return batch_id
 
-    def parse_file(self, file):
+    @instrument.instrumented('chunked_upload')
+    def chunked_upload(self, source, file_ids, checkpoint_path, commit_size=COMMIT_SIZE):
+        """
+        Uploads a file as stream_upload does, but COPYing commit_size points per transaction
+        instead of the whole batch in one, recording its progress in a checkpoint file (see helpers.checkpoint)
+        after each. If it fails, running it again with the same file and checkpoint_path carries on
+        from the last committed chunk: the file is parsed again and the points already committed are skipped.
+        The batch is made with no time range or bbox, the last step sets them, which marks the batch complete:
+        until then it's left out of get_batch_list, the bbox queries and the tiles.
+        The checkpoint file is removed once the batch is complete.
+        Returns the batch_id
+        :input: the path or binary file object to parse, a list of file_ids used in the batch,
+            the path of the checkpoint file, how many points to commit at a time
+        :output: int - id of batch
+        """
+        state = checkpoint.load(checkpoint_path)
+        source_name, source_size = checkpoint.source_info(source)
+        if state is None:
+            with connection(self.dsn_string) as conn:
+                cur = conn.cursor()
+                batch_id = self.insert_empty_batch(cur)
+                self.link_files_to_batch(cur, batch_id, file_ids)
+                cur.close()
+            state = {'batch_id': batch_id, 'batch_type_name': self.batch_type_name, 'ref_table': self.ref_table,
+                     'source': source_name, 'source_size': source_size, 'points_committed': 0}
+            checkpoint.save(checkpoint_path, state)
+        elif (state['batch_type_name'], state['source'], state['source_size']) != \
+                (self.batch_type_name, source_name, source_size):
+            raise ValueError("The checkpoint %s is of another upload (%s of %s)"
+                             % (checkpoint_path, state['batch_type_name'], state['source']))
+
+        batch_id = state['batch_id']
+        # a crash between a commit and its checkpoint leaves the database ahead of the checkpoint
+        committed = self.count_batch_points(batch_id)
+        ranges = {f: None for f in RANGE_FIELDS}
+        progress = {'points': committed}
+
+        with sourcefile.open_source(source) as file:
+            chunks = skip_points(self.iter_point_chunks(file), committed, ranges)
+            try:
+                for first in chunks:
+                    group = take_points(first, chunks, commit_size, progress)
+                    with connection(self.dsn_string) as conn:
+                        cur = conn.cursor()
+                        self.copy_points(cur, ChunkStream(self.render_copy_chunks(group, batch_id, ranges)),
+                                         self.get_header())
+                        cur.close()
+                    state['points_committed'] = progress['points']
+                    checkpoint.save(checkpoint_path, state)
+            finally:
+                # the parser is stopped while the file is still open
+                chunks.close()
+
+        try:
+            self.complete_batch(batch_id, ranges)
+        except NoPointsException:
+            checkpoint.remove(checkpoint_path)
+            raise
+        checkpoint.remove(checkpoint_path)
+
+        self.invalidate_cached_queries()
+        self.index_batch(batch_id)
+        return batch_id
+
+    def count_batch_points(self, batch_id):
+        """
+        The number of points of a batch committed to ref_table
+        """
+        with connection(self.dsn_string) as conn:
+            cur = conn.cursor()
+            cur.execute(sql.SQL('SELECT count(*) FROM {} WHERE batch_id = %s').format(sql.Identifier(self.ref_table)),
+                        [batch_id])
+            count = cur.fetchone()[0]
+            cur.close()
+        return count
+
+    @instrument.staged('complete_batch')
+    def complete_batch(self, batch_id, ranges):
+        """
+        The last step of chunked_upload: sets the time range and bbox of the batch, marking it complete.
+        A batch without valid points is deleted instead, and NoPointsException raised
+        :input: batch_id, the ranges dict of its points
+        """
+        if None in ranges.values():
+            with connection(self.dsn_string) as conn:
+                cur = conn.cursor()
+                cur.execute('DELETE FROM Batch_Files WHERE batch_id = %s; DELETE FROM Batches WHERE id = %s;',
+                            [batch_id, batch_id])
+                cur.close()
+        self.set_ranges(ranges)
+
+        with connection(self.dsn_string) as conn:
+            cur = conn.cursor()
+            self.update_batch_ranges(cur, batch_id)
+            cur.close()
+
+    @instrument.instrumented('drop_duplicates')
+    def drop_duplicates(self, quanta=None):
+        """
+        Drops the parsed points that are already in the complete batches of ref_table, or repeated in the file
+        (see helpers.dedup), and resets the time range and bbox to the rest. Run between parse_file and upload.
+        Raises NoPointsException if every point was a duplicate
+        :input: dict of field -> the step it's quantized to before comparing, the configured quanta if None
+        :output: how many points were dropped
+        """
+        with connection(self.dsn_string) as conn:
+            cur = conn.cursor()
+            keep = dedup.find_duplicates(cur, self.ref_table, self.points, quanta)
+            cur.close()
+        dropped = len(keep) - sum(keep)
+        self.duplicates_dropped += dropped
+        self.points.compress(keep)
+        self.set_time_range_and_bbox()
+        return dropped
+
+    @instrument.instrumented('parse_file')
+    def parse_file(self, source):
         """
         Takes a file and makes corresponding points and then gets the ranges of time and lat/lon.
-        The parsing should be done in the subclasses and then super() should be used
+        The parsing itself is done by iter_points (or iter_columns) in the subclasses.
+        With more than one worker, files on disk are parsed in parallel by parse_file_parallel
+        :input: a path or a binary file object (which doesn't need to be seekable)
         """
+        path = sourcefile.source_path(source)
+        if self.workers > 1 and self.splittable and path is not None:
+            self.parse_file_parallel(path)
+            return
+
+        with sourcefile.open_source(source) as file:
+            if self.columnar:
+                self.skip_header(file)
+                for columns in self.iter_columns(sourcefile.iter_blocks(file)):
+                    self.add_columns(columns)
+            else:
+                self.add_all(self.iter_points(file))
 
         self.set_time_range_and_bbox()
 
+    def parse_file_parallel(self, path):
+        """
+        Splits the file into ranges of whole lines and parses them in a pool of self.workers processes
+        with iter_range_points. The points are added in file order, so the result is the same as parse_file's
+        :input: the path of the file
+        """
+        with open(path, 'rb') as file:
+            self.skip_header(file)
+            start = file.tell()
+            size = file.seek(0, 2)
+            n_chunks = max(1, -(-(size - start) // self.split_bytes))
+            starts, ends = zip(*filechunks.split_lines(file, start, n_chunks))
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        # the workers get a copy without the points parsed so far
+        worker = copy(self)
+        worker.points = PointBuffer(self.point_model)
+        worker.rows_parsed = 0
+        worker.rejections = Rejections()
+
+        ranges = self.points.ranges(RANGE_FIELDS)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(parse_range, repeat(worker), repeat(path), starts, ends)
+            for points, chunk_ranges, rejections, rows in results:
+                self.points.extend_buffer(points)
+                merge_ranges(ranges, chunk_ranges)
+                self.rejections.merge(rejections, self.rows_parsed)
+                self.rows_parsed += rows
+
+        self.set_ranges(ranges)
+
+    def skip_header(self, file):
+        for _ in range(self.header_lines):
+            file.readline()
+
+    def iter_points(self, file):
+        """
+        A generator of the points in the file, implemented by the subclasses.
+        Points don't need to be validated, that is done by the caller.
+        Columnar subclasses get it for free from iter_columns
+        :input: the binary file to parse
+        """
+        if not self.columnar:
+            raise NotImplementedError
+
+        self.skip_header(file)
+        for columns in self.iter_columns(sourcefile.iter_blocks(file)):
+            block = PointBuffer(self.point_model)
+            block.extend_columns(columns)
+            yield from block
+
+    def iter_columns(self, blocks):
+        """
+        A generator of the points of blocks of whole lines (after the header) a block at a time,
+        for the columnar subclasses. Each block of points is a dict of field -> values,
+        the values being what PointBuffer stores (see PointBuffer.extend_columns).
+        :input: an iterable of bytes-like blocks (see sourcefile.iter_blocks)
+        """
+
+        raise NotImplementedError
+
+    def iter_range_points(self, file, start, end):
+        """
+        A generator of the points of the lines starting in [start, end) of the file, for the subclasses
+        that are splittable. start is always at the start of a line after the header.
+        :input: the binary file, the byte range
+        """
+
+        raise NotImplementedError
+
+    def invalidate_cached_queries(self):
+        """
+        Drops the cached query results and tiles (see querycache) the committed batch can change,
+        the ones whose extent intersects its bbox. Can only be run after the ranges are set.
+        """
+        querycache.invalidate(self.dsn_string, tuple(map(float, (self.min_lon, self.min_lat, self.max_lon, self.max_lat))))
+
+    def index_batch(self, batch_id):
+        """
+        Adds the committed batch to the bbox index (see bboxindex) if it's loaded.
+        Can only be run after the ranges are set.
+        """
+        bboxindex.registry.add(self.dsn_string, batch_id,
+                               (self.min_lon, self.min_lat, self.max_lon, self.max_lat))
+
+    def get_bbox_string(self):
+        """
+        The sql for the batch's bbox geometry, an SqlFragment with the polygon as its parameter.
+        Can only be run after the ranges are set.
+        """
+
+        bbox_wkt = "POLYGON(({min_lon} {min_lat},{max_lon} {min_lat},{max_lon} {max_lat},{min_lon} {max_lat}, {min_lon} {min_lat}))"
+        bbox_wkt = bbox_wkt.format(min_lon=self.min_lon,max_lon=self.max_lon,min_lat=self.min_lat,max_lat=self.max_lat)
+        return SqlFragment("ST_GeomFromText(%s, 4326)", [bbox_wkt])
+
+    @instrument.staged('insert_batch')
     def insert_batch(self, cur):
         """
         Inserts a new batch into the database, returns batch_id. Can only be run after parsing.
         :input: cursor
         """
 
-        bbox_string = "ST_GeomFromText('POLYGON(({min_lon} {min_lat},{max_lon} {min_lat},{max_lon} {max_lat},{min_lon} {max_lat}, {min_lon} {min_lat}))', 4326)"
-        bbox_string = bbox_string.format(min_lon=self.min_lon,max_lon=self.max_lon,min_lat=self.min_lat,max_lat=self.max_lat)
-
+        bbox = self.get_bbox_string()
         insert_batch_string = """
             INSERT INTO Batches (start_time, end_time, batch_type_id, bbox)
             VALUES (%s, %s, %s, {}) RETURNING id;
-        """.format(bbox_string)
+        """.format(bbox)
 
-        cur.execute(insert_batch_string, [self.start_time, self.end_time, self.batch_type_id])
+        prepared.execute(cur, insert_batch_string, [self.start_time, self.end_time, self.batch_type_id, *bbox.params])
         batch_id = cur.fetchone()[0]
         return batch_id
 
+    @instrument.staged('insert_batch')
+    def insert_empty_batch(self, cur):
+        """
+        Inserts a new batch without a time range or bbox, returns batch_id.
+        Those are filled in by update_batch_ranges once the points have been seen.
+        :input: cursor
+        """
+
+        cur.execute('INSERT INTO Batches (batch_type_id) VALUES (%s) RETURNING id;', [self.batch_type_id])
+        batch_id = cur.fetchone()[0]
+        return batch_id
+
+    @instrument.staged('update_batch_ranges')
+    def update_batch_ranges(self, cur, batch_id):
+        """
+        Sets the time range and bbox of an existing batch. Can only be run after the ranges are set.
+        :input: cursor, batch_id
+        """
+
+        bbox = self.get_bbox_string()
+        update_batch_string = """
+            UPDATE Batches SET start_time = %s, end_time = %s, bbox = {}
+            WHERE id = %s;
+        """.format(bbox)
+
+        prepared.execute(cur, update_batch_string, [self.start_time, self.end_time, *bbox.params, batch_id])
+
 
     def add_point(self, point):
         """
-        Stores the point, also validates
+        Stores the point, also validates. Invalid points are recorded in self.rejections
         :input: a point dict
         """
         if self.point_model.validate(point):
             self.points.append(point)
+        else:
+            self.rejections.add(self.rows_parsed, self.point_model.check(point))
+        self.rows_parsed += 1
 
+    def add_points(self, points):
+        """
+        Validates and stores a batch of points, see add_point
+        :input: a list of point dicts
+        """
+        with instrument.stage('validate') as stage:
+            valid, rejected = self.point_model.validate_points(points, self.rows_parsed)
+            self.points.extend(valid)
+            self.rejections.extend(rejected)
+            self.rows_parsed += len(points)
+            stage.add(rows_in=len(points), rows_out=len(valid), rejected=len(rejected))
+
+    def add_all(self, points):
+        """
+        Validates and stores the points of an iterable chunk_size at a time
+        """
+        points = iter(points)
+        while True:
+            batch = list(islice(points, self.chunk_size))
+            if len(batch) == 0:
+                break
+            self.add_points(batch)
+
+    def add_columns(self, columns):
+        """
+        Stores a block of points made by iter_columns. The columns already have the right types,
+        so they're only checked to have exactly the fields of the model (the whole block is rejected otherwise)
+        :input: a dict of field -> values
+        """
+        n = len(next(iter(columns.values()), ()))
+        with instrument.stage('validate') as stage:
+            reason = self.point_model.check_fields(columns)
+            if reason is None:
+                self.points.extend_columns(columns)
+                stage.add(rows_in=n, rows_out=n)
+            else:
+                self.rejections.add(self.rows_parsed, reason, count=n)
+                stage.add(rows_in=n, rejected=n)
+        self.rows_parsed += n
+
+    @instrument.staged('link_files')
     def link_files_to_batch(self, cur, batch_id, file_ids):
         """
         adds (batch_id, file_id) to batch_files for every file_id in file_ids
         :input: cursor, batch_id, iterable of file ids
         """
+        from psycopg2.extras import execute_values
+
         insert_tuples = map(lambda x: (batch_id, x), file_ids)
         insert_string = "INSERT INTO Batch_Files (batch_id, file_id) VALUES %s"
-        psycopg2.extras.execute_values(cur, insert_string, insert_tuples)
+        execute_values(cur, insert_string, insert_tuples)
 
     def set_ref_table_and_fields(self):
         """
-            using the batch_type_name set the ref_table and point_model based off the database
+            using the batch_type_name set the batch_type_id, ref_table and point_model,
+            from the database or the batch type registry's cache
         """
-        conn = psyco.connect(dsn=self.dsn_string)
-        cur = conn.cursor()
-
-        cur.execute('SELECT id, ref_table from batch_types where name = %s', (self.batch_type_name,))
-
-        result = cur.fetchone()
-        if result is None:
-            raise NoBatchTypeException("There is no batch type with name '%s'" % self.batch_type_name)
-        self.batch_type_id, self.ref_table = result
-
-        cur.execute('SELECT field_name, field_type from batch_type_fields f, batch_types b where b.id = %s and b.id = f.batch_type_id', (self.batch_type_id,))
-        fields = cur.fetchall()
-        self.point_model = Point_Model(fields)
-
-        conn.commit()
-        cur.close()
-        conn.close()
+        self.batch_type_id, self.ref_table, self.point_model = batchtypes.registry.get(self.dsn_string, self.batch_type_name)
 
     def set_time_range_and_bbox(self):
         """
-        Runs through all the points and finds the min and max of time, latitude and longitude
+        Finds the min and max of time, latitude and longitude from the columns of the points
         Adds those vars to self. min_lon, max_lat, min_time, etc
         """
-        def update_ranges(current, new):
-            for key in current:
-                val = current[key]
-                if val is None:
-                    current[key] = [new[key], new[key]]
-                else:
-                    current[key] = [min(current[key][0], new[key]), max(current[key][1], new[key])]
-            return current
+        with instrument.stage('set_time_range_and_bbox'):
+            self.set_ranges(self.points.ranges(RANGE_FIELDS))
 
-        ranges = { 'time':None, 'latitude':None, 'longitude':None }
-        extremes = reduce(update_ranges, self.points, ranges)
+    def set_ranges(self, extremes):
+        """
+        Sets start_time, end_time, min_lat, etc. from a dict of [min, max] (see PointBuffer.ranges)
+        """
+        if None in extremes.values():
+            raise NoPointsException("There are no valid points for batch type '%s'" % self.batch_type_name)
 
-        self.start_time, self.end_time = extremes['time']
         self.start_time, self.end_time = extremes['time']
         self.min_lat, self.max_lat = extremes['latitude']
         self.min_lon, self.max_lon = extremes['longitude']
 
+    def get_header(self):
+        """
+        The columns written by COPY, in order
+        """
+        return list(self.point_model.model) + ['batch_id']
+
     def make_csv(self, batch_id):
         """
         Makes a file-like object in tab-delimited CSV format without headers.
         Every point gets turned into a line.
         Returns a StringIO object and a list of strings representing the header.
-        Any tabs in the values are replaced with spaces.
         :input: the batch_id
         :output: StringIO object in csv format, list of strings for header
         """
-        fields = list(self.point_model.model)
+        with instrument.stage('render') as stage:
+            copy_file = StringIO(render_text(self.points, batch_id))
+            stage.add(rows_in=len(self.points))
 
-        # remove all the fields that start with 'pr_' from points
-        trimmed_points = map(lambda p: {f:p[f] for f in p if not f.startswith('pr_')}, self.points)
+        return copy_file, self.get_header()
 
-        copy_file = StringIO()
-        for p in trimmed_points:
-            # makes the line replacing any existing \t with spaces
-            s = '\t'.join([str(p[f]).replace('\t', ' ') for f in fields] + [str(batch_id)])
-            print(s, file=copy_file)
+    def make_binary(self, batch_id):
+        """
+        Makes a file-like object in PostgreSQL's binary COPY format.
+        Every point gets turned into a row.
+        :input: the batch_id
+        :output: BytesIO object in binary COPY format, list of strings for header
+        """
+        encoder = BinaryEncoder(list(self.point_model.model), self.point_model.types)
+
+        with instrument.stage('render') as stage:
+            copy_file = BytesIO(encoder.encode(self.points, batch_id, header=True, trailer=True))
+            stage.add(rows_in=len(self.points))
 
-        copy_file.seek(0)
+        return copy_file, self.get_header()
 
-        header = fields + ['batch_id']
+    def iter_copy_chunks(self, file, batch_id, ranges):
+        """
+        make_copy_chunks of the points in the file, see iter_point_chunks
+        :input: the binary file to parse, the batch_id, a ranges dict for merge_ranges
+        """
+        return self.render_copy_chunks(self.iter_point_chunks(file), batch_id, ranges)
+
+    def iter_point_chunks(self, file):
+        """
+        A generator of PointBuffers of the valid points in the file. Columnar subclasses skip making point dicts,
+        each block from iter_columns is a chunk as it is
+        :input: the binary file to parse
+        """
+        if not self.columnar:
+            return self.iter_valid_chunks(self.iter_points(file))
 
-        return copy_file, header
+        self.skip_header(file)
+        return self.iter_column_chunks(self.iter_columns(sourcefile.iter_blocks(file)))
+
+    def make_copy_chunks(self, points, batch_id, ranges):
+        """
+        A generator of COPY data in copy_format, each chunk covering up to chunk_size points.
+        Invalid points are dropped (and recorded in self.rejections) and ranges is updated with the valid ones as each chunk is made.
+        :input: an iterable of points, the batch_id, a ranges dict for merge_ranges
+        :output: strings in csv format or bytes in binary format
+        """
+        return self.render_copy_chunks(self.iter_valid_chunks(points), batch_id, ranges)
+
+    def iter_valid_chunks(self, points):
+        """
+        A generator of PointBuffers of the valid points of an iterable, validated chunk_size at a time
+        """
+        points = iter(points)
+        while True:
+            raw = list(islice(points, self.chunk_size))
+            if len(raw) == 0:
+                break
+
+            with instrument.stage('validate') as stage:
+                valid, rejected = self.point_model.validate_points(raw, self.rows_parsed)
+                self.rejections.extend(rejected)
+                self.rows_parsed += len(raw)
+
+                chunk = PointBuffer(self.point_model, chunk_size=self.chunk_size)
+                chunk.extend(valid)
+                stage.add(rows_in=len(raw), rows_out=len(valid), rejected=len(rejected))
+            yield chunk
+
+    def iter_column_chunks(self, blocks):
+        """
+        A generator of PointBuffers of the blocks made by iter_columns, checked as in add_columns
+        """
+        for columns in blocks:
+            n = len(next(iter(columns.values()), ()))
+            with instrument.stage('validate') as stage:
+                reason = self.point_model.check_fields(columns)
+                chunk = None
+                if reason is None:
+                    chunk = PointBuffer(self.point_model)
+                    chunk.extend_columns(columns)
+                    stage.add(rows_in=n, rows_out=n)
+                else:
+                    self.rejections.add(self.rows_parsed, reason, count=n)
+                    stage.add(rows_in=n, rejected=n)
+            self.rows_parsed += n
+            if chunk is not None:
+                yield chunk
+
+    def render_copy_chunks(self, chunks, batch_id, ranges):
+        """
+        A generator of the COPY data in copy_format of PointBuffers of valid points, updating ranges with each
+        :input: an iterable of PointBuffers, the batch_id, a ranges dict for merge_ranges
+        :output: strings in csv format or bytes in binary format
+        """
+        if self.copy_format == 'binary':
+            encoder = BinaryEncoder(list(self.point_model.model), self.point_model.types)
+            render = lambda chunk, first: encoder.encode(chunk, batch_id, header=first)
+        else:
+            render = lambda chunk, first: render_text(chunk, batch_id)
+
+        first = True
+        for chunk in chunks:
+            with instrument.stage('render') as stage:
+                merge_ranges(ranges, chunk.ranges(RANGE_FIELDS))
+                data = render(chunk, first)
+                stage.add(rows_in=len(chunk))
+            yield data
+            first = False
+
+        if self.copy_format == 'binary':
+            yield encoder.encode(PointBuffer(self.point_model), batch_id, header=first, trailer=True)
+
+    def copy_points(self, cur, copy_file, header):
+        """
+        COPYs the file-like object made by make_csv, make_binary or make_copy_chunks into ref_table
+        :input: cursor, the file-like object, list of strings for header
+        """
+        with instrument.stage('copy') as stage:
+            copy_file = stage.wrap_reader(copy_file)
+            if self.copy_format == 'binary':
+                copy_string = sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT binary)').format(
+                    sql.Identifier(self.ref_table),
+                    sql.SQL(',').join(map(sql.Identifier, header)))
+                cur.copy_expert(copy_string, copy_file, size=COPY_BUFFER_SIZE)
+            else:
+                cur.copy_from(copy_file, self.ref_table, columns=header, size=COPY_BUFFER_SIZE)
+            stage.add(rows_out=max(cur.rowcount, 0))
@@ -1,11 +1,17 @@
-from setuptools import setup
-
-setup(
-    name='dbinterfacer',
-    version='0.0.1',
-    url='https://github.com/csb-comren/dbinterfacer',
-
-    description='Abstraction layer between the database and django',
-
-    install_requires=['pynmea2'],
-)
+from setuptools import setup
+
+setup(
+    name='dbinterfacer',
+    version='0.0.1',
+    url='https://github.com/csb-comren/dbinterfacer',
+
+    description='Abstraction layer between the database and django',
+
+    install_requires=['pynmea2'],
+    extras_require={
+        # query.iter_arrays, iter_columns and query_columns
+        'numpy': ['numpy'],
+        # query.iter_record_batches and export_parquet
+        'arrow': ['numpy', 'pyarrow'],
+    },
+)
@@ -0,0 +1,59 @@
+import unittest
+from dbinterfacer.uploaders import CidcoUploader
+from dbinterfacer.helpers.batchtypes import BatchTypeRegistry
+from dbinterfacer.helpers.exceptions import NoBatchTypeException
+from .secret import local_url
+
+
+class CountingRegistry(BatchTypeRegistry):
+    def __init__(self, **kwargs):
+        super().__init__(clock=self.now, **kwargs)
+        self.time = 0
+        self.fetches = 0
+
+    def now(self):
+        return self.time
+
+    def fetch(self, dsn_string, batch_type_name):
+        self.fetches += 1
+        return super().fetch(dsn_string, batch_type_name)
+
+
+class TestBatchTypeRegistry(unittest.TestCase):
+    def test_caches_until_ttl(self):
+        r = CountingRegistry(ttl=60)
+        first = r.get(local_url, 'cidco processed')
+        self.assertIs(r.get(local_url, 'cidco processed'), first)
+        self.assertEqual(r.fetches, 1)
+        self.assertIn('northing', first.point_model.model)
+
+        r.time = 60
+        r.get(local_url, 'cidco processed')
+        self.assertEqual(r.fetches, 2)
+
+    def test_invalidate(self):
+        r = CountingRegistry()
+        r.get(local_url, 'cidco processed')
+        r.get(local_url, 'simple depth')
+        r.invalidate(local_url, 'simple depth')
+        r.get(local_url, 'cidco processed')
+        r.get(local_url, 'simple depth')
+        self.assertEqual(r.fetches, 3)
+
+    def test_preload(self):
+        r = CountingRegistry()
+        self.assertIn('simple depth', r.preload(local_url))
+        batch_type = r.get(local_url, 'simple depth')
+        self.assertEqual(r.fetches, 0)
+        self.assertEqual(batch_type[:2], r.fetch(local_url, 'simple depth')[:2])
+        self.assertEqual(set(batch_type.point_model.model), {'time', 'latitude', 'longitude', 'depth'})
+
+    def test_unknown_batch_type(self):
+        with self.assertRaises(NoBatchTypeException):
+            BatchTypeRegistry().get(local_url, 'no such type')
+
+    def test_uploader_construction_is_lazy(self):
+        u = CidcoUploader('host=/nonexistent dbname=nothing', 'cidco processed')
+        self.assertEqual(u.chunk_size, 10000)
+        with self.assertRaises(AttributeError):
+            u.not_an_attribute
@@ -0,0 +1,113 @@
+import time
+import random
+import unittest
+from dbinterfacer import query
+from dbinterfacer.helpers import bboxindex
+from dbinterfacer.helpers.exceptions import PoolTimeoutException
+from dbinterfacer.helpers.pool import connection
+from dbinterfacer.helpers.bboxindex import BatchIndex, BatchIndexRegistry, box_distance
+from dbinterfacer.uploaders import CidcoUploader
+from .secret import local_url
+
+
+def random_boxes(n):
+    random.seed(1)
+    boxes = []
+    for i in range(n):
+        x, y = random.uniform(-60, -50), random.uniform(40, 50)
+        boxes.append((i, x, y, x + random.uniform(0, 0.5), y + random.uniform(0, 0.5)))
+    return boxes
+
+
+class TestBatchIndex(unittest.TestCase):
+    def setUp(self):
+        self.rows = random_boxes(2000)
+        self.index = BatchIndex()
+        self.index.fill(self.rows, 0)
+
+    def brute_force(self, test):
+        return sorted(row[0] for row in self.rows if test(row[1:]))
+
+    def test_intersecting_and_containing(self):
+        bbox = (-55.0, 45.0, -54.0, 45.5)
+        self.assertEqual(self.index.intersecting(bbox), self.brute_force(bboxindex.intersects_test(bbox)))
+        point = (-55.2, 45.2, -55.2, 45.2)
+        self.assertEqual(self.index.containing(point), self.brute_force(bboxindex.contains_test(point)))
+        self.assertTrue(self.index.intersecting(bbox))
+
+    def test_nearest(self):
+        point = (-51.3, 49.7)
+        by_distance = sorted((box_distance(row[1:], *point), row[0]) for row in self.rows)
+        self.assertEqual(self.index.nearest(point, 5), [i for _, i in by_distance[:5]])
+
+    def test_incremental(self):
+        far = (10.0, 10.0, 11.0, 11.0)
+        self.index.add(5000, far)
+        # moving a batch out of the way
+        self.index.add(0, far)
+        self.assertEqual(self.index.intersecting(far), [0, 5000])
+        self.assertNotIn(0, self.index.intersecting(self.rows[0][1:]))
+        self.assertEqual(self.index.nearest((10.5, 10.5), 2), [0, 5000])
+
+        self.index.remove(5000)
+        for i in range(bboxindex.REPACK_AFTER):
+            self.index.add(6000 + i, far)
+        self.assertLess(len(self.index.moved), bboxindex.REPACK_AFTER)
+        self.assertEqual(len(self.index.intersecting(far)), bboxindex.REPACK_AFTER + 1)
+
+
+class TestBatchIndexRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = bboxindex.registry
+        bboxindex.registry = BatchIndexRegistry(background=False)
+        self.addCleanup(setattr, bboxindex, 'registry', self.registry)
+
+    def warm(self, rows):
+        index = BatchIndex()
+        index.fill(rows, time.monotonic())
+        bboxindex.registry.indexes[local_url] = index
+        return index
+
+    def test_query_uses_warm_index(self):
+        self.warm([(1, 0, 0, 1, 1), (2, 5, 5, 6, 6)])
+        self.assertEqual(query.get_batches_intersecting(local_url, (0.5, 0.5, 5.5, 5.5)), [1, 2])
+        self.assertEqual(query.get_batches_containing(local_url, (5.5, 5.5, 5.5, 5.5)), [2])
+        self.assertEqual(query.get_nearest_batches(local_url, (4, 4)), [2])
+
+    def test_expired_index_is_cold(self):
+        index = self.warm([])
+        bboxindex.registry.ttl = 0
+        bboxindex.registry.background = True
+        self.assertIsNone(bboxindex.registry.get(local_url))
+        self.assertIsNot(bboxindex.registry.indexes[local_url], index)
+
+    def test_failed_load_is_retried(self):
+        attempts = []
+        def timeout(dsn_string):
+            attempts.append(dsn_string)
+            raise PoolTimeoutException("No connection")
+
+        bboxindex.connection = timeout
+        self.addCleanup(setattr, bboxindex, 'connection', connection)
+        self.assertIsNone(bboxindex.registry.get(local_url))
+        self.assertNotIn(local_url, bboxindex.registry.indexes)
+        self.assertIsNone(bboxindex.registry.get(local_url))
+        self.assertEqual(len(attempts), 2)
+        self.assertIsInstance(bboxindex.registry.errors[local_url], PoolTimeoutException)
+
+    def test_unexpected_load_error_raised(self):
+        def broken(dsn_string):
+            raise RuntimeError("bug")
+
+        bboxindex.connection = broken
+        self.addCleanup(setattr, bboxindex, 'connection', connection)
+        self.assertRaises(RuntimeError, bboxindex.registry.get, local_url)
+        self.assertNotIn(local_url, bboxindex.registry.indexes)
+
+    def test_upload_adds_batch(self):
+        index = self.warm([])
+        u = CidcoUploader(local_url, 'cidco processed')
+        u.parse_file('test/data/soundingExport.txt')
+        batch_id = u.upload([])
+        self.assertEqual(query.get_batches_containing(local_url, (float(u.min_lon), float(u.min_lat)) * 2), [batch_id])
+        self.assertEqual(index.moved, {batch_id})
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+import psycopg2
+from dbinterfacer.helpers import dedup
+from dbinterfacer.helpers.exceptions import NoPointsException
+from dbinterfacer.uploaders import CidcoUploader
+from .secret import local_url
+
+# the export moved a century on, so its points can't match the ones the other tests upload
+YEAR = '2117'
+
+
+def execute(sql_string, parameters=None):
+    conn = psycopg2.connect(dsn=local_url)
+    with conn:
+        cur = conn.cursor()
+        cur.execute(sql_string, parameters)
+        rows = cur.fetchall() if cur.description else None
+    conn.close()
+    return rows
+
+
+def clear_year():
+    execute("DELETE FROM batch_type_2 WHERE time >= %s", (YEAR + '-01-01',))
+    execute("DELETE FROM batches WHERE start_time >= %s", (YEAR + '-01-01',))
+
+
+class TestDropDuplicates(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'soundingExport.txt')
+        with open('test/data/soundingExport.txt') as source, open(self.path, 'w') as f:
+            f.write(source.read().replace('2017/', YEAR + '/'))
+        clear_year()
+        self.addCleanup(clear_year)
+
+    def parsed(self):
+        u = CidcoUploader(local_url, 'cidco processed')
+        u.parse_file(self.path)
+        return u
+
+    def test_repeats_in_file(self):
+        u = self.parsed()
+        u.points.extend_buffer(self.parsed().points)
+        self.assertEqual(u.drop_duplicates(), 883)
+        self.assertEqual(len(u.points), 883)
+        self.assertEqual(list(u.points), list(self.parsed().points))
+
+    def test_resubmitted_file(self):
+        u = self.parsed()
+        self.assertEqual(u.drop_duplicates(), 0)
+        u.upload([])
+
+        again = self.parsed()
+        self.assertRaises(NoPointsException, again.drop_duplicates)
+        self.assertEqual(again.duplicates_dropped, 883)
+
+    def test_streamed_batch(self):
+        CidcoUploader(local_url, 'cidco processed').stream_upload(self.path, [])
+        self.assertRaises(NoPointsException, self.parsed().drop_duplicates)
+
+    def test_deleted_batch(self):
+        u = self.parsed()
+        batch_id = u.upload([])
+        execute("DELETE FROM batch_type_2 WHERE batch_id = %s", (batch_id,))
+        execute("DELETE FROM batches WHERE id = %s", (batch_id,))
+        self.assertEqual(self.parsed().drop_duplicates(), 0)
+
+    def test_incomplete_batch(self):
+        u = self.parsed()
+        batch_id = u.upload([])
+        execute("UPDATE batches SET end_time = NULL WHERE id = %s", (batch_id,))
+        self.assertEqual(self.parsed().drop_duplicates(), 0)
+
+    def test_overlapping_export(self):
+        u = self.parsed()
+        u.points.compress([i < 500 for i in range(883)])
+        u.set_time_range_and_bbox()
+        u.upload([])
+
+        overlapping = self.parsed()
+        self.assertEqual(overlapping.drop_duplicates(), 500)
+        self.assertEqual(len(overlapping.points), 383)
+        self.assertEqual(overlapping.start_time, self.parsed().points[500]['time'])
+
+    def moved(self):
+        u = self.parsed()
+        depths = u.points.columns['depth']
+        for i in range(100):
+            depths[i] += 0.0004 if i % 2 else 0.002
+        return u
+
+    def test_quantized(self):
+        self.parsed().upload([])
+        # the depths moved less than half of the quantum are still the same points
+        self.assertEqual(self.moved().drop_duplicates(), 833)
+        self.assertEqual(self.moved().drop_duplicates(dict(dedup.DEFAULTS['quanta'], depth=1e-4)), 783)
+
+    def test_configure(self):
+        self.assertRaises(ValueError, dedup.configure, capacity=10)
+        dedup.configure(block_size=100)
+        self.addCleanup(dedup.configure, block_size=dedup.DEFAULTS['block_size'])
+        u = self.parsed()
+        u.points.extend_buffer(self.parsed().points)
+        self.assertEqual(u.drop_duplicates(), 883)
@@ -0,0 +1,32 @@
+import sys
+import subprocess
+import unittest
+
+
+def imported_modules(statement):
+    """
+    The modules a fresh interpreter has after the statement
+    """
+    output = subprocess.check_output([sys.executable, '-c', statement + '; import sys; print(" ".join(sys.modules))'])
+    return set(output.decode().split())
+
+
+# imported by the functions that use them
+HEAVY = {'pynmea2', 'ijson', 'numpy', 'pyarrow', 'psycopg2.extras', 'multiprocessing', 'concurrent.futures', 'pstats'}
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_query_is_light(self):
+        self.assertFalse(imported_modules('import dbinterfacer.query') & HEAVY)
+
+    def test_uploaders_are_light(self):
+        self.assertFalse(imported_modules('from dbinterfacer.uploaders import CidcoUploader, NmeaUploader') & HEAVY)
+
+    def test_ingest_exports(self):
+        import types
+        import dbinterfacer.uploaders
+        import dbinterfacer.uploaders.ingest as ingest
+
+        self.assertIsInstance(ingest, types.ModuleType)
+        self.assertIs(dbinterfacer.uploaders.BatchIngest, ingest.BatchIngest)
+        self.assertIs(dbinterfacer.uploaders.ingest_files, ingest.ingest_files)
@@ -0,0 +1,87 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import psycopg2
+from dbinterfacer.uploaders import CidcoUploader, NmeaUploader, IngestJob, ingest_files
+from .secret import local_url
+
+CIDCO = 'test/data/soundingExport.txt'
+NMEA = 'test/data/NMEA.txt'
+
+
+def query_one(sql_string, parameters=None):
+    conn = psycopg2.connect(dsn=local_url)
+    cur = conn.cursor()
+    cur.execute(sql_string, parameters)
+    row = cur.fetchone()
+    conn.close()
+    return row[0]
+
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_partial_failure(self):
+        with open(CIDCO, 'rb') as f:
+            bad = self.write('bad.txt', f.read() + b'2017/12/11 18:37:12.068;not a row\n')
+        nmea = NmeaUploader(local_url, 'simple depth')
+        nmea.parse_file(NMEA)
+
+        batches = query_one('SELECT count(*) FROM Batches')
+        report = ingest_files(local_url, [
+            IngestJob(CidcoUploader, CIDCO, 'cidco processed'),
+            (CidcoUploader, bad, 'cidco processed', []),
+            IngestJob(NmeaUploader, NMEA, 'simple depth'),
+        ], workers=2, queue_size=2, chunk_size=100)
+
+        self.assertEqual(len(report.batch_ids), 2)
+        self.assertEqual([r.job.source for r in report.failures], [bad])
+        self.assertIsInstance(report.failures[0].error, ValueError)
+        # the failed job's batch was rolled back
+        self.assertEqual(query_one('SELECT count(*) FROM Batches'), batches + 2)
+
+        cidco, _, nmea_result = report.results
+        self.assertEqual(cidco.rows_parsed, 883)
+        self.assertEqual(query_one('SELECT count(*) FROM batch_type_2 WHERE batch_id = %s', (cidco.batch_id,)), 883)
+        self.assertEqual(query_one('SELECT count(*) FROM batch_type_1 WHERE batch_id = %s', (nmea_result.batch_id,)),
+                         len(nmea.points))
+        self.assertEqual(query_one('SELECT end_time FROM Batches WHERE id = %s', (nmea_result.batch_id,)), nmea.end_time)
+
+    @unittest.skipUnless((os.cpu_count() or 1) > 1, 'parsing and COPY only overlap with more than one CPU')
+    def test_parse_and_copy_overlap(self):
+        with open(CIDCO, 'rb') as f:
+            lines = f.read().split(b'\n', 2)
+        paths = [self.write('%d.txt' % i, b'\n'.join(lines[:2]) + b'\n' + lines[2] * 50) for i in range(4)]
+
+        start = time.perf_counter()
+        uploaders = []
+        for path in paths:
+            u = CidcoUploader(local_url, 'cidco processed')
+            u.parse_file(path)
+            uploaders.append(u)
+        parse_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for u in uploaders:
+            u.upload([])
+        copy_seconds = time.perf_counter() - start
+
+        # one parser and one COPY at a time, so any gain is from the two overlapping
+        start = time.perf_counter()
+        report = ingest_files(local_url, [IngestJob(CidcoUploader, p, 'cidco processed') for p in paths], workers=1)
+        seconds = time.perf_counter() - start
+
+        self.assertEqual(report.failures, [])
+        self.assertLess(seconds, 0.9 * (parse_seconds + copy_seconds))
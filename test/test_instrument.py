@@ -0,0 +1,60 @@
+import unittest
+from dbinterfacer import query
+from dbinterfacer.helpers import instrument
+from dbinterfacer.uploaders import CidcoUploader
+from .secret import local_url
+
+
+class TestInstrument(unittest.TestCase):
+    def test_off(self):
+        self.assertIs(instrument.run('upload'), instrument.NULL)
+        self.assertIs(instrument.stage('copy'), instrument.NULL)
+
+    def test_upload_stages(self):
+        runs = []
+        with instrument.recording(callback=runs.append) as recorder:
+            u = CidcoUploader(local_url, 'cidco processed')
+            u.parse_file('test/data/soundingExport.txt')
+            u.upload([])
+        self.assertEqual([r['name'] for r in runs], ['parse_file', 'upload'])
+        self.assertEqual(list(recorder.runs), runs)
+
+        parse, upload = runs
+        self.assertEqual(parse['stages']['validate']['rows_out'], 883)
+        self.assertEqual(parse['stages']['set_time_range_and_bbox']['calls'], 1)
+        self.assertEqual(upload['stages']['render']['rows_in'], 883)
+        copy = upload['stages']['copy']
+        self.assertEqual(copy['rows_out'], 883)
+        self.assertGreater(copy['bytes'], 883 * 20)
+        self.assertGreater(upload['wall'], copy['wall'])
+        self.assertIsNone(upload['peak_memory'])
+        self.assertIsNone(upload['error'])
+
+    def test_stream_upload_stages(self):
+        with instrument.recording() as recorder:
+            u = CidcoUploader(local_url, 'cidco processed', chunk_size=100)
+            u.stream_upload('test/data/soundingExport.txt', [])
+        stages = recorder.runs[0]['stages']
+        self.assertEqual(stages['validate']['rows_out'], 883)
+        self.assertEqual(stages['render']['rows_in'], 883)
+        # the parsing happens as COPY reads
+        self.assertGreater(stages['copy']['wall'], stages['render']['wall'])
+
+    def test_query_capture(self):
+        with instrument.recording(profile=True, trace_memory=True) as recorder:
+            query.query(local_url, 'SELECT generate_series(1, %s)', (500,))
+            self.assertRaises(Exception, query.query, local_url, 'SELECT nothing')
+        ok, failed = recorder.runs
+        self.assertEqual(ok['stages']['fetch']['rows_out'], 500)
+        self.assertGreater(ok['peak_memory'], 0)
+        self.assertGreater(ok['profile'].total_calls, 0)
+        self.assertIn('nothing', failed['error'])
+        self.assertGreater(ok['max_rss'], 0)
+
+    def test_callers_tracing_kept(self):
+        import tracemalloc
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        with instrument.recording(trace_memory=True):
+            query.query(local_url, 'SELECT 1')
+        self.assertTrue(tracemalloc.is_tracing())
@@ -0,0 +1,142 @@
+import unittest
+from decimal import Decimal
+from datetime import datetime, timedelta
+from dbinterfacer.helpers import nmeatokenizer, timestamps
+from dbinterfacer.helpers.interpolation import PositionInterpolator, DAY_MICROSECONDS
+
+SECOND = 10 ** 6
+
+
+def read_nmea(path):
+    """
+    The fixes (microseconds, lat, lon) and depths (time of day bytes, depth) of an NMEA log, in order
+    """
+    sentences = []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                time, data = line.split(b' ')
+            except ValueError:
+                continue
+            if data.startswith(b'$GPRMC'):
+                fix = nmeatokenizer.parse_rmc(data)
+                if fix is not None:
+                    sentences.append(('fix', fix))
+            elif data.startswith((b'$PADBT', b'$SDDBT')):
+                depth = nmeatokenizer.parse_dbt(data)
+                if depth is not None:
+                    sentences.append(('depth', (time, depth)))
+    return sentences
+
+
+def linear_scan(sentences):
+    """
+    The interpolation NmeaUploader.calculate_locations did before PositionInterpolator:
+    each queued depth is placed between the last two fixes once a fix after it is seen
+    :output: list of (time, lat, lon, depth)
+    """
+    prev_gps = next_gps = None
+    queue, results = [], []
+    for kind, value in sentences:
+        if kind == 'depth':
+            queue.append(value)
+            continue
+        micros, lat, lon = value
+        prev_gps, next_gps = next_gps, (timestamps.EPOCH + timedelta(microseconds=micros), Decimal(lat), Decimal(lon))
+        if prev_gps is None:
+            continue
+        time_delta = next_gps[0] - prev_gps[0]
+        for _ in range(len(queue)):
+            time_string, depth = queue.pop(0)
+            time = datetime.combine(prev_gps[0].date(), datetime.strptime(time_string.decode(), '%H:%M:%S.%f').time())
+            if time > next_gps[0]:
+                queue.append((time_string, depth))
+                continue
+            ratio = Decimal((time - prev_gps[0]) / time_delta)
+            results.append((time, (next_gps[1] - prev_gps[1]) * ratio + prev_gps[1],
+                            (next_gps[2] - prev_gps[2]) * ratio + prev_gps[2], depth))
+    return results
+
+
+class TestPositionInterpolator(unittest.TestCase):
+    def test_interpolates_between_fixes(self):
+        p = PositionInterpolator()
+        p.add_depth(5 * SECOND, 'before')
+        p.add_fix(10 * SECOND, 45.0, -60.0)
+        p.add_depth(15 * SECOND, 'middle')
+        p.add_fix(20 * SECOND, 46.0, -62.0)
+        p.add_depth(25 * SECOND, 'after')
+
+        times, lats, lons, depths = p.resolve(final=True)
+        self.assertEqual(depths, ['before', 'middle'])
+        self.assertEqual(times, [5 * SECOND, 15 * SECOND])
+        self.assertAlmostEqual(lats[0], 44.5)
+        self.assertAlmostEqual(lats[1], 45.5)
+        self.assertAlmostEqual(lons[1], -61.0)
+
+    def test_midnight_rollover(self):
+        p = PositionInterpolator()
+        midnight = 100 * DAY_MICROSECONDS
+        p.add_fix(midnight - SECOND, 10.0, 10.0)
+        p.add_depth(DAY_MICROSECONDS - SECOND // 2, 'before midnight')
+        p.add_fix(midnight + SECOND, 12.0, 12.0)
+        p.add_depth(SECOND // 2, 'after midnight')
+        p.add_fix(midnight + 2 * SECOND, 13.0, 13.0)
+
+        times, lats, lons, depths = p.resolve(final=True)
+        self.assertEqual(times, [midnight - SECOND // 2, midnight + SECOND // 2])
+        self.assertAlmostEqual(lats[0], 10.5)
+        self.assertAlmostEqual(lats[1], 11.5)
+
+    def test_out_of_order_fixes(self):
+        p = PositionInterpolator(reorder_window=5 * SECOND)
+        p.add_fix(0, 0.0, 0.0)
+        p.add_fix(20 * SECOND, 2.0, 2.0)
+        p.add_depth(17 * SECOND, 'depth')
+        self.assertEqual(p.resolve()[3], [])
+
+        p.add_fix(10 * SECOND, 1.0, 1.0)
+        times, lats, lons, depths = p.resolve(final=True)
+        self.assertEqual(depths, ['depth'])
+        self.assertAlmostEqual(lats[0], 1.7)
+
+    def test_waiting_depths_not_new(self):
+        p = PositionInterpolator()
+        p.add_depth(SECOND, 'undated')
+        p.add_fix(2 * SECOND, 1.0, 1.0)
+        p.add_fix(3 * SECOND, 2.0, 2.0)
+        p.add_depth(4 * SECOND, 'waiting')
+        self.assertEqual(p.new_depths, 2)
+
+        # both are within the reorder window of the last fix
+        p.resolve()
+        self.assertEqual(len(p), 2)
+        self.assertEqual(p.new_depths, 0)
+
+
+class TestMatchesLinearScan(unittest.TestCase):
+    def test_sample_file(self):
+        sentences = read_nmea('test/data/NMEA.txt')
+        expected = sorted(linear_scan(sentences))
+
+        p = PositionInterpolator()
+        resolved = [[], [], [], []]
+        for kind, value in sentences:
+            if kind == 'fix':
+                p.add_fix(*value)
+            else:
+                p.add_depth(timestamps.time_of_day(value[0]), value[1])
+            if p.new_depths >= 100:
+                for column, values in zip(resolved, p.resolve()):
+                    column.extend(values)
+        for column, values in zip(resolved, p.resolve(final=True)):
+            column.extend(values)
+        points = sorted(zip(*resolved))
+
+        self.assertEqual(len(points), 980)
+        self.assertEqual(len(points), len(expected))
+        for (time, lat, lon, depth), (old_time, old_lat, old_lon, old_depth) in zip(points, expected):
+            self.assertEqual(timestamps.EPOCH + timedelta(microseconds=time), old_time)
+            self.assertEqual(depth, old_depth)
+            self.assertAlmostEqual(lat, float(old_lat), delta=1e-9)
+            self.assertAlmostEqual(lon, float(old_lon), delta=1e-9)
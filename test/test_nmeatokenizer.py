@@ -0,0 +1,25 @@
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from dbinterfacer.helpers import nmeatokenizer, timestamps
+
+RMC = b'$GPRMC,183707.00,A,4723.3127774,N,05308.0144052,W,0.47,244.15,111217,,,A,C*20\r\n'
+DBT = b'$PADBT,000.000,f,019.04,M,000.000,F*3C\r\n'
+
+
+class TestNmeaTokenizer(unittest.TestCase):
+    def test_parse_rmc(self):
+        micros, lat, lon = nmeatokenizer.parse_rmc(RMC)
+        self.assertEqual(micros, (datetime(2017, 12, 11, 18, 37, 7) - datetime(1970, 1, 1)).total_seconds() * 10 ** 6)
+        self.assertAlmostEqual(lat, 47 + 23.3127774 / 60)
+        self.assertAlmostEqual(lon, -(53 + 8.0144052 / 60))
+
+    def test_parse_dbt(self):
+        self.assertEqual(nmeatokenizer.parse_dbt(DBT), Decimal('19.04'))
+
+    def test_bad_checksum(self):
+        self.assertIsNone(nmeatokenizer.parse_rmc(RMC.replace(b'*20', b'*21')))
+        self.assertIsNone(nmeatokenizer.parse_dbt(DBT.replace(b'019.04', b'019.05')))
+
+    def test_time_of_day(self):
+        self.assertEqual(timestamps.time_of_day(b'18:37:07.068'), ((18 * 60 + 37) * 60 + 7) * 10 ** 6 + 68000)
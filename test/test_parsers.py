@@ -1,4 +1,7 @@
 import unittest
+from datetime import datetime, timedelta
+import pynmea2
+from dbinterfacer.helpers.interpolation import PositionInterpolator
 from dbinterfacer.uploaders import CidcoUploader, GeoJsonUploader, NmeaUploader
 from .secret import local_url
 
@@ -30,6 +33,17 @@ class TestParsing(unittest.TestCase):
         self.assertAlmostEqual(float(u.max_lat), 47.3900974159199966209143)
         self.assertAlmostEqual(float(u.min_lat), 47.386470099866665094623)
 
+    def test_nmea_fallback_sentence(self):
+        # $GNRMC isn't on the fast path, it goes through pynmea2
+        line = b'18:37:07.000 $GNRMC,183707.00,A,4723.3127774,N,05308.0144052,W,0.47,244.15,111217,,,A*51\r\n'
+        u = NmeaUploader(local_url, 'simple depth')
+        positions = PositionInterpolator()
+
+        self.assertTrue(u.read_line(line, positions, pynmea2.NMEAStreamReader()))
+        self.assertEqual(list(positions.fix_times),
+                         [(datetime(2017, 12, 11, 18, 37, 7) - datetime(1970, 1, 1)) // timedelta(microseconds=1)])
+        self.assertAlmostEqual(positions.fix_lats[0], 47 + 23.3127774 / 60)
+
     def test_parse_cidco(self):
         f = open('test/data/soundingExport.txt', 'rb')
         u = CidcoUploader(local_url, 'cidco processed')
@@ -42,3 +56,26 @@ class TestParsing(unittest.TestCase):
         self.assertAlmostEqual(float(u.min_lon), -53.1346818)
         self.assertAlmostEqual(float(u.max_lat), 47.3900793)
         self.assertAlmostEqual(float(u.min_lat), 47.3864477)
+
+    def assertParallelMatches(self, uploader_class, path, batch_type):
+        serial = uploader_class(local_url, batch_type)
+        with open(path, 'rb') as f:
+            serial.parse_file(f)
+
+        parallel = uploader_class(local_url, batch_type, workers=3)
+        # many small ranges, so the fixes around most depths are split between them
+        parallel.split_bytes = 2000
+        parallel.lead_in_bytes = 500
+        with open(path, 'rb') as f:
+            parallel.parse_file(f)
+
+        self.assertEqual(list(parallel.points), list(serial.points))
+        self.assertEqual((parallel.start_time, parallel.end_time), (serial.start_time, serial.end_time))
+        self.assertEqual((parallel.min_lat, parallel.max_lat, parallel.min_lon, parallel.max_lon),
+                         (serial.min_lat, serial.max_lat, serial.min_lon, serial.max_lon))
+
+    def test_parallel_nmea(self):
+        self.assertParallelMatches(NmeaUploader, 'test/data/NMEA.txt', 'simple depth')
+
+    def test_parallel_cidco(self):
+        self.assertParallelMatches(CidcoUploader, 'test/data/soundingExport.txt', 'cidco processed')
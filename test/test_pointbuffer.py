@@ -0,0 +1,39 @@
+import unittest
+from decimal import Decimal
+from datetime import datetime
+from dbinterfacer.helpers.pointmodel import Point_Model
+from dbinterfacer.helpers.pointbuffer import PointBuffer
+
+
+class TestPointBuffer(unittest.TestCase):
+    def setUp(self):
+        self.model = Point_Model([('time', 'datetime'), ('latitude', 'decimal'), ('depth', 'float')])
+        self.buffer = PointBuffer(self.model, chunk_size=2)
+        self.points = [
+            {'time': datetime(2017, 12, 11, 18, 37, 12, 68000), 'latitude': Decimal('47.3885332'), 'depth': 8.844},
+            {'time': datetime(2017, 12, 11, 18, 37, 13, 68000), 'latitude': Decimal('47.3885324'), 'depth': 8.8},
+            {'time': datetime(2017, 12, 11, 18, 37, 11), 'latitude': Decimal('47.389'), 'depth': 8.79, 'pr_extra': 1},
+        ]
+        self.buffer.extend(self.points)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.buffer), 3)
+        for p, stored in zip(self.points, self.buffer):
+            p.pop('pr_extra', None)
+            self.assertEqual(p, stored)
+            self.assertTrue(self.model.validate(stored))
+        self.assertEqual(self.buffer[-1]['latitude'], Decimal('47.389'))
+
+    def test_decimal_precision(self):
+        buffer = PointBuffer(self.model)
+        exact, long = Decimal('-53.1346797576033'), Decimal('47.38647009986666509462')
+        buffer.extend([dict(self.points[0], latitude=exact), dict(self.points[0], latitude=long)])
+        self.assertEqual(buffer[0]['latitude'], exact)
+        # past float64's precision
+        self.assertEqual(buffer[1]['latitude'], Decimal('47.38647009986666'))
+
+    def test_ranges(self):
+        ranges = self.buffer.ranges(['time', 'latitude'])
+        self.assertEqual(ranges['time'], [datetime(2017, 12, 11, 18, 37, 11), datetime(2017, 12, 11, 18, 37, 13, 68000)])
+        self.assertEqual(ranges['latitude'], [Decimal('47.3885324'), Decimal('47.389')])
+        self.assertEqual(PointBuffer(self.model).ranges(['time']), {'time': None})
@@ -0,0 +1,53 @@
+import pickle
+import unittest
+from decimal import Decimal
+from datetime import datetime
+from dbinterfacer.helpers.pointmodel import Point_Model, Rejections
+
+FIELDS = [('time', 'datetime'), ('depth', 'decimal')]
+TIME = datetime(2017, 12, 11)
+
+
+class TestPointModel(unittest.TestCase):
+    def test_validate(self):
+        m = Point_Model(FIELDS)
+        self.assertTrue(m.validate({'time': TIME, 'depth': Decimal(1)}))
+        self.assertTrue(m.validate({'time': TIME, 'depth': Decimal(1), 'pr_speed': 'x'}))
+        self.assertFalse(m.validate({'time': TIME, 'depth': 1.0}))
+        self.assertFalse(m.validate({'time': TIME}))
+        self.assertFalse(m.validate({'time': TIME, 'depth': Decimal(1), 'speed': 1}))
+        # the compiled validator is made again after unpickling
+        self.assertFalse(pickle.loads(pickle.dumps(m)).validate({'time': TIME}))
+
+    def test_check_reasons(self):
+        m = Point_Model(FIELDS)
+        self.assertIsNone(m.check({'time': TIME, 'depth': Decimal(1)}))
+        self.assertEqual(m.check({'time': TIME}), "missing field 'depth'")
+        self.assertEqual(m.check({'time': TIME, 'depth': None}), "field 'depth' is NoneType, expected Decimal")
+        self.assertEqual(m.check({'time': TIME, 'depth': Decimal(1), 'speed': 1}), "unexpected field 'speed'")
+
+    def test_validate_points(self):
+        m = Point_Model(FIELDS)
+        good = {'time': TIME, 'depth': Decimal(1)}
+        valid, rejected = m.validate_points([good, {'time': TIME}, good], first_row=10)
+        self.assertEqual(valid, [good, good])
+        self.assertEqual(rejected, [(11, "missing field 'depth'")])
+
+    def test_validate_columns(self):
+        m = Point_Model(FIELDS)
+        valid, rejected = m.validate_columns({'time': [TIME, TIME, None], 'depth': [Decimal(1), 2.0, Decimal(3)]})
+        self.assertEqual(valid, {'time': [TIME], 'depth': [Decimal(1)]})
+        self.assertEqual([row for row, reason in rejected], [1, 2])
+
+        valid, rejected = m.validate_columns({'time': [TIME]})
+        self.assertEqual(rejected, [(0, "missing field 'depth'")])
+
+    def test_rejections(self):
+        r = Rejections(keep=1)
+        r.extend([(3, 'a'), (5, 'b')])
+        other = Rejections()
+        other.add(0, 'a', count=4)
+        r.merge(other, row_offset=100)
+        self.assertEqual(len(r), 6)
+        self.assertEqual(r.counts, {'a': 5, 'b': 1})
+        self.assertEqual(r.examples, [(3, 'a')])
@@ -0,0 +1,102 @@
+import unittest
+import psycopg2
+from dbinterfacer import query
+from dbinterfacer.helpers import pool
+from dbinterfacer.helpers.pool import ConnectionPool
+from dbinterfacer.helpers.exceptions import PoolTimeoutException
+from .secret import local_url
+
+
+class FakeCursor():
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql_string, parameters=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.conn.executed.append(sql_string)
+
+    def close(self):
+        pass
+
+
+class FakeConnection():
+    def __init__(self, dsn):
+        self.closed = 0
+        self.broken = False
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool(unittest.TestCase):
+    def test_reuses_connections(self):
+        p = ConnectionPool('fake', min_size=1, max_size=2, connect=FakeConnection)
+        for _ in range(1000):
+            with p.connection() as conn:
+                conn.cursor().execute('SELECT 1')
+        self.assertEqual(p.opened, 1)
+        self.assertEqual(conn.commits, 1000)
+
+    def test_rolls_back_on_error(self):
+        p = ConnectionPool('fake', connect=FakeConnection)
+        with self.assertRaises(KeyError):
+            with p.connection() as conn:
+                raise KeyError()
+        self.assertEqual(conn.commits, 0)
+        self.assertGreater(conn.rollbacks, 0)
+        self.assertEqual(p.size(), 1)
+
+    def test_replaces_dead_connections(self):
+        p = ConnectionPool('fake', ping_after=0, connect=FakeConnection)
+        with p.connection() as first:
+            pass
+        first.broken = True
+        with p.connection() as second:
+            pass
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertEqual(p.opened, 2)
+        self.assertEqual(p.size(), 1)
+
+    def test_max_size(self):
+        p = ConnectionPool('fake', min_size=0, max_size=1, timeout=0.01, connect=FakeConnection)
+        conn = p.get()
+        with self.assertRaises(PoolTimeoutException):
+            p.get()
+        p.put(conn)
+        self.assertIs(p.get(), conn)
+
+
+class TestPooledQueries(unittest.TestCase):
+    def setUp(self):
+        # other tests may have left more connections in the pool
+        pool.close_all()
+
+    def count_connections(self):
+        conn = psycopg2.connect(dsn=local_url)
+        cur = conn.cursor()
+        cur.execute('SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()')
+        count = cur.fetchone()[0]
+        conn.close()
+        return count
+
+    def test_connection_count_stays_flat(self):
+        query.get_batch_list(local_url)
+        before = self.count_connections()
+        for i in range(1000):
+            query.get_batch_list(local_url, ['batches.id = %d' % i])
+        self.assertEqual(self.count_connections(), before)
+        self.assertEqual(pool.get_pool(local_url).opened, 1)
@@ -0,0 +1,65 @@
+import unittest
+import psycopg2
+from dbinterfacer import query
+from dbinterfacer.helpers import prepared
+from dbinterfacer.helpers.prepared import StatementCache, to_dollar_placeholders
+from .secret import local_url
+
+
+class TestQueryBuilders(unittest.TestCase):
+    def test_fragments(self):
+        radius = query.where_point_within_range((-53.1, 47.4), 2000)
+        poly = query.where_point_in_poly([(-50, 45), (-55, 45), (-50, 45)])
+        self.assertEqual(radius.params, (-53.1, 47.4, 2000))
+        self.assertEqual(poly.params, ('LINESTRING(-50 45,-55 45,-50 45)',))
+
+        select = query.get_select_string(['depth'], ['batch_type_1'], [poly, 'depth > 15', radius])
+        self.assertEqual(select.count('%s'), 4)
+        self.assertEqual(select.params, poly.params + radius.params)
+        # shapes don't change with the coordinates
+        self.assertEqual(select, query.get_select_string(
+            ['depth'], ['batch_type_1'], [query.where_point_in_poly([(0, 0), (1, 1), (0, 0)]), 'depth > 15',
+                                           query.where_point_within_range((0, 0), 1)]))
+
+    def test_dollar_placeholders(self):
+        self.assertEqual(to_dollar_placeholders("SELECT %s, '%%', %s"), ("SELECT $1, '%', $2", 2))
+
+
+class TestPreparedStatements(unittest.TestCase):
+    def setUp(self):
+        self.conn = psycopg2.connect(dsn=local_url)
+        self.cur = self.conn.cursor()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_prepared_after_threshold(self):
+        statements = StatementCache(threshold=2, max_statements=1)
+        for i in range(4):
+            statements.execute(self.cur, 'SELECT %s::int + %s', (i, 1))
+            self.assertEqual(self.cur.fetchall(), [(i + 1,)])
+        name = statements.names['SELECT %s::int + %s']
+        self.cur.execute('SELECT statement FROM pg_prepared_statements WHERE name = %s', (name,))
+        self.assertEqual(self.cur.fetchall(), [('PREPARE %s AS SELECT $1::int + $2' % name,)])
+
+        # past max_statements the old one is deallocated
+        statements.execute(self.cur, 'SELECT 1', None)
+        statements.execute(self.cur, 'SELECT 1', None)
+        self.cur.execute('SELECT count(*) FROM pg_prepared_statements')
+        self.assertEqual(self.cur.fetchall(), [(1,)])
+
+    def test_unpreparable(self):
+        statements = StatementCache(threshold=1, max_statements=10)
+        statements.execute(self.cur, 'SELECT %s IS NULL', (None,))
+        self.assertEqual(self.cur.fetchall(), [(True,)])
+        self.assertIsNone(statements.names['SELECT %s IS NULL'])
+        # the transaction is still usable
+        statements.execute(self.cur, 'SELECT %s IS NULL', (1,))
+        self.assertEqual(self.cur.fetchall(), [(False,)])
+
+    def test_query_uses_prepared(self):
+        for i in range(prepared.DEFAULTS['threshold'] + 1):
+            rows, _ = query.query(local_url, query.SqlFragment('SELECT %s::int * 2', [i]))
+            self.assertEqual(rows, [(i * 2,)])
+        rows, _ = query.query(local_url, "SELECT count(*) FROM pg_prepared_statements WHERE statement LIKE '%$1::int * 2'")
+        self.assertEqual(rows, [(1,)])
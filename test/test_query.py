@@ -0,0 +1,167 @@
+import io
+import os
+import tempfile
+import unittest
+from dbinterfacer import query
+from dbinterfacer.helpers.pool import connection
+from .secret import local_url
+
+try:
+    import numpy
+    from dbinterfacer.helpers import copyexport
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SERIES = "SELECT g AS id, g / 4.0 AS depth, timestamp '2017-12-11' + g * interval '1 second' AS time FROM generate_series(1, %s) g"
+
+
+class TestStreamingQueries(unittest.TestCase):
+    def test_iter_rows(self):
+        rows, _ = query.query(local_url, SERIES, (2500,))
+        self.assertEqual(list(query.iter_rows(local_url, SERIES, (2500,), itersize=1000)), rows)
+
+    def test_iter_row_blocks(self):
+        blocks = list(query.iter_row_blocks(local_url, SERIES, (2500,), block_size=1000))
+        self.assertEqual(list(map(len, blocks)), [1000, 1000, 500])
+        self.assertEqual(blocks[2][-1][0], 2500)
+
+    @unittest.skipIf(numpy is None, 'needs numpy')
+    def test_iter_arrays(self):
+        arrays = list(query.iter_arrays(local_url, SERIES, (2500,), block_size=1000))
+        self.assertEqual(list(map(len, arrays)), [1000, 1000, 500])
+        self.assertEqual(arrays[0].dtype.names, ('id', 'depth', 'time'))
+        self.assertEqual(arrays[2]['depth'][-1], 625.0)
+        self.assertEqual(str(arrays[0]['time'][0]), '2017-12-11T00:00:01.000000')
+
+    @unittest.skipIf(numpy is None, 'needs numpy')
+    def test_iter_arrays_nulls(self):
+        nulls = "SELECT g AS id, CASE WHEN g %% 3 = 0 THEN NULL ELSE g END AS maybe, g %% 2 = 0 AS even " \
+                "FROM generate_series(1, %s) g"
+        arrays = list(query.iter_arrays(local_url, nulls, (5,)))
+        self.assertEqual(str(arrays[0]['maybe'].dtype), 'int32')
+        self.assertEqual(arrays[0]['maybe'].tolist(), [1, 2, None, 4, 5])
+        self.assertEqual(arrays[0]['id'].tolist(), [1, 2, 3, 4, 5])
+        # blocks without NULLs are plain arrays
+        plain = list(query.iter_arrays(local_url, nulls, (5,), block_size=2))
+        self.assertNotIsInstance(plain[0], numpy.ma.MaskedArray)
+        self.assertIsInstance(plain[1], numpy.ma.MaskedArray)
+
+    def test_select_string(self):
+        select = query.get_select_string(['batches.id'], ['batches'], ['batches.id > %s'])
+        rows, _ = query.query(local_url, select, (0,))
+        self.assertEqual(list(query.iter_rows(local_url, select, (0,), itersize=2)), rows)
+
+    def test_fragment_parameters(self):
+        select = query.get_select_string(['batches.id'], ['batches'], [query.SqlFragment('batches.id > %s', [0])])
+        rows, _ = query.query(local_url, select)
+        self.assertEqual(list(query.iter_rows(local_url, select, itersize=2)), rows)
+        # the fragment's parameter would be dropped
+        self.assertRaises(ValueError, query.query, local_url, select + ' AND batches.id < %s', (10,))
+        bounded = select + query.SqlFragment(' AND batches.id < %s', [10 ** 9])
+        self.assertEqual(bounded.params, (0, 10 ** 9))
+        self.assertEqual(query.query(local_url, 'SELECT * FROM (' + bounded + ') b')[0], rows)
+
+    def test_copy_query(self):
+        out = io.StringIO()
+        self.assertEqual(query.copy_query(local_url, SERIES, out, (3,), header=True), 3)
+        self.assertEqual(out.getvalue().splitlines()[:2], ['id,depth,time', '1,0.25000000000000000000,2017-12-11 00:00:01'])
+        self.assertRaises(ValueError, query.copy_query, local_url, SERIES, out, (3,), format='json')
+
+
+NULLS = ("SELECT g AS id, g / 4.0 AS depth, CASE WHEN g %% 3 = 0 THEN NULL ELSE g * 0.5 END AS maybe, "
+         "'p' || g AS name, date '2020-01-01' + g AS day FROM generate_series(1, %s) g")
+
+
+@unittest.skipIf(numpy is None, 'needs numpy')
+class TestColumnarExport(unittest.TestCase):
+    def test_iter_columns(self):
+        blocks = list(query.iter_columns(local_url, SERIES, (2500,), block_size=1000))
+        self.assertEqual([len(b['id']) for b in blocks], [1000, 1000, 500])
+        self.assertEqual([str(blocks[0][c].dtype) for c in ('id', 'depth', 'time')],
+                         ['int32', 'float64', 'datetime64[us]'])
+        self.assertEqual(blocks[2]['depth'][-1], 625.0)
+        self.assertEqual(str(blocks[0]['time'][0]), '2017-12-11T00:00:01.000000')
+
+    def test_nulls_and_text(self):
+        rows, header = query.query(local_url, NULLS, (100,))
+        columns = query.query_columns(local_url, NULLS, (100,))
+        self.assertEqual(list(columns), header)
+        self.assertEqual(columns['maybe'].mask.sum(), 33)
+        self.assertEqual([None if v is None else float(v) for v in columns['maybe'].tolist()],
+                         [None if r[2] is None else float(r[2]) for r in rows])
+        self.assertEqual(list(columns['name']), [r[3] for r in rows])
+        self.assertEqual(columns['day'].tolist(), [r[4] for r in rows])
+
+    def test_decoder_fed_in_pieces(self):
+        # every row split across feeds, decoded a few bytes at a time
+        original = copyexport.PARSE_BYTES
+        copyexport.PARSE_BYTES = 7
+        self.addCleanup(setattr, copyexport, 'PARSE_BYTES', original)
+        with connection(local_url) as conn:
+            cur = conn.cursor()
+            select = cur.mogrify(NULLS, (50,)).decode()
+            columns = copyexport.describe(cur, select)
+            data = io.BytesIO()
+            cur.copy_expert(copyexport.copy_statement(select, columns), data)
+        decoder = copyexport.CopyDecoder(columns)
+        blocks = []
+        for i in range(0, len(data.getvalue()), 5):
+            decoder.feed(data.getvalue()[i:i + 5])
+            blocks.append(decoder.take(20))
+        blocks.append(decoder.take(20, final=True))
+        blocks = [b for b in blocks if b is not None]
+        self.assertEqual([len(b['id']) for b in blocks], [20, 20, 10])
+        self.assertEqual([b['maybe'].mask.sum() for b in blocks], [6, 7, 3])
+        self.assertEqual(blocks[2]['name'][-1], 'p50')
+
+    def test_stopping_early(self):
+        blocks = query.iter_columns(local_url, SERIES, (10 ** 6,), block_size=1000)
+        self.assertEqual(len(next(blocks)['id']), 1000)
+        blocks.close()
+        self.assertEqual(query.query(local_url, 'SELECT 1')[0], [(1,)])
+
+    @unittest.skipIf(pyarrow is None, 'needs pyarrow')
+    def test_export_parquet(self):
+        path = os.path.join(tempfile.mkdtemp(), 'series.parquet')
+        self.addCleanup(os.remove, path)
+        self.assertEqual(query.export_parquet(local_url, NULLS, path, (2500,), block_size=1000), 2500)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.num_rows, 2500)
+        self.assertEqual(table.column('maybe').null_count, 833)
+        self.assertEqual(pyarrow.parquet.ParquetFile(path).metadata.num_row_groups, 3)
+
+
+class TestJoinGraph(unittest.TestCase):
+    def test_direct_join(self):
+        tables = ['batches', 'batch_files']
+        self.assertEqual(query.get_select_string(['batches.id'], tables, ['batches.id > 1']),
+                         ' SELECT batches.id FROM batches,batch_files WHERE batch_files.batch_id = batches.id and batches.id > 1')
+        self.assertEqual(tables, ['batches', 'batch_files'])
+        self.assertEqual(query.get_select_string(['a'], ['points'], []), ' SELECT a FROM points ')
+
+    def test_join_through_batch_files(self):
+        select = query.get_select_string(['batches.id', 'django.user_user.id'], ['batches', 'django.user_user'], [])
+        self.assertEqual(select, ' SELECT batches.id,django.user_user.id '
+                         'FROM batches,django.user_user,batch_files,django.upload_file,django.upload_upload '
+                         'WHERE batch_files.batch_id = batches.id and batch_files.file_id = django.upload_file.id '
+                         'and django.upload_file.upload_id = django.upload_upload.id '
+                         'and django.upload_upload.user_id = django.user_user.id')
+
+    def test_join_through_upload_upload(self):
+        tables, joins = query.join_path(['batch_type_1', 'django.user_sensor', 'django.user_user'])
+        self.assertEqual(tables, ['batch_files', 'batch_type_1', 'batches', 'django.upload_file', 'django.upload_upload',
+                                  'django.upload_upload_sensors', 'django.user_sensor', 'django.user_user'])
+        # a tree: one join fewer than tables
+        self.assertEqual(len(joins), len(tables) - 1)
+        self.assertIn('django.upload_upload.id = django.upload_upload_sensors.upload_id', joins)
+
+    def test_skeleton_memoized(self):
+        query.select_skeleton.cache_clear()
+        for i in range(3):
+            query.get_select_string(['batches.id'], ['batches', 'lookup_field_types'], ['batches.id = %d' % i])
+        self.assertEqual(query.select_skeleton.cache_info().hits, 2)
@@ -0,0 +1,103 @@
+import unittest
+from dbinterfacer import query
+from dbinterfacer.helpers import querycache
+from dbinterfacer.helpers.querycache import QueryCache, normalize_sql
+from dbinterfacer.uploaders import CidcoUploader
+from .secret import local_url
+
+HALIFAX = (-64.0, 44.0, -63.0, 45.0)
+NEWFOUNDLAND = (-54.0, 47.0, -52.0, 48.0)
+
+
+class Runner():
+    def __init__(self, rows=1):
+        self.runs = 0
+        self.rows = rows
+
+    def __call__(self):
+        self.runs += 1
+        return [(self.runs,)] * self.rows, ['run']
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.time = 0
+        self.cache = QueryCache(max_entries=2, max_rows=10, ttl=60, clock=lambda: self.time)
+
+    def fetch(self, sql_string, extent=None, run=None):
+        return self.cache.fetch('db', sql_string, None, extent, run or Runner())
+
+    def test_normalized_key(self):
+        self.assertEqual(normalize_sql(' SELECT  a\n FROM b '), 'SELECT a FROM b')
+        self.assertEqual(normalize_sql("SELECT 'a  b',  c"), "SELECT 'a  b', c")
+        self.assertEqual(self.cache.key('db', 'SELECT %s', [1, [2, 3]]), ('db', 'SELECT %s', (1, (2, 3))))
+
+    def test_hits_and_ttl(self):
+        run = Runner()
+        self.assertEqual(self.fetch('SELECT 1', run=run), ([(1,)], ['run']))
+        self.assertEqual(self.fetch('SELECT  1', run=run), ([(1,)], ['run']))
+        self.time = 60
+        self.assertEqual(self.fetch('SELECT 1', run=run), ([(2,)], ['run']))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_lru_and_size_bounds(self):
+        run = Runner()
+        self.fetch('a', run=run)
+        self.fetch('b')
+        self.fetch('a', run=run)
+        self.fetch('c')
+        # b was the least recently used
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.assertEqual(self.fetch('a', run=run)[0], [(1,)])
+
+        # a is evicted to make room
+        self.fetch('big', run=Runner(rows=9))
+        self.assertEqual(self.cache.stats()['rows'], 10)
+        self.fetch('too big', run=Runner(rows=11))
+        self.assertEqual(self.cache.stats()['rows'], 10)
+
+    def test_bbox_invalidation(self):
+        run = Runner()
+        self.cache.max_entries = 10
+        self.fetch('halifax', HALIFAX, run)
+        self.fetch('newfoundland', NEWFOUNDLAND)
+        self.fetch('everywhere')
+        self.cache.invalidate('db', (-53.5, 47.5, -53.0, 47.6))
+        self.assertEqual(self.cache.stats()['invalidations'], 2)
+        self.assertEqual(self.fetch('halifax', HALIFAX, run)[0], [(1,)])
+
+    def test_result_from_before_invalidate_not_kept(self):
+        def run():
+            self.cache.invalidate('db')
+            return [], []
+        self.fetch('a', run=run)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_range_extent(self):
+        min_lon, min_lat, max_lon, max_lat = query.range_extent((-53.13, 47.4), 2000)
+        self.assertTrue(min_lat < 47.382 and max_lat > 47.418)
+        self.assertTrue(min_lon < -53.156 and max_lon > -53.104)
+        self.assertEqual(query.range_extent((0, 89.99), 5000)[0::2], (-180.0, 180.0))
+
+
+class TestCachedQueries(unittest.TestCase):
+    def test_upload_invalidates_batch_list(self):
+        querycache.cache.clear()
+        batches, _ = query.get_batch_list(local_url, cached=True)
+        elsewhere = query.get_batch_list(local_url, ['batches.id > %d' % max(b[2] for b in batches)],
+                                         cached=True, extent=HALIFAX)
+        hits = querycache.cache.hits
+        self.assertEqual(query.get_batch_list(local_url, cached=True), (batches, ['start_time', 'end_time', 'id']))
+        self.assertEqual(querycache.cache.hits, hits + 1)
+
+        u = CidcoUploader(local_url, 'cidco processed')
+        u.parse_file('test/data/soundingExport.txt')
+        batch_id = u.upload([])
+
+        self.assertIn(batch_id, [b[2] for b in query.get_batch_list(local_url, cached=True)[0]])
+        # the new batch isn't near Halifax, so that one is still cached
+        hits = querycache.cache.hits
+        self.assertEqual(query.get_batch_list(local_url, ['batches.id > %d' % max(b[2] for b in batches)],
+                                              cached=True, extent=HALIFAX), elsewhere)
+        self.assertEqual(querycache.cache.hits, hits + 1)
@@ -0,0 +1,44 @@
+import io
+import unittest
+from dbinterfacer.helpers import sourcefile
+
+PATH = 'test/data/soundingExport.txt'
+
+
+class TestSourceFile(unittest.TestCase):
+    def assertBlocksOfLines(self, file, data):
+        blocks = [bytes(b) for b in sourcefile.iter_blocks(file, block_size=100)]
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(b''.join(blocks), data)
+        for b in blocks[:-1]:
+            self.assertTrue(b.endswith(b'\n'))
+
+    def test_mapped_blocks(self):
+        with open(PATH, 'rb') as f:
+            data = f.read()
+            f.seek(0)
+            self.assertIsNotNone(sourcefile.map_file(f))
+            self.assertBlocksOfLines(f, data)
+
+    def test_stream_blocks(self):
+        with open(PATH, 'rb') as f:
+            data = f.read()
+        stream = io.BytesIO(data)
+        self.assertIsNone(sourcefile.map_file(stream))
+        self.assertBlocksOfLines(stream, data)
+
+    def test_blocks_up_to_end(self):
+        with open(PATH, 'rb') as f:
+            data = f.read()
+            end = data.index(b'\n', 1000) + 1
+            f.seek(0)
+            mapped = b''.join(map(bytes, sourcefile.iter_blocks(f, block_size=100, end=end)))
+        read = b''.join(sourcefile.iter_blocks(io.BytesIO(data), block_size=100, end=end))
+        self.assertEqual(mapped, data[:end])
+        self.assertEqual(read, data[:end])
+
+    def test_lines(self):
+        with open(PATH, 'rb') as f:
+            lines = f.readlines()
+            f.seek(0)
+            self.assertEqual(list(sourcefile.iter_lines(f, block_size=100)), lines)
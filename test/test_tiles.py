@@ -0,0 +1,72 @@
+import unittest
+from dbinterfacer import query
+from dbinterfacer.helpers import querycache, tiles
+from dbinterfacer.helpers.tiles import TileCache
+from .secret import local_url
+
+
+class TestTileMath(unittest.TestCase):
+    def test_bounds(self):
+        half = tiles.MERCATOR_HALF_WIDTH
+        self.assertEqual(tiles.tile_bounds(0, 0, 0), (-half, -half, half, half))
+        self.assertEqual(tiles.tile_bounds(1, 1, 0), (0.0, 0.0, half, half))
+        self.assertRaises(ValueError, tiles.tile_bounds, 1, 2, 0)
+
+    def test_extent(self):
+        min_lon, min_lat, max_lon, max_lat = tiles.tile_extent(1, 0, 1)
+        self.assertEqual((min_lon, max_lon, max_lat), (-180.0, 0.0, 0.0))
+        self.assertAlmostEqual(min_lat, -85.0511, places=4)
+
+    def test_sql_parameters(self):
+        sql, params = tiles.bins_sql('batch_type_1', 10, 300, 360, batch_ids={3, 1})
+        self.assertEqual(sql.count('%s'), len(params))
+        self.assertEqual(params[-1], [1, 3])
+        # a 64 x 64 grid, centred in the cells
+        min_x, min_y, max_x, max_y = tiles.tile_bounds(10, 300, 360)
+        self.assertAlmostEqual(params[2] * 64, max_x - min_x)
+        self.assertAlmostEqual(params[0], min_x + params[2] / 2)
+
+        sql, params = tiles.mvt_sql('django.points', 10, 300, 360)
+        self.assertEqual(sql.count('%s'), len(params))
+        self.assertIn('"django"."points"', sql)
+
+
+class TestTileCache(unittest.TestCase):
+    def test_keyed_by_tile_and_batches(self):
+        cache = TileCache()
+        runs = []
+
+        def run():
+            runs.append(1)
+            return [(len(runs),)], ['n']
+
+        for batch_ids in ([1, 2], (2, 1), None):
+            cache.fetch_tile('db', 'bins', 'batch_type_1', 3, 2, 2, batch_ids, 64, run)
+        self.assertEqual(len(runs), 2)
+
+    def test_upload_drops_tiles_under_it(self):
+        querycache.caches.remove(tiles.cache)
+        cache = TileCache()
+        querycache.caches.append(cache)
+        self.addCleanup(querycache.caches.remove, cache)
+        self.addCleanup(querycache.caches.append, tiles.cache)
+
+        # z 2 tiles of the western hemisphere, Newfoundland in the northern one
+        cache.fetch_tile('db', 'bins', 'batch_type_1', 2, 1, 1, None, 64, lambda: ([], []))
+        cache.fetch_tile('db', 'bins', 'batch_type_1', 2, 1, 2, None, 64, lambda: ([], []))
+        querycache.invalidate('db', (-54.0, 47.0, -52.0, 48.0))
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+
+class TestDepthTiles(unittest.TestCase):
+    def setUp(self):
+        rows, _ = query.query(local_url, "SELECT count(*) FROM pg_proc WHERE proname = 'st_asmvt'")
+        if not rows[0][0]:
+            self.skipTest('needs PostGIS')
+
+    def test_bounded_tile(self):
+        rows, header = query.get_depth_tile(local_url, 'simple depth', 0, 0, 0, cells_per_side=4, cached=False)
+        self.assertEqual(header, ['lon', 'lat', 'n', 'min_depth', 'mean_depth', 'max_depth'])
+        self.assertLessEqual(len(rows), 16)
+        self.assertIsInstance(query.get_depth_mvt(local_url, 'simple depth', 0, 0, 0, cells_per_side=4), bytes)
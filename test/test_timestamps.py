@@ -0,0 +1,64 @@
+import json
+import unittest
+from datetime import datetime
+from dbinterfacer.helpers import timestamps
+from dbinterfacer.helpers.timestamps import ISO_8601_FORMAT, CIDCO_FORMAT, TIME_OF_DAY_FORMAT
+
+
+def strptime_micros(raw, layout):
+    return timestamps.to_micros(datetime.strptime(raw.decode('ascii'), layout))
+
+
+def time_of_day_micros(raw):
+    time = datetime.strptime(raw.decode('ascii'), TIME_OF_DAY_FORMAT)
+    return ((time.hour * 60 + time.minute) * 60 + time.second) * 10 ** 6 + time.microsecond
+
+
+class TestTimestamps(unittest.TestCase):
+    def assertSameResult(self, parse, expected, value):
+        try:
+            result = expected(value)
+        except ValueError:
+            self.assertRaises(ValueError, parse, value)
+        else:
+            self.assertEqual(parse(value), result)
+
+    def test_iso8601_matches_strptime(self):
+        for text in ['2016-07-21T10:03:31.000Z', '2016-07-21T10:03:31.5Z', '2016-12-31T23:59:59.999999Z',
+                     '2016-7-21T10:03:31.000Z', '2016-07-21T10:03:31.000+00', '2016-13-21T10:03:31.000Z',
+                     '2016-07-21T10:60:31.000Z', '2016-07-21T1 :03:31.000Z', '2016-07-21T10:03:31.1234567Z',
+                     '2017-12-11T18:37:12.Z']:
+            self.assertSameResult(timestamps.parse_iso8601, lambda t: datetime.strptime(t, ISO_8601_FORMAT), text)
+
+    def test_cidco_matches_strptime(self):
+        for raw in [b'2017/12/11 18:37:12.068', b'2017/12/11 18:37:12.5', b'2017/2/11 18:37:12.068',
+                    b'2017/12/11 18:37:60.068', b'2017/12/11 18:37:12', b'2017/13/11 18:37:12.068',
+                    b'2017/12/11 18:37:1.0689', b'2017/12/11 18:37:+1.068', b'2017/12/11 18:37:12.']:
+            self.assertSameResult(timestamps.cidco_micros, lambda r: strptime_micros(r, CIDCO_FORMAT), raw)
+
+    def test_cidco_column(self):
+        for column in [[b'2017/12/11 18:37:12.068', b'2017/12/11 18:37:13.068', b'2017/12/12 00:00:00.001'],
+                       [b'2017/12/11 18:37:12.068', b'2017/12/11 18:37:13.5'],
+                       [b'2017/12/11 18:37:12.068', b'2017/2/11 18:37:13.068']]:
+            expected = [strptime_micros(r, CIDCO_FORMAT) for r in column]
+            self.assertEqual(list(timestamps.cidco_column_micros(column)), expected)
+        self.assertRaises(ValueError, timestamps.cidco_column_micros, [b'2017/12/11 18:37:12.068', b'2017/12/11 18:37:61.068'])
+        self.assertRaises(ValueError, timestamps.cidco_column_micros, [b'2017/12/11 18:37:12.', b'2017/12/11 18:37:13.'])
+
+    def test_time_of_day_matches_strptime(self):
+        for raw in [b'18:37:07.068', b'00:00:00.000001', b'23:59:59.9', b'24:00:00.000', b'18:37:07',
+                    b'8:37:07.068', b'18:37:07.0680001', b'18:37:07.']:
+            self.assertSameResult(timestamps.time_of_day, time_of_day_micros, raw)
+
+    def test_fixtures_match_strptime(self):
+        with open('test/data/soundingExport.txt', 'rb') as f:
+            column = [line.split(b';')[0] for line in f.read().splitlines()[2:]]
+        self.assertEqual(list(timestamps.cidco_column_micros(column)), [strptime_micros(r, CIDCO_FORMAT) for r in column])
+
+        with open('test/data/NMEA.txt', 'rb') as f:
+            times = [line.split(b' ')[0] for line in f if b' ' in line]
+        self.assertEqual([timestamps.time_of_day(t) for t in times], [time_of_day_micros(t) for t in times])
+
+        with open('test/data/geojson_small.json') as f:
+            texts = [feature['properties']['time'] for feature in json.load(f)['features']]
+        self.assertEqual([timestamps.parse_iso8601(t) for t in texts], [datetime.strptime(t, ISO_8601_FORMAT) for t in texts])
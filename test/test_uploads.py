@@ -0,0 +1,117 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import psycopg2
+from dbinterfacer import query
+from dbinterfacer.uploaders import CidcoUploader, NmeaUploader
+from dbinterfacer.helpers.copystream import ChunkStream
+from .secret import local_url
+
+
+class TestChunkStream(unittest.TestCase):
+    def test_read_across_chunks(self):
+        s = ChunkStream(iter(['ab\n', '', 'cd\nef', '\n']))
+        self.assertEqual(s.read(2), 'ab')
+        self.assertEqual(s.readline(), '\n')
+        self.assertEqual(s.read(4), 'cd\ne')
+        self.assertEqual(s.read(), 'f\n')
+        self.assertEqual(s.read(), '')
+
+
+class TestUploading(unittest.TestCase):
+    def count_points(self, table, batch_id):
+        conn = psycopg2.connect(dsn=local_url)
+        cur = conn.cursor()
+        cur.execute('SELECT count(*) FROM {} WHERE batch_id = %s'.format(table), (batch_id,))
+        count = cur.fetchone()[0]
+        conn.close()
+        return count
+
+    def selected_points(self, table, batch_id):
+        """
+        The points of the batch a get_select_string query sees
+        """
+        select = query.get_select_string(['count(*)'], [table],
+                                         [query.SqlFragment(table + '.batch_id = %s', [batch_id])])
+        return query.query(local_url, select)[0][0][0]
+
+    def get_points(self, table, batch_id):
+        conn = psycopg2.connect(dsn=local_url)
+        cur = conn.cursor()
+        cur.execute('SELECT time, latitude, longitude, depth FROM {} WHERE batch_id = %s ORDER BY time'.format(table), (batch_id,))
+        rows = cur.fetchall()
+        conn.close()
+        return rows
+
+    def test_stream_upload_cidco(self):
+        f = open('test/data/soundingExport.txt', 'rb')
+        u = CidcoUploader(local_url, 'cidco processed', chunk_size=100)
+        batch_id = u.stream_upload(f, [])
+        f.close()
+
+        self.assertEqual(len(u.points), 0)
+        self.assertEqual(self.count_points(u.ref_table, batch_id), 883)
+
+        self.assertAlmostEqual(float(u.max_lon), -53.1323084)
+        self.assertAlmostEqual(float(u.min_lon), -53.1346818)
+        self.assertAlmostEqual(float(u.max_lat), 47.3900793)
+        self.assertAlmostEqual(float(u.min_lat), 47.3864477)
+
+    def test_binary_upload_cidco(self):
+        batch_ids = []
+        for copy_format in ('text', 'binary'):
+            f = open('test/data/soundingExport.txt', 'rb')
+            u = CidcoUploader(local_url, 'cidco processed', copy_format=copy_format)
+            u.parse_file(f)
+            f.close()
+            batch_ids.append(u.upload([]))
+
+        text_points, binary_points = [self.get_points(u.ref_table, b) for b in batch_ids]
+        self.assertEqual(len(binary_points), 883)
+        self.assertEqual(text_points, binary_points)
+
+    def test_chunked_upload_resumes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'upload.json')
+
+        expected = NmeaUploader(local_url, 'simple depth')
+        expected_id = expected.stream_upload('test/data/NMEA.txt', [])
+
+        # the connection drops during the third commit
+        u = NmeaUploader(local_url, 'simple depth', chunk_size=100)
+        copy_points = u.copy_points
+        calls = []
+        def failing_copy(*args):
+            calls.append(1)
+            if len(calls) == 3:
+                raise psycopg2.OperationalError('server closed the connection unexpectedly')
+            return copy_points(*args)
+        u.copy_points = failing_copy
+        with self.assertRaises(psycopg2.OperationalError):
+            u.chunked_upload('test/data/NMEA.txt', [], path, commit_size=200)
+
+        with open(path) as f:
+            state = json.load(f)
+        batch_id = state['batch_id']
+        self.assertEqual(state['points_committed'], 400)
+        self.assertEqual(self.count_points(u.ref_table, batch_id), 400)
+        # readers don't see the half loaded batch, or its points
+        self.assertNotIn(batch_id, [b[2] for b in query.get_batch_list(local_url)[0]])
+        self.assertEqual(self.selected_points(u.ref_table, batch_id), 0)
+
+        # as if it had crashed between the second commit and its checkpoint, and resumed with other chunks
+        state['points_committed'] = 200
+        with open(path, 'w') as f:
+            json.dump(state, f)
+        u = NmeaUploader(local_url, 'simple depth', chunk_size=150)
+        self.assertEqual(u.chunked_upload('test/data/NMEA.txt', [], path, commit_size=200), batch_id)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(sorted(self.get_points(u.ref_table, batch_id)), sorted(self.get_points(u.ref_table, expected_id)))
+        self.assertEqual((u.start_time, u.end_time, u.min_lon, u.max_lat),
+                         (expected.start_time, expected.end_time, expected.min_lon, expected.max_lat))
+        self.assertIn(batch_id, [b[2] for b in query.get_batch_list(local_url)[0]])
+        self.assertEqual(self.selected_points(u.ref_table, batch_id), 980)